@@ -19,6 +19,7 @@ from app.models.user import User
 from app.models.store import Store
 from app.models.product import Product
 from app.models.sale import Sale, SaleItem
+from app.models.learned_alias import LearnedAlias
 
 # Configuración de Alembic
 config = context.config
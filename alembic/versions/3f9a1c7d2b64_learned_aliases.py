@@ -0,0 +1,42 @@
+"""Learned aliases
+
+Revision ID: 3f9a1c7d2b64
+Revises: e0d527222131
+Create Date: 2026-10-16 10:12:40.512384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c7d2b64'
+down_revision: Union[str, None] = 'e0d527222131'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('learned_aliases',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('store_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('query', sa.String(length=200), nullable=False),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['store_id'], ['stores.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('store_id', 'query', name='uq_learned_aliases_store_query')
+    )
+    op.create_index(op.f('ix_learned_aliases_id'), 'learned_aliases', ['id'], unique=False)
+    op.create_index(op.f('ix_learned_aliases_store_id'), 'learned_aliases', ['store_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_learned_aliases_store_id'), table_name='learned_aliases')
+    op.drop_index(op.f('ix_learned_aliases_id'), table_name='learned_aliases')
+    op.drop_table('learned_aliases')
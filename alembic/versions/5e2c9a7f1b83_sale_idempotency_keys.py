@@ -0,0 +1,37 @@
+"""Sale idempotency keys
+
+Revision ID: 5e2c9a7f1b83
+Revises: d3a8f61b4c07
+Create Date: 2026-10-16 23:52:16.904127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2c9a7f1b83'
+down_revision: Union[str, None] = 'd3a8f61b4c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('sale_idempotency_keys',
+    sa.Column('store_id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=100), nullable=False),
+    sa.Column('sale_id', sa.Integer(), nullable=False),
+    sa.Column('request_hash', sa.String(length=64), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['sale_id'], ['sales.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['store_id'], ['stores.id'], ),
+    sa.PrimaryKeyConstraint('store_id', 'key')
+    )
+    op.create_index(op.f('ix_sale_idempotency_keys_created_at'), 'sale_idempotency_keys', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_sale_idempotency_keys_created_at'), table_name='sale_idempotency_keys')
+    op.drop_table('sale_idempotency_keys')
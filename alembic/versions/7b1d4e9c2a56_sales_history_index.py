@@ -0,0 +1,26 @@
+"""Sales history index
+
+Revision ID: 7b1d4e9c2a56
+Revises: 5e2c9a7f1b83
+Create Date: 2026-10-17 00:31:08.215493
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1d4e9c2a56'
+down_revision: Union[str, None] = '5e2c9a7f1b83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_sales_store_date_id', 'sales', ['store_id', 'sale_date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sales_store_date_id', table_name='sales')
@@ -0,0 +1,50 @@
+"""Product trigram search
+
+Revision ID: 8c41d2e7a9b3
+Revises: 3f9a1c7d2b64
+Create Date: 2026-10-16 22:05:18.204771
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41d2e7a9b3'
+down_revision: Union[str, None] = '3f9a1c7d2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # array_to_string no es IMMUTABLE, así que no sirve directo en un índice;
+    # los aliases se indexan como un solo texto en minúsculas
+    op.execute("""
+        CREATE OR REPLACE FUNCTION products_aliases_text(character varying[])
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT lower(coalesce(array_to_string($1, ' '), '')) $$
+    """)
+
+    op.create_index(
+        'ix_products_name_trgm',
+        'products',
+        [sa.text('lower(name) gin_trgm_ops')],
+        postgresql_using='gin'
+    )
+    op.create_index(
+        'ix_products_aliases_trgm',
+        'products',
+        [sa.text('products_aliases_text(aliases) gin_trgm_ops')],
+        postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_aliases_trgm', table_name='products')
+    op.drop_index('ix_products_name_trgm', table_name='products')
+    op.execute("DROP FUNCTION IF EXISTS products_aliases_text(character varying[])")
@@ -0,0 +1,74 @@
+"""Learned alias search keys
+
+Revision ID: a6f2c8e41d97
+Revises: 7b1d4e9c2a56
+Create Date: 2026-10-16 23:58:12.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.text import search_key
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6f2c8e41d97'
+down_revision: Union[str, None] = '7b1d4e9c2a56'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Los queries aprendidos pasan a guardarse con la misma clave que usa el
+    # índice de productos (sin tildes y en singular). Si dos filas de una
+    # tienda quedan con la misma clave se conserva la usada más recientemente.
+    conn = op.get_bind()
+    aliases = sa.table(
+        'learned_aliases',
+        sa.column('id', sa.Integer),
+        sa.column('store_id', sa.Integer),
+        sa.column('query', sa.String),
+        sa.column('hits', sa.Integer),
+        sa.column('last_used_at', sa.DateTime(timezone=True)),
+    )
+    rows = conn.execute(
+        sa.select(aliases.c.id, aliases.c.store_id, aliases.c.query)
+        .order_by(
+            aliases.c.last_used_at.desc().nulls_last(),
+            aliases.c.hits.desc(),
+            aliases.c.id.desc()
+        )
+    ).all()
+
+    keep = {}
+    duplicates = []
+    for row in rows:
+        key = (row.store_id, search_key(row.query))
+        if key in keep:
+            duplicates.append(row.id)
+        else:
+            keep[key] = row
+
+    if duplicates:
+        conn.execute(aliases.delete().where(aliases.c.id.in_(duplicates)))
+
+    changed = [
+        {'alias_id': row.id, 'key': key}
+        for (_, key), row in keep.items()
+        if key != row.query
+    ]
+    if changed:
+        conn.execute(
+            aliases.update()
+            .where(aliases.c.id == sa.bindparam('alias_id'))
+            .values(query=sa.bindparam('key')),
+            changed
+        )
+
+
+def downgrade() -> None:
+    # Las claves normalizadas siguen siendo queries válidos; las filas
+    # fusionadas no se pueden recuperar
+    pass
@@ -0,0 +1,94 @@
+"""Product search keys
+
+Revision ID: b57e0f3c9d21
+Revises: 8c41d2e7a9b3
+Create Date: 2026-10-16 22:41:03.117260
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.core.text import search_key, alias_search_keys
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b57e0f3c9d21'
+down_revision: Union[str, None] = '8c41d2e7a9b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('search_name', sa.String(length=200), nullable=True))
+    op.add_column('products', sa.Column('search_aliases', postgresql.ARRAY(sa.String()), nullable=True))
+
+    # Backfill con la misma normalización que usa el modelo al escribir
+    conn = op.get_bind()
+    products = sa.table(
+        'products',
+        sa.column('id', sa.Integer),
+        sa.column('name', sa.String),
+        sa.column('aliases', postgresql.ARRAY(sa.String)),
+        sa.column('search_name', sa.String),
+        sa.column('search_aliases', postgresql.ARRAY(sa.String)),
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(products.c.id, products.c.name, products.c.aliases)
+            .where(products.c.id > last_id)
+            .order_by(products.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            products.update()
+            .where(products.c.id == sa.bindparam('product_id'))
+            .values(search_name=sa.bindparam('key'), search_aliases=sa.bindparam('alias_keys')),
+            [
+                {'product_id': row.id, 'key': search_key(row.name), 'alias_keys': alias_search_keys(row.aliases)}
+                for row in rows
+            ]
+        )
+        last_id = rows[-1].id
+
+    # La búsqueda con pg_trgm pasa a usar las claves normalizadas
+    op.drop_index('ix_products_aliases_trgm', table_name='products')
+    op.drop_index('ix_products_name_trgm', table_name='products')
+    op.create_index(
+        'ix_products_search_name_trgm',
+        'products',
+        [sa.text('search_name gin_trgm_ops')],
+        postgresql_using='gin'
+    )
+    op.create_index(
+        'ix_products_search_aliases_trgm',
+        'products',
+        [sa.text('products_aliases_text(search_aliases) gin_trgm_ops')],
+        postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_search_aliases_trgm', table_name='products')
+    op.drop_index('ix_products_search_name_trgm', table_name='products')
+    op.create_index(
+        'ix_products_name_trgm',
+        'products',
+        [sa.text('lower(name) gin_trgm_ops')],
+        postgresql_using='gin'
+    )
+    op.create_index(
+        'ix_products_aliases_trgm',
+        'products',
+        [sa.text('products_aliases_text(aliases) gin_trgm_ops')],
+        postgresql_using='gin'
+    )
+    op.drop_column('products', 'search_aliases')
+    op.drop_column('products', 'search_name')
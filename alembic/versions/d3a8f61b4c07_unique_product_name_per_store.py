@@ -0,0 +1,47 @@
+"""Unique product name per store
+
+Revision ID: d3a8f61b4c07
+Revises: b57e0f3c9d21
+Create Date: 2026-10-16 23:18:42.530914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.text import search_key
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a8f61b4c07'
+down_revision: Union[str, None] = 'b57e0f3c9d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Los repetidos que ya existan (de antes del chequeo en la API) se
+    # renombran con su ID para no perder ventas ligadas a ellos
+    conn = op.get_bind()
+    renamed = conn.execute(sa.text("""
+        UPDATE products p
+        SET name = left(p.name, 190) || ' #' || p.id
+        WHERE EXISTS (
+            SELECT 1 FROM products o
+            WHERE o.store_id = p.store_id AND o.name = p.name AND o.id < p.id
+        )
+        RETURNING p.id, p.name
+    """)).all()
+
+    # search_name se deriva del nombre con la misma normalización del modelo
+    if renamed:
+        conn.execute(
+            sa.text("UPDATE products SET search_name = :key WHERE id = :product_id"),
+            [{'product_id': row.id, 'key': search_key(row.name)} for row in renamed]
+        )
+    op.create_unique_constraint('uq_products_store_name', 'products', ['store_id', 'name'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_products_store_name', 'products', type_='unique')
@@ -3,11 +3,15 @@ Dependencies para la API de QueVendí
 Contiene funciones reutilizables para endpoints
 """
 
-from fastapi import Depends, HTTPException, status, Request
+import json
+import asyncio
+from typing import Optional
+from fastapi import Depends, HTTPException, status, Request, WebSocket
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, SessionLocal
 from app.services.auth_service import AuthService
 from app.models.user import User
+from app.core.timing import stage
 
 
 async def get_current_user(
@@ -45,8 +49,9 @@ async def get_current_user(
         )
     
     # 4. Verificar token
-    auth_service = AuthService(db)
-    user = auth_service.get_current_user(token)
+    with stage('auth'):
+        auth_service = AuthService(db)
+        user = auth_service.get_current_user(token)
     
     if not user:
         print(f"[Auth] ❌ Token inválido")
@@ -66,6 +71,60 @@ async def get_current_user(
     return user
 
 
+async def get_websocket_user(websocket: WebSocket, timeout: float) -> Optional[User]:
+    """
+    Autenticar una conexión WebSocket ya aceptada con su primer mensaje
+    
+    El navegador no permite headers en el handshake y el token no debe ir
+    en la URL (queda en logs y proxies), así que el cliente lo manda como
+    primer mensaje: {"type": "auth", "token": "..."}. Si el mensaje no trae
+    token se usa la cookie access_token.
+    
+    Args:
+        websocket: Conexión ya aceptada
+        timeout: Segundos para esperar el mensaje de auth
+    
+    Returns:
+        Usuario activo o None si el mensaje o el token no son válidos
+    
+    Raises:
+        WebSocketDisconnect: Si el cliente se desconecta antes
+    """
+    try:
+        raw = await asyncio.wait_for(websocket.receive_text(), timeout)
+        message = json.loads(raw)
+    except asyncio.TimeoutError:
+        print("[Auth] ❌ WebSocket sin mensaje de auth")
+        return None
+    except ValueError:
+        message = None
+    
+    if not isinstance(message, dict) or message.get("type") != "auth":
+        print("[Auth] ❌ WebSocket: el primer mensaje no es de auth")
+        return None
+    
+    token = message.get("token") or websocket.cookies.get("access_token")
+    if not isinstance(token, str) or not token:
+        print("[Auth] ❌ WebSocket sin token")
+        return None
+    
+    if token.startswith("Bearer "):
+        token = token.replace("Bearer ", "")
+    
+    db = SessionLocal()
+    try:
+        user = AuthService(db).get_current_user(token)
+    finally:
+        db.close()
+    
+    if not user or not user.is_active:
+        print("[Auth] ❌ WebSocket con token inválido o usuario inactivo")
+        return None
+    
+    print(f"[Auth] ✅ WebSocket autenticado: {user.full_name}")
+    return user
+
+
 def get_current_active_owner(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -1,13 +1,20 @@
 # En app/api/v1/products.py (o crear si no existe)
 # AGREGAR este endpoint
 
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.api.dependencies import get_current_user
 from app.models.user import User
 from app.services.product_service import ProductService
+from app.schemas.product import ProductBulkUpdate
+from app.services.product_index import product_index_registry
+from app.services.catalog_cache import catalog_cache
+from app.services.product_import import (
+    ProductImportError, ProductImportService, detect_format, iter_rows
+)
 from pydantic import BaseModel
 
 #router = APIRouter(prefix="/products", tags=["products"])
@@ -70,6 +77,115 @@ class ProductCreate(BaseModel):
     aliases: str | None = None
     is_active: bool = True
 
+@router.get("/search")
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    mode: Optional[Literal["index", "trigram"]] = None,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Buscar productos por nombre o alias
+    
+    mode="trigram" ordena por similitud en PostgreSQL (pg_trgm) en vez de
+    usar el índice en memoria; por defecto PRODUCT_SEARCH_MODE.
+    """
+    product_service = ProductService(db)
+    products = product_service.search_products(current_user.store_id, q, mode, limit)
+    
+    return [
+        {
+            "id": p.id,
+            "name": p.name,
+            "category": p.category,
+            "price": p.sale_price,
+            "stock": p.stock,
+            "unit": p.unit
+        }
+        for p in products
+    ]
+
+@router.get("/suggest")
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(8, ge=1, le=20),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Sugerencias mientras se escribe
+    
+    Productos cuyo nombre, alias o alguna de sus palabras empieza con el
+    texto; primero los que empiezan por el nombre y, a igual coincidencia,
+    los más vendidos en los últimos SUGGEST_VELOCITY_DAYS días.
+    """
+    product_service = ProductService(db)
+    products = product_service.suggest_products(current_user.store_id, q, limit)
+    
+    return [
+        {
+            "id": p.id,
+            "name": p.name,
+            "category": p.category,
+            "price": p.sale_price,
+            "stock": p.stock,
+            "unit": p.unit
+        }
+        for p in products
+    ]
+
+@router.post("/import")
+async def import_products(
+    request: Request,
+    format: Optional[Literal["csv", "json", "ndjson"]] = None,
+    on_existing: Literal["update", "skip"] = "update",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Importar productos en bloque desde el cuerpo del request
+    
+    Acepta CSV con encabezado (name/nombre, sale_price/precio, stock, ...),
+    un arreglo JSON o NDJSON (un objeto por línea); el formato sale de
+    `format` o del Content-Type. Con on_existing="update" los productos que
+    ya existen (mismo nombre) se actualizan con las columnas que trae el
+    archivo; con "skip" se dejan igual. Devuelve el estado de cada fila.
+    """
+    file_format = format or detect_format(request.headers.get("content-type"))
+    if file_format is None:
+        raise HTTPException(400, detail="Formato no reconocido: usa format=csv, json o ndjson")
+    
+    importer = ProductImportService(db, current_user.store_id, on_existing)
+    try:
+        async for row, data in iter_rows(request.stream(), file_format):
+            importer.add(row, data)
+        report = importer.finish()
+    except ProductImportError as e:
+        db.rollback()
+        raise HTTPException(400, detail=str(e))
+    
+    return report.to_dict()
+
+@router.post("/bulk-update")
+async def bulk_update_products(
+    data: ProductBulkUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Cambiar precios y stock de muchos productos a la vez
+    
+    - rules: ajustes por categoría ("Bebidas +5%", redondeando a 10 céntimos)
+    - changes: valores explícitos por producto (id o nombre), p. ej. el
+      conteo de stock; mandan sobre las reglas
+    """
+    if not data.changes and not data.rules:
+        raise HTTPException(400, detail="Indica changes o rules")
+    
+    product_service = ProductService(db)
+    return product_service.bulk_update(current_user.store_id, data.changes, data.rules)
+
 @router.post("")
 async def create_product(
     product_data: ProductCreate,
@@ -105,6 +221,8 @@ async def create_product(
     db.add(new_product)
     db.commit()
     db.refresh(new_product)
+    product_index_registry.upsert_product(new_product)
+    catalog_cache.upsert(new_product)
     
     print(f"[Products] ✅ Producto creado: {new_product.name} (ID: {new_product.id})")
     
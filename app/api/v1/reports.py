@@ -3,7 +3,7 @@ Endpoints de reportes para QueVendí PRO
 """
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func, desc
 from zoneinfo import ZoneInfo
 from datetime import datetime, date, timedelta
@@ -43,7 +43,7 @@ async def get_today_stats_html(
     print(f"[Reports]   Hasta: {today_end}")
     
     # Ventas de hoy
-    today_sales = db.query(Sale).filter(
+    today_sales = db.query(Sale).options(selectinload(Sale.items)).filter(
         Sale.store_id == current_user.store_id,
         Sale.created_at >= today_start,
         Sale.created_at <= today_end
@@ -55,7 +55,7 @@ async def get_today_stats_html(
     yesterday_start = today_start - timedelta(days=1)
     yesterday_end = today_end - timedelta(days=1)
     
-    yesterday_sales = db.query(Sale).filter(
+    yesterday_sales = db.query(Sale).options(selectinload(Sale.items)).filter(
         Sale.store_id == current_user.store_id,
         Sale.created_at >= yesterday_start,
         Sale.created_at <= yesterday_end
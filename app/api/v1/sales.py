@@ -1,18 +1,26 @@
 """
 Endpoints de ventas para QueVendí
 """
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.core.database import get_db
-from app.schemas.sale import SaleCreate, SaleResponse
-from app.services.sale_service import SaleService
-from app.services.voice_service import VoiceService
+from app.schemas.sale import SaleCreate, SaleItemCreate, SalePage, SaleResponse, SaleSyncRequest
+from app.services.sale_service import (
+    SaleService, InsufficientStockError, IdempotencyKeyConflictError, InvalidCursorError,
+    PERU_TZ, request_fingerprint
+)
+from app.services.voice_service import VoiceService, VoiceCommandError, resolve_voice_command
+from app.services.cart_service import Cart, cart_store
+from app.services.openai_service import openai_service
 from app.services.product_service import ProductService
 from app.api.dependencies import get_current_user
+from app.core.timing import stage
 from app.models.user import User
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from fastapi.responses import HTMLResponse
 
@@ -22,6 +30,102 @@ router = APIRouter()
 class VoiceCommandRequest(BaseModel):
     """Comando de voz"""
     text: str
+    cart_id: Optional[str] = None
+
+class VoiceBatchRequest(BaseModel):
+    """Lote de comandos de voz, en el orden en que se dijeron"""
+    texts: List[str] = Field(..., min_length=1, max_length=50)
+    cart_id: Optional[str] = None
+
+class CartOpenRequest(BaseModel):
+    """Abrir (o retomar) el carrito de un dispositivo"""
+    device_id: Optional[str] = Field(None, max_length=100)
+
+class CartItemRequest(BaseModel):
+    product_id: int
+    quantity: float = Field(..., gt=0)
+    unit_price: Optional[float] = None  # None = precio del catálogo
+
+class CartUpdateRequest(BaseModel):
+    """Contenido del carrito tal como lo muestra el cliente"""
+    items: List[CartItemRequest]
+
+
+def get_user_cart(cart_id: Optional[str], user: User) -> Optional[Cart]:
+    """Carrito del usuario por ID (404 si no existe o venció)"""
+    if not cart_id:
+        return None
+    cart = cart_store.get(cart_id, user.store_id, user.id)
+    if cart is None:
+        raise HTTPException(status_code=404, detail="Carrito no encontrado o expirado")
+    return cart
+
+
+@router.post("/carts")
+async def open_cart(
+    request: CartOpenRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Abrir un carrito en el servidor
+    
+    Con el cart_id, /voice/parse resuelve "quita el pan", "otro" y los
+    cambios contra los productos del carrito y aplica cada comando; al
+    confirmar, POST /api/sales con cart_id cobra el carrito.
+    """
+    cart = cart_store.open(current_user.store_id, current_user.id, request.device_id)
+    return cart.to_dict()
+
+@router.get("/carts/{cart_id}")
+async def get_cart(
+    cart_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Ver el carrito"""
+    return get_user_cart(cart_id, current_user).to_dict()
+
+@router.put("/carts/{cart_id}")
+async def update_cart(
+    cart_id: str,
+    request: CartUpdateRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Reemplazar el contenido del carrito (cambios hechos a mano en el cliente)"""
+    cart = get_user_cart(cart_id, current_user)
+    
+    products = {}
+    if request.items:
+        product_service = ProductService(db)
+        products = {p.id: p for p in product_service.get_products_by_store(current_user.store_id)}
+    
+    missing = [item.product_id for item in request.items if item.product_id not in products]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Productos no encontrados: {', '.join(str(pid) for pid in missing)}"
+        )
+    
+    cart.set_items(
+        (
+            item.product_id,
+            products[item.product_id].name,
+            item.quantity,
+            item.unit_price if item.unit_price is not None else products[item.product_id].sale_price
+        )
+        for item in request.items
+    )
+    return cart.to_dict()
+
+@router.delete("/carts/{cart_id}")
+async def discard_cart(
+    cart_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Descartar el carrito"""
+    cart_store.discard(get_user_cart(cart_id, current_user))
+    return {"success": True}
+
 
 @router.post("/voice/parse")
 async def parse_voice_command(
@@ -32,287 +136,262 @@ async def parse_voice_command(
     """
     Parsear comando de voz y procesar acción
     Soporta: ventas, agregar, cambiar, cancelar, confirmar, quitar
+    
+    El header Server-Timing de la respuesta trae el tiempo de cada etapa
+    (auth, catalog, parse, llm, resolve, match; resolve incluye match).
     """
+    cart = get_user_cart(command.cart_id, current_user)
     parsed = VoiceService.parse_command(command.text)
     
+    # Si el parser local no entiende, intentar con el LLM (si está habilitado)
+    if not parsed and openai_service.enabled:
+        print("[VoiceParser] Parser local falló, intentando con OpenAI...")
+        with stage('llm'):
+            parsed = await openai_service.parse_command_with_context(
+                command.text,
+                cart.context() if cart else None
+            )
+    
     if not parsed:
         raise HTTPException(
             status_code=400,
             detail="No se pudo entender el comando"
         )
     
-    # Comandos simples
-    if parsed['type'] in ['cancel', 'confirm']:
-        return {
-            "type": parsed['type'],
-            "message": "Comando recibido"
-        }
-    
-    # ========================================
-    # COMANDO: REMOVE (quitar producto)
-    # ========================================
-    if parsed['type'] == 'remove':
-        product_service = ProductService(db)
-        products = product_service.get_products_by_store(current_user.store_id)
-        
-        # Limpiar opciones ambiguas previas
-        VoiceService._last_ambiguous_options = []
-        
-        product = VoiceService.find_product_fuzzy(parsed['product_query'], products)
-        
-        # Verificar ambigüedad
-        if product is None and VoiceService._last_ambiguous_options:
-            return {
-                "type": "ambiguous_remove",
-                "product_query": parsed['product_query'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
-                "message": f"¿Cuál {parsed['product_query']} quieres eliminar?"
-            }
-        
-        if not product:
-            raise HTTPException(
-                status_code=404,
-                detail=f"No se encontró: {parsed['product_query']}"
-            )
-        
-        return {
-            "type": "remove",
-            "product": {
-                "id": product.id,
-                "name": product.name
-            },
-            "message": f"Eliminar {product.name} del carrito"
-        }
-    
-    # ========================================
-    # COMANDO: CHANGE_PRICE (cambiar precio)
-    # ========================================
-    if parsed['type'] == 'change_price':
-        product_service = ProductService(db)
-        products = product_service.get_products_by_store(current_user.store_id)
-        
-        # Limpiar opciones ambiguas previas
-        VoiceService._last_ambiguous_options = []
-        
-        # Buscar el producto para verificar que existe
-        product = VoiceService.find_product_fuzzy(parsed['product_query'], products)
-        
-        # Verificar ambigüedad
-        if product is None and VoiceService._last_ambiguous_options:
-            return {
-                "type": "ambiguous_price",
-                "product_query": parsed['product_query'],
-                "new_price": parsed['new_price'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
-                "message": f"¿A cuál {parsed['product_query']} cambiar el precio?"
-            }
-        
-        if not product:
-            raise HTTPException(
-                status_code=404,
-                detail=f"No se encontró: {parsed['product_query']}"
-            )
-        
-        return {
-            "type": "change_price",
-            "product": {
-                "id": product.id,
-                "name": product.name,
-                "current_price": product.sale_price
-            },
-            "new_price": parsed['new_price']
-        }
-    
-    # ========================================
-    # COMANDO: CHANGE_PRODUCT (cambiar X por Y)
-    # ========================================
-    if parsed['type'] == 'change_product':
-        product_service = ProductService(db)
-        products = product_service.get_products_by_store(current_user.store_id)
-        
-        # Buscar producto viejo
-        VoiceService._last_ambiguous_options = []
-        old_product = VoiceService.find_product_fuzzy(parsed['old_product'], products)
-        
-        if old_product is None and VoiceService._last_ambiguous_options:
-            return {
-                "type": "ambiguous_change_old",
-                "old_product_query": parsed['old_product'],
-                "new_product_query": parsed['new_product'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
-                "message": f"¿Cuál {parsed['old_product']} quieres cambiar?"
-            }
-        
-        if not old_product:
-            raise HTTPException(404, detail=f"No se encontró: {parsed['old_product']}")
-        
-        # Buscar producto nuevo
-        VoiceService._last_ambiguous_options = []
-        new_product = VoiceService.find_product_fuzzy(parsed['new_product'], products)
-        
-        if new_product is None and VoiceService._last_ambiguous_options:
-            return {
-                "type": "ambiguous_change_new",
-                "old_product": {
-                    "id": old_product.id,
-                    "name": old_product.name
-                },
-                "new_product_query": parsed['new_product'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
-                "message": f"¿Por cuál {parsed['new_product']} cambiar?"
-            }
-        
-        if not new_product:
-            raise HTTPException(404, detail=f"No se encontró: {parsed['new_product']}")
-        
-        return {
-            "type": "change_product",
-            "old_product": {
-                "id": old_product.id,
-                "name": old_product.name
-            },
-            "new_product": {
-                "id": new_product.id,
-                "name": new_product.name,
-                "price": new_product.sale_price
-            }
-        }
+    # Comandos simples (no necesitan el catálogo)
+    catalog = None
+    if parsed['type'] not in ['cancel', 'confirm']:
+        catalog = ProductService(db).get_catalog(current_user.store_id)
     
-    # ========================================
-    # COMANDO: SALE / ADD (venta o agregar)
-    # ========================================
-    product_service = ProductService(db)
-    products = product_service.get_products_by_store(current_user.store_id)
+    try:
+        with stage('resolve'):
+            result = resolve_voice_command(parsed, catalog, cart=cart)
+    except VoiceCommandError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    cart_items = []
-    not_found = []
-    ambiguous_items = []  # ✅ NUEVO: Lista de items ambiguos
+    if cart is not None:
+        cart.apply(result)
+        result["cart"] = cart.to_dict()
     
-    for item in parsed['items']:
-        # Limpiar opciones ambiguas previas antes de cada búsqueda
-        VoiceService._last_ambiguous_options = []
-        
-        product = VoiceService.find_product_fuzzy(item['product_query'], products)
-        
-        # ✅ NUEVO: Verificar si hay ambigüedad
-        if product is None and VoiceService._last_ambiguous_options:
-            ambiguous_items.append({
-                'query': item['product_query'],
-                'quantity': item['quantity'],
-                'options': [
-                    {
-                        'id': p.id,
-                        'name': p.name,
-                        'price': p.sale_price,
-                        'stock': p.stock
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ]
-            })
-            continue
-        
-        if not product:
-            not_found.append(item['product_query'])
-            continue
+    return result
+
+
+@router.post("/voice/parse/batch")
+async def parse_voice_commands_batch(
+    batch: VoiceBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Parsear varios comandos de voz con una sola carga del catálogo
+    
+    Pensado para tablets que acumulan frases cuando la red falla. Cada
+    resultado tiene la misma forma que /voice/parse; los errores se
+    devuelven como {"type": "error", "status_code", "detail"} sin cortar
+    el resto del lote.
+    """
+    cart = get_user_cart(batch.cart_id, current_user)
+    parsed_list = [VoiceService.parse_command(text) for text in batch.texts]
+    
+    # Las frases que el parser local no entiende van al LLM en paralelo
+    failed = [i for i, parsed in enumerate(parsed_list) if not parsed]
+    if failed and openai_service.enabled:
+        cart_context = cart.context() if cart else None
+        with stage('llm'):
+            fallbacks = await asyncio.gather(*[
+                openai_service.parse_command_with_context(batch.texts[i], cart_context) for i in failed
+            ])
+        for i, parsed in zip(failed, fallbacks):
+            parsed_list[i] = parsed
+    
+    catalog = None
+    if any(p and p['type'] not in ['cancel', 'confirm'] for p in parsed_list):
+        catalog = ProductService(db).get_catalog(current_user.store_id)
+    
+    # Puntuar los items de venta de todas las frases en una sola pasada
+    queries = [
+        item['product_query']
+        for parsed in parsed_list
+        if parsed and parsed['type'] in ['sale', 'add']
+        for item in parsed['items']
+    ]
+    all_scores = iter(VoiceService.score_queries(queries, catalog))
+    
+    results = []
+    for text, parsed in zip(batch.texts, parsed_list):
+        item_scores = None
+        if parsed and parsed['type'] in ['sale', 'add']:
+            item_scores = [next(all_scores) for _ in parsed['items']]
         
-        # Verificar stock
-        if product.stock < item['quantity']:
-            raise HTTPException(
-                status_code=400,
-                detail=f"{product.name}: Stock insuficiente. Solo hay {product.stock}"
-            )
+        try:
+            if not parsed:
+                raise VoiceCommandError(400, "No se pudo entender el comando")
+            with stage('resolve'):
+                result = resolve_voice_command(parsed, catalog, item_scores, cart)
+        except VoiceCommandError as e:
+            result = {
+                "type": "error",
+                "status_code": e.status_code,
+                "detail": e.detail
+            }
         
-        subtotal = product.sale_price * item['quantity']
-        unit = getattr(product, 'unit', 'unidad')
+        # Cada frase ve el carrito como lo dejó la anterior
+        if cart is not None:
+            cart.apply(result)
         
-        cart_items.append({
-            "product": {
-                "id": product.id,
-                "name": product.name,
-                "price": product.sale_price,
-                "stock": product.stock,
-                "category": product.category,
-                "unit": unit
-            },
-            "quantity": item['quantity'],
-            "subtotal": subtotal
-        })
-    
-    # ✅ NUEVO: Si hay items ambiguos, devolver para que el usuario elija
-    if ambiguous_items:
-        return {
-            "type": "ambiguous",
-            "ambiguous_items": ambiguous_items,
-            "found_items": cart_items,  # Items que sí se encontraron
-            "message": "Hay varios productos que coinciden. ¿Cuál quieres?"
-        }
-    
-    # Si no se encontró nada
-    if not cart_items:
-        raise HTTPException(
-            status_code=404,
-            detail=f"No se encontraron: {', '.join(not_found)}"
-        )
-    
-    # Respuesta exitosa
-    response = {
-        "type": parsed['type'],
-        "items": cart_items,
-        "total": sum(item['subtotal'] for item in cart_items)
-    }
+        results.append({"text": text, **result})
     
-    if not_found:
-        response["warning"] = f"No se encontraron: {', '.join(not_found)}"
+    print(f"[VoiceBatch] {len(results)} comandos procesados con una carga de catálogo")
     
+    response = {"results": results}
+    if cart is not None:
+        response["cart"] = cart.to_dict()
     return response
 
+
 @router.post("/", response_model=SaleResponse)
 async def create_sale(
     sale_data: SaleCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=100),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Crear venta"""
+    """
+    Crear venta
+    
+    Con cart_id (y sin items) se cobra el carrito del servidor, que se
+    descarta al guardar la venta.
+    
+    Con el header Idempotency-Key, un reintento con la misma clave devuelve
+    la venta original (header Idempotent-Replayed: true) sin volver a
+    guardarla ni descontar stock; la misma clave con otra venta da 422.
+    """
     sale_service = SaleService(db)
-    sale = sale_service.create_sale(sale_data, current_user.id, current_user.store_id)
+    request_hash = None
+    if idempotency_key:
+        # Antes que el carrito: al cobrarlo se descarta, y el reintento ya no lo encontraría
+        request_hash = request_fingerprint(sale_data)
+        try:
+            existing = sale_service.find_idempotent_sale(current_user.store_id, idempotency_key, request_hash)
+        except IdempotencyKeyConflictError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if existing is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return sale_service.to_response(existing)
+    
+    cart = get_user_cart(sale_data.cart_id, current_user)
+    if cart is not None and not sale_data.items:
+        if not cart.items:
+            raise HTTPException(status_code=400, detail="El carrito está vacío")
+        sale_data = sale_data.model_copy(update={
+            "items": [SaleItemCreate(**item) for item in cart.sale_items()]
+        })
+    
+    if not sale_data.items:
+        raise HTTPException(status_code=400, detail="La venta no tiene productos")
+    
+    try:
+        with stage('sale'):
+            sale = sale_service.create_sale(
+                sale_data,
+                current_user.id,
+                current_user.store_id,
+                idempotency_key=idempotency_key,
+                request_hash=request_hash
+            )
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except IdempotencyKeyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if getattr(sale, 'replayed', False):
+        response.headers["Idempotent-Replayed"] = "true"
+    
+    if cart is not None:
+        cart_store.discard(cart)
+    
     return sale_service.to_response(sale)
 
+@router.post("/sync")
+async def sync_offline_sales(
+    sync_data: SaleSyncRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Sincronizar ventas hechas sin conexión
+    
+    Guarda todas en una transacción (inserts por lote y un solo descuento
+    de stock por producto) y responde el estado de cada una por client_id:
+    created, duplicate (ya estaba guardada; trae su sale_id) o conflict
+    (no se guardó; trae el motivo). Reenviar el mismo lote es seguro.
+    """
+    if len(sync_data.sales) > settings.SALE_SYNC_MAX_SALES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {settings.SALE_SYNC_MAX_SALES} ventas por sincronización"
+        )
+    
+    try:
+        with stage('sale_sync'):
+            return SaleService(db).sync_sales(sync_data.sales, current_user.id, current_user.store_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/history", response_model=SalePage)
+async def get_sales_history(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Historial de ventas, de la más reciente a la más antigua
+    
+    Para la página siguiente se manda el next_cursor de la respuesta como
+    cursor; cuando viene en null no hay más ventas.
+    """
+    sale_service = SaleService(db)
+    try:
+        sales, next_cursor = sale_service.get_sales_page(current_user.store_id, limit, cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "sales": [sale_service.to_response(sale) for sale in sales],
+        "next_cursor": next_cursor
+    }
+
 @router.get("/today", response_model=List[SaleResponse])
 async def get_today_sales(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Ventas del día"""
+    """
+    Ventas del día
+    
+    Sin limit ni cursor devuelve todas las del día, como siempre. Con
+    cualquiera de los dos devuelve una página y, si hay más ventas, el
+    cursor de la siguiente viene en el header X-Next-Cursor.
+    """
     sale_service = SaleService(db)
-    sales = sale_service.get_sales_by_date(current_user.store_id)
+    if limit is None and cursor is None:
+        sales = sale_service.get_sales_by_date(current_user.store_id, with_details=True)
+        return [sale_service.to_response(sale) for sale in sales]
+    
+    try:
+        sales, next_cursor = sale_service.get_sales_page(
+            current_user.store_id, limit, cursor, date=datetime.now(PERU_TZ)
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [sale_service.to_response(sale) for sale in sales]
 
 @router.get("/today/total")
@@ -334,28 +413,41 @@ async def get_today_total(
 
 @router.get("/stats/today")
 async def get_today_stats(
+    low_stock_tag: Optional[str] = Query(None, max_length=32),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Estadísticas del día para alertas"""
+    """
+    Estadísticas del día para alertas
+    
+    Los productos agotados o con poco stock salen del catálogo en caché,
+    que los mantiene al día con cada venta o cambio de producto.
+    low_stock_tag es una huella de esa lista calculada de los datos (igual en
+    todos los workers): si el cliente manda la que tiene y coincide,
+    low_stock viene en null (low_stock_unchanged=true) y puede reusar la suya.
+    """
     sale_service = SaleService(db)
     product_service = ProductService(db)
     
     sales = sale_service.get_sales_by_date(current_user.store_id)
-    products = product_service.get_products_by_store(current_user.store_id)
+    catalog = product_service.get_catalog(current_user.store_id)
     
-    # Productos agotados o cerca
-    low_stock = []
-    for p in products:
-        if p.stock == 0:
-            low_stock.append({"name": p.name, "stock": 0})
-        elif p.min_stock_alert and p.stock <= p.min_stock_alert:
-            low_stock.append({"name": p.name, "stock": p.stock})
+    unchanged = low_stock_tag == catalog.low_stock_tag
+    low_stock = None
+    if not unchanged:
+        # Productos agotados o cerca
+        low_stock = [
+            {"id": p.id, "name": p.name, "stock": max(p.stock, 0)}
+            for p in sorted(catalog.low_stock.values(), key=lambda p: p.name)
+        ]
     
     return {
         "sales_count": len(sales),
         "total": sum(s.total for s in sales),
         "low_stock": low_stock,
+        "low_stock_unchanged": unchanged,
+        "low_stock_tag": catalog.low_stock_tag,
+        "out_of_stock_count": sum(1 for p in catalog.low_stock.values() if p.is_out_of_stock),
         "last_sale": sales[0].created_at if sales else None
     }
 
@@ -366,17 +458,26 @@ AGREGAR estos nuevos endpoints HTML al archivo sales.py existente
 
 @router.get("/today/html", response_class=HTMLResponse)
 async def get_today_sales_html(
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Ventas del día en formato HTML para HTMX
+    
+    Trae una página; si hay más, la última tarjeta pide la siguiente
+    (hx-trigger="revealed") al llegar a ella con el scroll.
     """
     sale_service = SaleService(db)
-    sales = sale_service.get_sales_by_date(current_user.store_id)
+    try:
+        sales, next_cursor = sale_service.get_sales_page(
+            current_user.store_id, cursor=cursor, date=datetime.now(PERU_TZ)
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     # ✅ SI NO HAY VENTAS
-    if not sales or len(sales) == 0:
+    if not sales and not cursor:
         return HTMLResponse(content="""
             <div class="empty-state">
                 <div class="empty-icon">📭</div>
@@ -435,6 +536,17 @@ async def get_today_sales_html(
             </style>
         """)
     
+    # ✅ SI HAY MÁS: se reemplaza por la página siguiente al verse
+    if next_cursor:
+        html_items.append(f"""
+            <div class="card-loading"
+                hx-get="/api/sales/today/html?cursor={next_cursor}"
+                hx-trigger="revealed"
+                hx-swap="outerHTML">
+                Cargando más ventas...
+            </div>
+        """)
+    
     return HTMLResponse(content="\n".join(html_items))
 
 
@@ -1,18 +1,32 @@
 """
 Endpoints específicos para sistema de voz
 """
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_db, SessionLocal
 from app.services.tts_service import tts_service
-from app.api.dependencies import get_current_user
+from app.services.voice_cache import parse_cache, resolution_cache
+from app.services.voice_service import VoiceService, VoiceCommandError, resolve_voice_command
+from app.services.product_service import ProductService
+from app.core.text import normalize_text
+from app.services.learned_alias_service import LearnedAliasService
+from app.services.openai_service import openai_service
+from app.services.cart_service import Cart
+from app.services.catalog_cache import CatalogSnapshot, catalog_cache
+from app.api.dependencies import get_current_user, get_websocket_user
+from app.core.timing import latency_registry, stage, timed
 from app.models.user import User
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Tuple
 
 #router = APIRouter(prefix="/voice", tags=["voice"])
 router = APIRouter()
 
+# Código de cierre del WebSocket cuando falla la autenticación (como un 401)
+WS_UNAUTHORIZED = 4401
+
 class TTSRequest(BaseModel):
     """Request para text-to-speech"""
     text: str
@@ -66,4 +80,268 @@ async def save_voice_settings(
     Guardar configuración de voz
     TODO: Implementar guardado en BD
     """
-    return {"success": True, "settings": settings}
\ No newline at end of file
+    return {"success": True, "settings": settings}
+
+class LearnedAliasRequest(BaseModel):
+    """Producto que eligió el cajero ante un query ambiguo"""
+    query: str = Field(..., min_length=1, max_length=200)
+    product_id: int
+
+@router.post("/aliases/learned")
+async def record_learned_alias(
+    request: LearnedAliasRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Registrar la opción elegida para un producto ambiguo
+    
+    Se llama con el product_query de la respuesta ambigua y el id elegido.
+    Tras LEARNED_ALIAS_MIN_HITS elecciones iguales el query se resuelve
+    directo a ese producto.
+    """
+    try:
+        alias = LearnedAliasService(db).record_choice(
+            current_user.store_id,
+            request.query,
+            request.product_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "query": alias.query,
+        "product_id": alias.product_id,
+        "hits": alias.hits,
+        "active": alias.hits >= settings.LEARNED_ALIAS_MIN_HITS
+    }
+
+@router.delete("/aliases/learned")
+async def forget_learned_alias(
+    query: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Olvidar lo aprendido para un query (si se aprendió mal)"""
+    deleted = LearnedAliasService(db).forget(current_user.store_id, query)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="No hay nada aprendido para ese texto")
+    return {"success": True}
+
+@router.get("/cache/stats")
+async def get_voice_cache_stats(current_user: User = Depends(get_current_user)):
+    """
+    Aciertos y fallos de las cachés de voz (parseo, resolución de productos
+    y catálogo)
+    """
+    return {
+        "catalog": catalog_cache.stats(),
+        "parse": parse_cache.stats(),
+        "resolution": resolution_cache.stats(),
+        "llm": openai_service.stats()
+    }
+
+
+@router.get("/metrics")
+async def get_voice_metrics(current_user: User = Depends(get_current_user)):
+    """
+    Histogramas de latencia por endpoint y etapa del pipeline de voz
+    
+    Por cada endpoint ("POST /api/sales/voice/parse", "WS /api/voice/stream"...)
+    y etapa (auth, catalog, parse, llm, resolve, match, total): cantidad,
+    promedio, p50/p95/p99 estimados y conteo por bucket en ms.
+    """
+    return latency_registry.snapshot()
+
+@router.delete("/metrics")
+async def reset_voice_metrics(current_user: User = Depends(get_current_user)):
+    """Reiniciar los histogramas de latencia"""
+    latency_registry.reset()
+    return {"success": True}
+
+
+# ========================================
+# SESIÓN DE VOZ EN TIEMPO REAL (WebSocket)
+# ========================================
+class VoiceStreamSession:
+    """
+    Estado de una conexión /voice/stream
+    
+    Usa el catálogo en caché de la tienda (una versión a la vez), el carrito que reporta
+    el cliente (quitar, cambiar y "otro" buscan primero ahí) y el último
+    resultado, para que la transcripción final que repite al último
+    parcial se responda sin volver a resolver.
+    """
+    
+    def __init__(self, store_id: int, user_id: int):
+        self.store_id = store_id
+        self.cart = Cart(id='stream', store_id=store_id, user_id=user_id)
+        self._catalog: Optional[CatalogSnapshot] = None
+        self._last: Optional[Tuple[str, int, int, Dict]] = None  # (texto, versión, revisión del carrito, resultado)
+    
+    def catalog(self) -> CatalogSnapshot:
+        """Catálogo vigente de la tienda (si cambió de versión se olvida el último resultado)"""
+        catalog = catalog_cache.peek(self.store_id)
+        
+        if catalog is None:
+            db = SessionLocal()
+            try:
+                catalog = ProductService(db).get_catalog(self.store_id)
+            finally:
+                db.close()
+        
+        if self._catalog is None or catalog.version != self._catalog.version:
+            self._catalog = catalog
+            self._last = None
+        
+        return catalog
+    
+    async def handle(self, message: Dict) -> Optional[Dict]:
+        """
+        Procesar un mensaje del cliente
+        
+        Mensajes aceptados:
+            {"type": "partial", "seq", "text"}: transcripción en curso
+            {"type": "final", "seq", "text"}: transcripción terminada
+            {"type": "cart", "items": [{"product_id", "quantity"}]}
+            {"type": "ping", "seq"}
+        
+        Returns:
+            Mensaje a enviar o None si no hay nada nuevo que decir
+        """
+        kind = message.get('type')
+        seq = message.get('seq')
+        
+        if kind == 'ping':
+            return {"event": "pong", "seq": seq}
+        
+        if kind == 'cart':
+            self.set_cart(message.get('items') or [])
+            return None
+        
+        if kind in ('partial', 'final'):
+            text = (message.get('text') or '').strip()
+            if not text:
+                return None
+            with timed(f"WS /api/voice/stream {kind}") as timer:
+                reply = await self.process(text, seq, final=(kind == 'final'))
+            if reply is not None:
+                reply["timings"] = {**timer.as_dict(), "total": round(timer.total(), 2)}
+            return reply
+        
+        return {
+            "event": "error",
+            "seq": seq,
+            "status_code": 400,
+            "detail": f"Tipo de mensaje desconocido: {kind}"
+        }
+    
+    def set_cart(self, items: List[Dict]) -> None:
+        """Reemplazar el carrito de la sesión con el que muestra el cliente"""
+        catalog = self.catalog()
+        entries = []
+        for item in items:
+            try:
+                product = VoiceService.get_product(catalog, int(item['product_id']))
+                if product is None:
+                    continue
+                entries.append((product.id, product.name, float(item.get('quantity', 1)), product.sale_price))
+            except (KeyError, TypeError, ValueError):
+                continue
+        self.cart.set_items(entries)
+    
+    async def process(self, text: str, seq, final: bool) -> Optional[Dict]:
+        """Parsear y resolver una transcripción (parcial o final)"""
+        key = normalize_text(text)
+        catalog = self.catalog()
+        
+        state = (key, catalog.version, self.cart.revision)
+        
+        if self._last and self._last[:3] == state:
+            # Mismo texto que el último parcial: no hay nada nuevo que enviar
+            if not final:
+                return None
+            result = self._last[3]
+        else:
+            result = await self._resolve(text, catalog, use_llm=final)
+            # Un parcial que no se entendió se reintenta (con LLM) en el final
+            if final or result.get('status_code') != 400:
+                self._last = (*state, result)
+        
+        return {
+            "event": "result" if final else "partial",
+            "seq": seq,
+            "text": text,
+            "data": result
+        }
+    
+    async def _resolve(self, text: str, catalog: CatalogSnapshot, use_llm: bool) -> Dict:
+        parsed = VoiceService.parse_command(text)
+        
+        # Los parciales no van al LLM: solo la transcripción final
+        if not parsed and use_llm and openai_service.enabled:
+            with stage('llm'):
+                parsed = await openai_service.parse_command_with_context(text, self.cart.context())
+        
+        try:
+            if not parsed:
+                raise VoiceCommandError(400, "No se pudo entender el comando")
+            with stage('resolve'):
+                if parsed['type'] in ['cancel', 'confirm']:
+                    return resolve_voice_command(parsed, None)
+                return resolve_voice_command(parsed, catalog, cart=self.cart)
+        except VoiceCommandError as e:
+            return {
+                "type": "error",
+                "status_code": e.status_code,
+                "detail": e.detail
+            }
+
+
+@router.websocket("/stream")
+async def voice_stream(websocket: WebSocket):
+    """
+    Sesión de voz por WebSocket
+    
+    Autentica una sola vez con el primer mensaje ({"type": "auth", "token"},
+    o la cookie si no trae token) y cierra con 4401 si falla; el token nunca
+    va en la URL. Mantiene el catálogo y el carrito por conexión.
+    Responde a cada transcripción con
+    {"event": "partial" | "result", "seq", "text", "data", "timings"}, donde data
+    tiene la misma forma que la respuesta de /api/sales/voice/parse (los
+    errores vienen como {"type": "error", "status_code", "detail"}).
+    """
+    await websocket.accept()
+    try:
+        user = await get_websocket_user(websocket, settings.VOICE_STREAM_AUTH_TIMEOUT)
+    except WebSocketDisconnect:
+        return
+    if not user:
+        await websocket.close(code=WS_UNAUTHORIZED)
+        return
+    
+    session = VoiceStreamSession(user.store_id, user.id)
+    await websocket.send_json({"event": "ready", "store_id": user.store_id})
+    print(f"[VoiceStream] Sesión abierta: {user.full_name}")
+    
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                await websocket.send_json({
+                    "event": "error",
+                    "status_code": 400,
+                    "detail": "Mensaje inválido (se esperaba JSON)"
+                })
+                continue
+            
+            if not isinstance(message, dict):
+                continue
+            
+            reply = await session.handle(message)
+            if reply is not None:
+                await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        print(f"[VoiceStream] Sesión cerrada: {user.full_name}")
@@ -27,6 +27,55 @@ class Settings(BaseSettings):
     ALERT_SLOW_SALES_THRESHOLD: int = 5
     ALERT_SLOW_SALES_HOURS: int = 2
     
+    # Caché de comandos de voz
+    VOICE_PARSE_CACHE_SIZE: int = 2048
+    VOICE_PARSE_CACHE_TTL: int = 3600  # 1 hora
+    VOICE_RESOLUTION_CACHE_SIZE: int = 8192
+    VOICE_RESOLUTION_CACHE_TTL: int = 900  # 15 minutos
+    VOICE_STREAM_AUTH_TIMEOUT: float = 10.0  # segundos para el mensaje de auth
+    
+    # Caché del catálogo por tienda (acota lo viejo si otro proceso escribe)
+    CATALOG_CACHE_TTL: int = 300  # segundos
+    
+    # Búsqueda de productos: "index" (en memoria) o "trigram" (pg_trgm, requiere la migración)
+    PRODUCT_SEARCH_MODE: str = "index"
+    PRODUCT_SEARCH_MIN_SIMILARITY: float = 0.3
+    
+    # Ventas: False = se rechaza la venta si no alcanza el stock
+    SALE_ALLOW_NEGATIVE_STOCK: bool = False
+    SALE_IDEMPOTENCY_TTL_HOURS: int = 24  # cuánto se recuerda cada Idempotency-Key
+    SALE_SYNC_MAX_SALES: int = 1000  # ventas offline por sincronización
+    SALES_PAGE_SIZE: int = 50  # ventas por página del historial
+    SALES_PAGE_MAX: int = 200  # máximo que puede pedir el cliente
+    
+    # Autocompletado: los empates se ordenan por unidades vendidas en la ventana
+    SUGGEST_VELOCITY_DAYS: int = 30
+    SUGGEST_VELOCITY_TTL: int = 600  # segundos
+    
+    # Importación masiva de productos (CSV / JSON)
+    PRODUCT_IMPORT_BATCH_SIZE: int = 500  # filas por INSERT ... ON CONFLICT
+    PRODUCT_IMPORT_MAX_ROWS: int = 10000
+    PRODUCT_IMPORT_MAX_JSON_BYTES: int = 5 * 1024 * 1024  # arreglo JSON (se lee entero)
+    
+    # Carritos del lado del servidor
+    CART_TTL: int = 7200  # segundos sin actividad
+    CART_MAX_SESSIONS: int = 5000
+    
+    # Aliases aprendidos de las elecciones del cajero
+    LEARNED_ALIAS_MIN_HITS: int = 2  # elecciones iguales antes de usarlo
+    LEARNED_ALIAS_TTL_DAYS: int = 30
+    LEARNED_ALIAS_MAX_PER_STORE: int = 1000
+    LEARNED_ALIAS_RETRY_SECONDS: int = 60  # espera para recargar una tienda tras un error
+    LEARNED_ALIAS_TOUCH_HOURS: int = 24  # atraso máximo del último uso guardado en la BD
+    
+    # Fallback con LLM cuando el parser local no entiende (requiere el paquete openai)
+    OPENAI_API_KEY: Optional[str] = None
+    OPENAI_MODEL: str = "gpt-4o-mini"
+    OPENAI_TIMEOUT: float = 3.0  # segundos, incluye la espera por un cupo
+    OPENAI_MAX_CONCURRENCY: int = 4
+    OPENAI_CACHE_SIZE: int = 1024
+    OPENAI_CACHE_TTL: int = 3600  # 1 hora
+    
     class Config:
         env_file = ".env"
         extra = "allow"  # AGREGAR ESTO si no existe
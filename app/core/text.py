@@ -0,0 +1,72 @@
+"""
+Claves de búsqueda normalizadas para nombres y aliases de productos
+
+Minúsculas, sin tildes y con cada palabra en singular ("Panes Integrales"
+→ "pan integral"). Se guardan en Product.search_name / search_aliases al
+escribir, y los queries del matcher pasan por la misma función, así que
+"cafe" y "café" o "pan" y "panes" comparan igual.
+
+normalize_text es el primer paso de search_key (minúsculas y espacios
+simples): lo usan el parser de comandos y sus cachés, que necesitan el
+texto tal cual se dijo ("tres" no puede pasar a "tre").
+"""
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Optional, Union
+
+# Antes de "es", estas consonantes hacen plural con "es" (panes, limones, papeles)
+_ES_PLURAL_AFTER = frozenset('lnrdj')
+
+
+def strip_accents(text: str) -> str:
+    """Quitar tildes y diéresis (la ñ se mantiene)"""
+    decomposed = unicodedata.normalize('NFD', text)
+    kept = []
+    for i, char in enumerate(decomposed):
+        if unicodedata.combining(char) and not (char == '\u0303' and i and decomposed[i - 1] in 'nN'):
+            continue
+        kept.append(char)
+    return unicodedata.normalize('NFC', ''.join(kept))
+
+
+def singularize(token: str) -> str:
+    """Singular aproximado de una palabra en español (deja igual números y palabras cortas)"""
+    if len(token) <= 3 or not token.endswith('s') or any(c.isdigit() for c in token):
+        return token
+    if token.endswith('es') and len(token) > 4 and token[-3] in _ES_PLURAL_AFTER:
+        return token[:-2]
+    return token[:-1]
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Minúsculas y espacios simples ("Dos  Panes" → "dos panes")"""
+    if not text:
+        return ""
+    return " ".join(text.lower().split())
+
+
+@lru_cache(maxsize=16384)
+def search_key(text: Optional[str]) -> str:
+    """Clave de búsqueda de un texto ("Galletas  Soda" → "galleta soda")"""
+    return " ".join(singularize(token) for token in strip_accents(normalize_text(text)).split())
+
+
+def alias_search_keys(aliases: Union[None, str, Iterable[str]]) -> List[str]:
+    """
+    Claves de búsqueda de los aliases de un producto
+
+    Args:
+        aliases: Lista de strings o string separado por comas
+    """
+    if not aliases:
+        return []
+
+    if isinstance(aliases, str):
+        aliases = aliases.split(',')
+
+    keys = []
+    for alias in aliases:
+        key = search_key(alias)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
@@ -0,0 +1,193 @@
+"""
+Tiempos por etapa de los requests (auth, catálogo, parseo, matching...)
+
+Cada request instrumentado lleva un StageTimer en un ContextVar; el código
+marca sus etapas con `with stage("parse"):` (no hace nada fuera de un
+request instrumentado). Al terminar, ServerTimingMiddleware agrega el
+header Server-Timing y suma los tiempos a los histogramas de
+latency_registry, que se leen en GET /api/voice/metrics.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Límites superiores de los buckets, en milisegundos
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class StageTimer:
+    """Tiempos acumulados por etapa de un solo request (en ms)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def total(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(ms, 2) for name, ms in self.stages.items()}
+
+    def header(self, total: Optional[float] = None) -> str:
+        """Valor del header Server-Timing ("parse;dur=0.41, match;dur=3.2")"""
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.stages.items()]
+        if total is not None:
+            parts.append(f"total;dur={total:.2f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+
+def current_timer() -> Optional[StageTimer]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Medir una etapa del request actual (si no hay timer, no mide nada)"""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+@contextmanager
+def timed(name: str) -> Iterator[StageTimer]:
+    """
+    Medir un bloque con su propio timer (p. ej. un mensaje de WebSocket)
+
+    Las etapas se registran en latency_registry bajo `name` al salir.
+    """
+    timer = StageTimer()
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+        latency_registry.record(name, timer.stages, timer.total())
+
+
+class LatencyHistogram:
+    """Histograma de latencias con buckets fijos"""
+
+    def __init__(self, buckets: Iterable[float] = BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # el último es "+inf"
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q: float) -> float:
+        """Estimar un percentil interpolando dentro del bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50), 2),
+            "p95_ms": round(self.percentile(0.95), 2),
+            "p99_ms": round(self.percentile(0.99), 2),
+            "max_ms": round(self.max, 2),
+            "buckets": {
+                **{f"le_{b}": n for b, n in zip(self.buckets, self.counts)},
+                "inf": self.counts[-1]
+            }
+        }
+
+
+class LatencyRegistry:
+    """Histogramas por endpoint y etapa (uno por proceso)"""
+
+    def __init__(self):
+        self._histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, stages: Dict[str, float], total: float) -> None:
+        with self._lock:
+            histograms = self._histograms.setdefault(name, {})
+            for stage_name, ms in (*stages.items(), ("total", total)):
+                histogram = histograms.get(stage_name)
+                if histogram is None:
+                    histogram = histograms[stage_name] = LatencyHistogram()
+                histogram.observe(ms)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict]]:
+        with self._lock:
+            return {
+                name: {stage_name: h.snapshot() for stage_name, h in histograms.items()}
+                for name, histograms in self._histograms.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+# Instancia global
+latency_registry = LatencyRegistry()
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI que mide los requests de algunas rutas
+
+    Pone un StageTimer en el contexto, agrega el header Server-Timing a la
+    respuesta y registra los tiempos bajo "MÉTODO ruta".
+    """
+
+    def __init__(self, app, paths: List[str]):
+        self.app = app
+        self.paths = frozenset(path.rstrip('/') for path in paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].rstrip('/') not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        timer = StageTimer()
+        token = _current.set(timer)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.header(timer.total()).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            latency_registry.record(f"{scope['method']} {scope['path'].rstrip('/')}", timer.stages, timer.total())
@@ -7,7 +7,9 @@ from fastapi.templating import Jinja2Templates
 from pathlib import Path
 from contextlib import asynccontextmanager
 from app.core.config import settings
+from app.core.timing import ServerTimingMiddleware
 from app.api.v1 import auth, sales, products, voice, reports, stores, users
+from app.services.learned_alias_service import learned_alias_cache
 import os
 
 # ========================================
@@ -96,6 +98,7 @@ async def lifespan(app: FastAPI):
     yield
     
     # ========== SHUTDOWN ==========
+    learned_alias_cache.flush_all()
     print("\n👋 Servidor detenido")
 
 # ========================================
@@ -118,6 +121,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ========================================
+# TIEMPOS POR ETAPA (header Server-Timing)
+# ========================================
+app.add_middleware(
+    ServerTimingMiddleware,
+    paths=["/api/sales/voice/parse", "/api/sales/voice/parse/batch", "/api/sales"],
+)
+
 # ========================================
 # ARCHIVOS ESTÁTICOS - MONTAR PRIMERO
 # ========================================
@@ -6,6 +6,7 @@
 from app.models.store import Store
 from app.models.user import User
 from app.models.product import Product
-from app.models.sale import Sale, SaleItem
+from app.models.sale import Sale, SaleItem, SaleIdempotencyKey
+from app.models.learned_alias import LearnedAlias
 
-__all__ = ["Store", "User", "Product", "Sale", "SaleItem"]
\ No newline at end of file
+__all__ = ["Store", "User", "Product", "Sale", "SaleItem", "SaleIdempotencyKey", "LearnedAlias"]
\ No newline at end of file
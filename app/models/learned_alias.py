@@ -0,0 +1,28 @@
+# ============================================
+# ARCHIVO: app/models/learned_alias.py
+# ============================================
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class LearnedAlias(Base):
+    """Producto que el cajero eligió para un texto dictado ambiguo"""
+    __tablename__ = "learned_aliases"
+    __table_args__ = (
+        UniqueConstraint("store_id", "query", name="uq_learned_aliases_store_query"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    store_id = Column(Integer, ForeignKey("stores.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    
+    # Texto dictado como clave de búsqueda (search_key: "inca", "leche chica")
+    query = Column(String(200), nullable=False)
+    
+    # Veces seguidas que se eligió este producto para el query
+    hits = Column(Integer, default=1, nullable=False)
+    
+    # Timestamps
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
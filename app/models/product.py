@@ -1,15 +1,20 @@
 # ============================================
 # ARCHIVO: app/models/product.py
 # ============================================
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from app.core.database import Base
+from app.core.text import search_key, alias_search_keys
 
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Destino del INSERT ... ON CONFLICT de la importación masiva
+        UniqueConstraint("store_id", "name", name="uq_products_store_name"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     store_id = Column(Integer, ForeignKey("stores.id"), nullable=False)
@@ -20,6 +25,11 @@ class Product(Base):
     aliases = Column(ARRAY(String), default=list)  # ["inka", "kola amarilla"]
     category = Column(String(100), nullable=True, index=True)
     
+    # Claves de búsqueda (minúsculas, sin tildes, en singular); se
+    # mantienen solas al asignar name / aliases
+    search_name = Column(String(200), nullable=True)
+    search_aliases = Column(ARRAY(String), default=list)
+    
     # Precios
     cost_price = Column(Float, default=0)
     sale_price = Column(Float, nullable=False)
@@ -37,4 +47,14 @@ class Product(Base):
     
     # Relaciones
     store = relationship("Store", back_populates="products")
-    sale_items = relationship("SaleItem", back_populates="product")
\ No newline at end of file
+    sale_items = relationship("SaleItem", back_populates="product")
+    
+    @validates('name')
+    def _set_search_name(self, key, value):
+        self.search_name = search_key(value)
+        return value
+    
+    @validates('aliases')
+    def _set_search_aliases(self, key, value):
+        self.search_aliases = alias_search_keys(value)
+        return value
@@ -1,7 +1,7 @@
 # ============================================
 # ARCHIVO: app/models/sale.py
 # ============================================
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -9,6 +9,10 @@ from app.core.database import Base
 
 class Sale(Base):
     __tablename__ = "sales"
+    __table_args__ = (
+        # Historial paginado por cursor: WHERE store_id = ? AND (sale_date, id) < (?, ?)
+        Index("ix_sales_store_date_id", "store_id", "sale_date", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     store_id = Column(Integer, ForeignKey("stores.id"), nullable=False)
@@ -49,4 +53,17 @@ class SaleItem(Base):
     
     # Relaciones
     sale = relationship("Sale", back_populates="items")
-    product = relationship("Product", back_populates="sale_items")
\ No newline at end of file
+    product = relationship("Product", back_populates="sale_items")
+
+class SaleIdempotencyKey(Base):
+    """Clave Idempotency-Key de un POST de venta (se guarda SALE_IDEMPOTENCY_TTL_HOURS)"""
+    __tablename__ = "sale_idempotency_keys"
+    
+    store_id = Column(Integer, ForeignKey("stores.id"), primary_key=True)
+    key = Column(String(100), primary_key=True)
+    sale_id = Column(Integer, ForeignKey("sales.id", ondelete="CASCADE"), nullable=False)
+    
+    # Huella del cuerpo del request: la misma clave con otra venta es un error
+    request_hash = Column(String(64), nullable=False)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
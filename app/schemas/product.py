@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Literal, Optional, List
 from datetime import datetime
 
 class ProductBase(BaseModel):
@@ -26,4 +26,74 @@ class ProductResponse(ProductBase):
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ProductImportRow(BaseModel):
+    """Fila de una importación masiva (CSV o JSON)"""
+    name: str = Field(..., min_length=1, max_length=200)
+    aliases: List[str] = []
+    category: Optional[str] = Field(None, max_length=100)
+    unit: str = Field("unidad", max_length=20)
+    cost_price: float = Field(0, ge=0)
+    sale_price: float = Field(..., ge=0)
+    stock: int = 0
+    min_stock_alert: int = Field(5, ge=0)
+    is_active: bool = True
+
+    @field_validator('name', 'category', 'unit', mode='before')
+    @classmethod
+    def _strip(cls, value):
+        return value.strip() if isinstance(value, str) else value
+
+    @field_validator('aliases', mode='before')
+    @classmethod
+    def _split_aliases(cls, value):
+        # En CSV los aliases vienen en una celda: "inka, kola amarilla"
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [a.strip() for a in value.split(',') if a.strip()]
+        return value
+
+
+# Campos que se pueden cambiar en bloque
+PRODUCT_BULK_FIELDS = ("sale_price", "cost_price", "stock", "min_stock_alert")
+
+
+class ProductBulkChange(BaseModel):
+    """Cambio explícito de un producto, por ID o por nombre exacto"""
+    id: Optional[int] = None
+    name: Optional[str] = None
+    sale_price: Optional[float] = Field(None, ge=0)
+    cost_price: Optional[float] = Field(None, ge=0)
+    stock: Optional[int] = None
+    min_stock_alert: Optional[int] = Field(None, ge=0)
+
+    @model_validator(mode='after')
+    def _check(self):
+        if self.id is None and not self.name:
+            raise ValueError("Indica id o name del producto")
+        if all(getattr(self, f) is None for f in PRODUCT_BULK_FIELDS):
+            raise ValueError("Indica al menos un campo a cambiar")
+        return self
+
+
+class ProductPriceRule(BaseModel):
+    """Ajuste de precio para todos los productos activos de una categoría (o de la tienda)"""
+    category: Optional[str] = None  # None = todos
+    field: Literal["sale_price", "cost_price"] = "sale_price"
+    percent: Optional[float] = Field(None, gt=-100)  # +5 = sube 5%
+    amount: Optional[float] = None  # +0.50 = sube 50 céntimos
+    round_to: Optional[float] = Field(None, gt=0)  # 0.10 = redondear a 10 céntimos
+
+    @model_validator(mode='after')
+    def _check(self):
+        if (self.percent is None) == (self.amount is None):
+            raise ValueError("Indica percent o amount (solo uno)")
+        return self
+
+
+class ProductBulkUpdate(BaseModel):
+    """Las reglas se aplican primero; los cambios explícitos mandan sobre ellas"""
+    changes: List[ProductBulkChange] = []
+    rules: List[ProductPriceRule] = []
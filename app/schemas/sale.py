@@ -9,7 +9,8 @@ class SaleItemCreate(BaseModel):
     subtotal: float
 
 class SaleCreate(BaseModel):
-    items: List[SaleItemCreate]
+    items: List[SaleItemCreate] = []  # vacío si se cobra un carrito del servidor
+    cart_id: Optional[str] = None
     payment_method: str  # efectivo, yape, plin
     payment_reference: Optional[str] = None
     customer_name: Optional[str] = None
@@ -43,4 +44,25 @@ class SaleResponse(BaseModel):
     user_name: str  # Lo agregamos en el service
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class SalePage(BaseModel):
+    sales: List[SaleResponse]
+    next_cursor: Optional[str] = None  # None = no hay más antiguas
+
+class OfflineSale(BaseModel):
+    """Venta hecha sin conexión, guardada en el dispositivo hasta sincronizar"""
+    client_id: str = Field(..., min_length=1, max_length=100)  # se usa como Idempotency-Key
+    created_at: Optional[datetime] = None  # cuándo se vendió en el dispositivo
+    items: List[SaleItemCreate] = Field(..., min_length=1)
+    payment_method: str
+    payment_reference: Optional[str] = None
+    customer_name: Optional[str] = None
+    is_credit: bool = False
+    
+    def to_sale_create(self) -> SaleCreate:
+        """La misma venta como POST /api/sales (misma huella de idempotencia)"""
+        return SaleCreate(**self.model_dump(exclude={"client_id", "created_at"}))
+
+class SaleSyncRequest(BaseModel):
+    sales: List[OfflineSale] = Field(..., min_length=1)
@@ -0,0 +1,239 @@
+"""
+Carritos de venta guardados en el servidor
+
+Cada usuario/dispositivo abre un carrito que vive en memoria mientras se
+use (vence a los CART_TTL segundos sin actividad). Los comandos de voz que
+traen cart_id se resuelven primero contra los pocos productos del carrito
+("quita el pan", "otro", cambios de precio o de producto) y su resultado
+se aplica al carrito; POST /api/sales puede cobrar el carrito por su ID.
+"""
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from cachetools import TTLCache
+from app.core.config import settings
+
+
+@dataclass
+class CartItem:
+    product_id: int
+    name: str
+    quantity: float
+    unit_price: float
+
+    @property
+    def subtotal(self) -> float:
+        return round(self.quantity * self.unit_price, 2)
+
+    def to_dict(self) -> Dict:
+        return {
+            "product_id": self.product_id,
+            "name": self.name,
+            "quantity": self.quantity,
+            "unit_price": self.unit_price,
+            "subtotal": self.subtotal
+        }
+
+
+@dataclass
+class Cart:
+    """
+    Carrito de un usuario en una tienda
+
+    Los items van en el orden en que se agregaron (el último es al que se
+    refiere "otro"). revision sube con cada cambio.
+    """
+    id: str
+    store_id: int
+    user_id: int
+    device_id: Optional[str] = None
+    items: Dict[int, CartItem] = field(default_factory=dict)
+    revision: int = 0
+
+    @property
+    def product_ids(self) -> List[int]:
+        return list(self.items)
+
+    @property
+    def last_item(self) -> Optional[CartItem]:
+        if not self.items:
+            return None
+        return next(reversed(self.items.values()))
+
+    @property
+    def total(self) -> float:
+        return round(sum(item.subtotal for item in self.items.values()), 2)
+
+    def add(self, product_id: int, name: str, quantity: float, unit_price: float) -> None:
+        """Sumar cantidad (el producto pasa al final, como el último agregado)"""
+        item = self.items.pop(product_id, None)
+        if item is None:
+            item = CartItem(product_id, name, 0.0, unit_price)
+        item.quantity += quantity
+        self.items[product_id] = item
+        self.revision += 1
+
+    def remove(self, product_id: int) -> bool:
+        if self.items.pop(product_id, None) is None:
+            return False
+        self.revision += 1
+        return True
+
+    def set_price(self, product_id: int, unit_price: float) -> bool:
+        item = self.items.get(product_id)
+        if item is None:
+            return False
+        item.unit_price = unit_price
+        self.revision += 1
+        return True
+
+    def replace(self, old_product_id: int, product_id: int, name: str, unit_price: float) -> bool:
+        """Cambiar un producto por otro manteniendo la cantidad y la posición"""
+        old = self.items.get(old_product_id)
+        if old is None:
+            return False
+
+        # Si el nuevo ya estaba en el carrito, se juntan las cantidades
+        quantity = old.quantity
+        if product_id != old_product_id and product_id in self.items:
+            quantity += self.items.pop(product_id).quantity
+
+        new = CartItem(product_id, name, quantity, unit_price)
+        self.items = {
+            (product_id if pid == old_product_id else pid): (new if pid == old_product_id else item)
+            for pid, item in self.items.items()
+        }
+        self.revision += 1
+        return True
+
+    def clear(self) -> None:
+        if self.items:
+            self.items = {}
+            self.revision += 1
+
+    def set_items(self, items: Iterable[Tuple[int, str, float, float]]) -> None:
+        """Reemplazar el contenido con (product_id, nombre, cantidad, precio)"""
+        self.items = {}
+        for product_id, name, quantity, unit_price in items:
+            item = self.items.get(product_id)
+            if item is None:
+                self.items[product_id] = CartItem(product_id, name, quantity, unit_price)
+            else:
+                item.quantity += quantity
+        self.revision += 1
+
+    def apply(self, result: Dict) -> None:
+        """
+        Aplicar al carrito la respuesta resuelta de un comando de voz
+
+        Replica lo que hace el navegador con la respuesta: "sale" reemplaza
+        el carrito, "add" suma, "cancel" lo vacía. Las respuestas ambiguas
+        o de error no cambian nada.
+        """
+        kind = result.get('type')
+
+        if kind == 'cancel':
+            self.clear()
+        elif kind in ('sale', 'add'):
+            if kind == 'sale':
+                self.clear()
+            for item in result['items']:
+                product = item['product']
+                self.add(product['id'], product['name'], item['quantity'], product['price'])
+        elif kind == 'remove':
+            self.remove(result['product']['id'])
+        elif kind == 'change_price':
+            self.set_price(result['product']['id'], result['new_price'])
+        elif kind == 'change_product':
+            new = result['new_product']
+            self.replace(result['old_product']['id'], new['id'], new['name'], new['price'])
+
+    def context(self) -> List[Dict]:
+        """Items con nombre y cantidad, para dar contexto al LLM"""
+        return [
+            {"product_name": item.name, "quantity": item.quantity}
+            for item in self.items.values()
+        ]
+
+    def sale_items(self) -> List[Dict]:
+        """Items en el formato de SaleItemCreate"""
+        return [
+            {
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "subtotal": item.subtotal
+            }
+            for item in self.items.values()
+        ]
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "device_id": self.device_id,
+            "revision": self.revision,
+            "items": [item.to_dict() for item in self.items.values()],
+            "total": self.total
+        }
+
+
+class CartStore:
+    """
+    Carritos en memoria con expiración por inactividad
+
+    Un carrito solo lo ve el usuario que lo abrió, en su tienda. Con
+    device_id, abrir de nuevo desde el mismo dispositivo devuelve el
+    carrito que seguía vivo.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._carts: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._devices: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def open(self, store_id: int, user_id: int, device_id: Optional[str] = None) -> Cart:
+        """Retomar el carrito del dispositivo o abrir uno nuevo"""
+        with self._lock:
+            if device_id:
+                cart = self._carts.get(self._devices.get((store_id, user_id, device_id)))
+                if cart is not None:
+                    self._touch(cart)
+                    return cart
+
+            cart = Cart(id=uuid.uuid4().hex, store_id=store_id, user_id=user_id, device_id=device_id)
+            self._touch(cart)
+            return cart
+
+    def get(self, cart_id: str, store_id: int, user_id: int) -> Optional[Cart]:
+        """Obtener un carrito del usuario (None si no existe, venció o es de otro)"""
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart is None or cart.store_id != store_id or cart.user_id != user_id:
+                return None
+            self._touch(cart)
+            return cart
+
+    def discard(self, cart: Cart) -> None:
+        with self._lock:
+            self._carts.pop(cart.id, None)
+            if cart.device_id:
+                self._devices.pop((cart.store_id, cart.user_id, cart.device_id), None)
+
+    def _touch(self, cart: Cart) -> None:
+        # Volver a guardar reinicia el TTL
+        self._carts[cart.id] = cart
+        if cart.device_id:
+            self._devices[(cart.store_id, cart.user_id, cart.device_id)] = cart.id
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": len(self._carts),
+                "maxsize": self._carts.maxsize,
+                "ttl": self._carts.ttl
+            }
+
+
+# Instancia global
+cart_store = CartStore(maxsize=settings.CART_MAX_SESSIONS, ttl=settings.CART_TTL)
@@ -0,0 +1,235 @@
+"""
+Caché en memoria del catálogo de productos activos por tienda
+
+ProductService.get_products_by_store lee de aquí: la BD se consulta solo
+la primera vez (o cuando vence CATALOG_CACHE_TTL, que acota lo que puede
+quedar viejo si otro proceso escribe). Cada tienda guarda filas compactas
+e inmutables (CatalogProduct) ordenadas por nombre y una versión que sube
+con cada cambio. Crear, editar o desactivar productos y los cambios de
+stock de las ventas parchean la caché en vez de descartarla.
+
+Cada catálogo lleva también sus productos agotados o con poco stock: se
+calculan al cargarlo y después cada parche actualiza solo las filas que
+tocó, así que las alertas no recorren el catálogo.
+"""
+import hashlib
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.core.text import search_key, alias_search_keys
+
+
+@dataclass(frozen=True)
+class CatalogProduct:
+    """Fila de solo lectura de un producto (lo que necesitan voz y listados)"""
+    id: int
+    store_id: int
+    name: str
+    aliases: Tuple[str, ...]
+    search_name: str
+    search_aliases: Tuple[str, ...]
+    category: Optional[str]
+    unit: str
+    cost_price: float
+    sale_price: float
+    stock: int
+    min_stock_alert: Optional[int]
+    is_active: bool
+
+    @classmethod
+    def from_model(cls, product) -> "CatalogProduct":
+        aliases = getattr(product, 'aliases', None) or ()
+        if isinstance(aliases, str):
+            aliases = [a.strip() for a in aliases.split(',') if a.strip()]
+        return cls(
+            id=product.id,
+            store_id=product.store_id,
+            name=product.name,
+            aliases=tuple(aliases),
+            search_name=getattr(product, 'search_name', None) or search_key(product.name),
+            search_aliases=tuple(getattr(product, 'search_aliases', None) or alias_search_keys(aliases)),
+            category=getattr(product, 'category', None),
+            unit=getattr(product, 'unit', None) or 'unidad',
+            cost_price=getattr(product, 'cost_price', None) or 0.0,
+            sale_price=product.sale_price,
+            stock=product.stock or 0,
+            min_stock_alert=getattr(product, 'min_stock_alert', None),
+            is_active=bool(getattr(product, 'is_active', True))
+        )
+
+    @property
+    def is_out_of_stock(self) -> bool:
+        return self.stock <= 0
+
+    @property
+    def is_low_stock(self) -> bool:
+        """Agotado o en su mínimo de alerta (o por debajo)"""
+        return self.is_out_of_stock or bool(self.min_stock_alert and self.stock <= self.min_stock_alert)
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Catálogo de una tienda en una versión dada"""
+    store_id: int
+    version: int
+    products: Tuple[CatalogProduct, ...]
+    loaded_at: float
+    # Agotados o con poco stock (por ID) y su huella (ver low_stock_tag)
+    low_stock: Dict[int, CatalogProduct] = field(default_factory=dict)
+    low_stock_tag: str = ""
+
+
+def low_stock_tag(low_stock: Dict[int, CatalogProduct]) -> str:
+    """
+    Huella de la lista de poco stock (lo que muestra /stats/today)
+
+    Sale solo de los datos, así que todos los procesos que tienen las mismas
+    filas dan la misma huella: el cliente puede comparar con cualquiera.
+    """
+    rows = sorted((p.id, p.name, max(p.stock, 0)) for p in low_stock.values())
+    return hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+
+
+class CatalogCache:
+    """
+    Catálogos por tienda (uno por proceso)
+
+    Las versiones salen de un contador global, así que nunca se repiten
+    aunque una tienda se descarte y se vuelva a cargar.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._stores: Dict[int, CatalogSnapshot] = {}
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, store_id: int, load: Callable[[], Iterable]) -> CatalogSnapshot:
+        """
+        Catálogo de la tienda, cargándolo con `load` si no está o venció
+
+        Args:
+            store_id: ID de la tienda
+            load: Función que devuelve los productos activos desde la BD
+        """
+        snapshot = self.peek(store_id)
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        self.misses += 1
+        rows = [CatalogProduct.from_model(p) for p in load()]
+        with self._lock:
+            snapshot = self._store(store_id, rows)
+        print(f"[CatalogCache] Tienda {store_id}: {len(rows)} productos (versión {snapshot.version})")
+        return snapshot
+
+    def peek(self, store_id: int) -> Optional[CatalogSnapshot]:
+        """Catálogo vigente de la tienda, sin cargarlo"""
+        snapshot = self._stores.get(store_id)
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.ttl:
+            return None
+        return snapshot
+
+    def upsert(self, product) -> None:
+        """Agregar o actualizar un producto (lo quita si quedó inactivo)"""
+        row = CatalogProduct.from_model(product)
+        with self._lock:
+            snapshot = self._stores.get(row.store_id)
+            if snapshot is None:
+                return
+            rows = [p for p in snapshot.products if p.id != row.id]
+            if row.is_active:
+                rows.append(row)
+            self._store(row.store_id, rows, snapshot.loaded_at, {row.id: row if row.is_active else None})
+
+    def remove(self, store_id: int, product_id: int) -> None:
+        with self._lock:
+            snapshot = self._stores.get(store_id)
+            if snapshot is None:
+                return
+            rows = [p for p in snapshot.products if p.id != product_id]
+            if len(rows) != len(snapshot.products):
+                self._store(store_id, rows, snapshot.loaded_at, {product_id: None})
+
+    def update_fields(self, store_id: int, changes: Dict[int, Dict[str, Any]]) -> None:
+        """Cambiar campos de varios productos a la vez (una sola versión nueva)"""
+        with self._lock:
+            snapshot = self._stores.get(store_id)
+            if snapshot is None or not changes:
+                return
+            changed = {
+                p.id: replace(p, **changes[p.id])
+                for p in snapshot.products if p.id in changes
+            }
+            self._patch(snapshot, changed)
+
+    def invalidate(self, store_id: int) -> None:
+        """Descartar el catálogo de una tienda (se recarga al leerlo)"""
+        with self._lock:
+            self._stores.pop(store_id, None)
+
+    def _patch(self, snapshot: CatalogSnapshot, changed: Dict[int, CatalogProduct]) -> None:
+        """Reemplazar filas ya existentes del catálogo"""
+        rows = [changed.get(p.id, p) for p in snapshot.products]
+        self._store(snapshot.store_id, rows, snapshot.loaded_at, changed)
+
+    def _store(
+        self,
+        store_id: int,
+        rows: List[CatalogProduct],
+        loaded_at: Optional[float] = None,
+        changed: Optional[Dict[int, Optional[CatalogProduct]]] = None
+    ) -> CatalogSnapshot:
+        """
+        Guardar una nueva versión del catálogo
+
+        Args:
+            changed: Filas que cambiaron respecto a la versión anterior
+                (None = quitada); sin esto el poco stock se recalcula entero
+        """
+        rows.sort(key=lambda p: p.name)
+        previous = self._stores.get(store_id)
+
+        if previous is not None and changed is not None:
+            low_stock = dict(previous.low_stock)
+            for product_id, row in changed.items():
+                if row is not None and row.is_low_stock:
+                    low_stock[product_id] = row
+                else:
+                    low_stock.pop(product_id, None)
+            moved = any(previous.low_stock.get(pid) != low_stock.get(pid) for pid in changed)
+        else:
+            low_stock = {p.id: p for p in rows if p.is_low_stock}
+            moved = previous is None or previous.low_stock != low_stock
+
+        snapshot = CatalogSnapshot(
+            store_id=store_id,
+            version=next(self._versions),
+            products=tuple(rows),
+            loaded_at=time.monotonic() if loaded_at is None else loaded_at,
+            low_stock=low_stock,
+            low_stock_tag=low_stock_tag(low_stock) if moved else previous.low_stock_tag
+        )
+        self._stores[store_id] = snapshot
+        return snapshot
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "stores": len(self._stores),
+            "products": sum(len(s.products) for s in self._stores.values()),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Instancia global
+catalog_cache = CatalogCache(ttl=settings.CATALOG_CACHE_TTL)
@@ -0,0 +1,306 @@
+"""
+Aliases aprendidos de las elecciones del cajero
+
+Cuando un producto dictado es ambiguo y el cajero elige una opción, se
+guarda (tienda, clave de búsqueda del query) -> producto. Después de
+LEARNED_ALIAS_MIN_HITS elecciones iguales seguidas, find_product_fuzzy lo
+resuelve directo, sin puntuar el catálogo. Los que no se usan en
+LEARNED_ALIAS_TTL_DAYS días caducan, y cada tienda guarda en memoria a lo
+sumo LEARNED_ALIAS_MAX_PER_STORE (se descartan los menos usados). El
+último uso se guarda en la BD con a lo sumo LEARNED_ALIAS_TOUCH_HOURS de
+atraso, para que un alias que se usa sin volver a elegirlo no caduque al
+reiniciar.
+"""
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.learned_alias import LearnedAlias
+from app.models.product import Product
+from app.core.text import search_key
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class LearnedAliasEntry:
+    product_id: int
+    hits: int
+    last_used_at: datetime
+    stored_at: datetime  # last_used_at que tiene la BD
+
+
+class LearnedAliasCache:
+    """
+    Aliases aprendidos en memoria, por tienda
+    
+    Cada tienda se carga desde la BD con sync(), que se llama al cargar su
+    catálogo (ProductService.get_catalog); lookup() nunca va a la BD, así
+    que el matcher no agrega consultas por comando. El orden de cada tienda
+    es LRU (lo último usado al final). Las claves son search_key del query,
+    igual que en el índice de productos.
+    """
+    
+    def __init__(
+        self,
+        max_per_store: int,
+        ttl_days: int,
+        min_hits: int,
+        retry_seconds: float,
+        touch_hours: int
+    ):
+        self.max_per_store = max_per_store
+        self.ttl = timedelta(days=ttl_days)
+        self.min_hits = min_hits
+        self.retry_seconds = retry_seconds
+        self.touch_interval = timedelta(hours=touch_hours)
+        self._stores: Dict[int, "OrderedDict[str, LearnedAliasEntry]"] = {}
+        self._retry_at: Dict[int, float] = {}  # tiendas que fallaron al cargar
+        self._lock = threading.Lock()
+    
+    def _loaded(self, store_id: int) -> bool:
+        return store_id in self._stores and store_id not in self._retry_at
+    
+    def sync(self, store_id: int) -> None:
+        """
+        Cargar la tienda desde la BD si aún no está (o guardar sus usos si ya)
+        
+        La consulta va fuera del lock, para no frenar a las demás tiendas.
+        Si falla, la tienda queda vacía (sin aliases aprendidos) y no se
+        vuelve a intentar hasta pasados retry_seconds.
+        """
+        if self._loaded(store_id):
+            self.flush_usage(store_id)
+            return
+        if time.monotonic() < self._retry_at.get(store_id, 0):
+            return
+        
+        db = SessionLocal()
+        try:
+            rows = LearnedAliasService(db).get_active_aliases(store_id)
+        except Exception as e:
+            print(f"[LearnedAlias] Error al cargar tienda {store_id}: {e} (reintento en {self.retry_seconds}s)")
+            with self._lock:
+                self._stores.setdefault(store_id, OrderedDict())
+                self._retry_at[store_id] = time.monotonic() + self.retry_seconds
+            return
+        finally:
+            db.close()
+        
+        with self._lock:
+            # Otro hilo pudo cargarla mientras tanto
+            if self._loaded(store_id):
+                return
+            entries = self._load(store_id, rows)
+        print(f"[LearnedAlias] Tienda {store_id}: {len(entries)} aliases aprendidos")
+    
+    def _load(self, store_id: int, rows: Iterable) -> "OrderedDict[str, LearnedAliasEntry]":
+        entries = OrderedDict()
+        for row in sorted(rows, key=lambda r: r.last_used_at or _now()):
+            used_at = row.last_used_at or _now()
+            entries[row.query] = LearnedAliasEntry(row.product_id, row.hits, used_at, used_at)
+        self._stores[store_id] = entries
+        self._retry_at.pop(store_id, None)
+        self._evict(entries)
+        return entries
+    
+    def load(self, store_id: int, rows: Iterable = ()) -> None:
+        """Cargar los aliases de una tienda sin ir a la BD (p. ej. benchmarks)"""
+        with self._lock:
+            self._load(store_id, rows)
+    
+    def flush_usage(self, store_id: int) -> None:
+        """
+        Guardar en la BD el último uso de los aliases de una tienda
+        
+        lookup() lo actualiza solo en memoria. Se guardan, en un solo UPDATE,
+        los que la BD tiene atrasados más de touch_interval.
+        """
+        with self._lock:
+            entries = self._stores.get(store_id) or {}
+            used = {
+                query: entry.last_used_at
+                for query, entry in entries.items()
+                if entry.last_used_at - entry.stored_at > self.touch_interval
+            }
+        if not used:
+            return
+        
+        db = SessionLocal()
+        try:
+            LearnedAliasService(db).save_usage(store_id, used)
+        except Exception as e:
+            print(f"[LearnedAlias] Error al guardar usos de tienda {store_id}: {e}")
+            return
+        finally:
+            db.close()
+        
+        with self._lock:
+            for query, used_at in used.items():
+                entry = entries.get(query)
+                if entry is not None and entry.stored_at < used_at:
+                    entry.stored_at = used_at
+        print(f"[LearnedAlias] Tienda {store_id}: {len(used)} usos guardados")
+    
+    def flush_all(self) -> None:
+        """Guardar los usos de todas las tiendas cargadas (p. ej. al apagar)"""
+        for store_id in list(self._stores):
+            self.flush_usage(store_id)
+    
+    def _evict(self, entries: "OrderedDict[str, LearnedAliasEntry]") -> None:
+        while len(entries) > self.max_per_store:
+            entries.popitem(last=False)
+    
+    def lookup(self, store_id: int, query: str) -> Optional[int]:
+        """Producto aprendido para el query (None si no hay, caducó o la tienda no se cargó)"""
+        query = search_key(query)
+        with self._lock:
+            entries = self._stores.get(store_id)
+            entry = entries.get(query) if entries is not None else None
+            if entry is None:
+                return None
+            
+            now = _now()
+            if now - entry.last_used_at > self.ttl:
+                del entries[query]
+                return None
+            if entry.hits < self.min_hits:
+                return None
+            
+            entry.last_used_at = now
+            entries.move_to_end(query)
+            return entry.product_id
+    
+    def remember(self, store_id: int, query: str, product_id: int, hits: int) -> None:
+        """Guardar (o reemplazar) lo que se aprendió para un query"""
+        query = search_key(query)
+        with self._lock:
+            entries = self._stores.get(store_id)
+            if entries is None:
+                # La tienda aún no se cargó; ya está en la BD para cuando se cargue
+                return
+            now = _now()
+            entries[query] = LearnedAliasEntry(product_id, hits, now, now)
+            entries.move_to_end(query)
+            self._evict(entries)
+    
+    def forget(self, store_id: int, query: str) -> None:
+        """Olvidar lo aprendido para un query"""
+        query = search_key(query)
+        with self._lock:
+            entries = self._stores.get(store_id)
+            if entries:
+                entries.pop(query, None)
+
+
+class LearnedAliasService:
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def get_active_aliases(self, store_id: int) -> List[LearnedAlias]:
+        """Aliases aprendidos de una tienda que aún no caducan"""
+        cutoff = _now() - timedelta(days=settings.LEARNED_ALIAS_TTL_DAYS)
+        return self.db.query(LearnedAlias).filter(
+            LearnedAlias.store_id == store_id,
+            LearnedAlias.last_used_at >= cutoff
+        ).all()
+    
+    def save_usage(self, store_id: int, used: Dict[str, datetime]) -> None:
+        """
+        Guardar el último uso de varios aliases de una tienda (un solo UPDATE)
+        
+        Solo adelanta last_used_at: si otro proceso lo guardó más nuevo, se
+        deja el suyo.
+        """
+        table = LearnedAlias.__table__
+        self.db.execute(
+            update(table)
+            .where(
+                table.c.store_id == store_id,
+                table.c.query == bindparam('alias_query'),
+                table.c.last_used_at < bindparam('used_at')
+            )
+            .values(last_used_at=bindparam('used_at')),
+            [{'alias_query': query, 'used_at': used_at} for query, used_at in used.items()]
+        )
+        self.db.commit()
+    
+    def record_choice(self, store_id: int, query: str, product_id: int) -> LearnedAlias:
+        """
+        Registrar el producto que eligió el cajero para un query ambiguo
+        
+        Si se vuelve a elegir el mismo producto suma un acierto; si elige
+        otro, el alias pasa a ese producto y vuelve a empezar.
+        
+        Raises:
+            ValueError: Si el query está vacío o el producto no es de la tienda
+        """
+        query = search_key(query)
+        if not query:
+            raise ValueError("El texto a aprender está vacío")
+        
+        product = self.db.query(Product).filter(
+            Product.id == product_id,
+            Product.store_id == store_id,
+            Product.is_active == True
+        ).first()
+        if not product:
+            raise ValueError("Producto no encontrado")
+        
+        alias = self.db.query(LearnedAlias).filter(
+            LearnedAlias.store_id == store_id,
+            LearnedAlias.query == query
+        ).first()
+        
+        expired = (
+            alias is not None
+            and alias.last_used_at is not None
+            and _now() - alias.last_used_at > timedelta(days=settings.LEARNED_ALIAS_TTL_DAYS)
+        )
+        
+        if alias is None:
+            alias = LearnedAlias(store_id=store_id, query=query, product_id=product_id, hits=1)
+            self.db.add(alias)
+        elif alias.product_id == product_id and not expired:
+            alias.hits += 1
+        else:
+            alias.product_id = product_id
+            alias.hits = 1
+        alias.last_used_at = _now()
+        
+        self.db.commit()
+        self.db.refresh(alias)
+        
+        learned_alias_cache.remember(store_id, query, product_id, alias.hits)
+        print(f"[LearnedAlias] '{query}' → {product.name} ({alias.hits} elecciones)")
+        return alias
+    
+    def forget(self, store_id: int, query: str) -> bool:
+        """Borrar lo aprendido para un query (p. ej. si se aprendió mal)"""
+        query = search_key(query)
+        deleted = self.db.query(LearnedAlias).filter(
+            LearnedAlias.store_id == store_id,
+            LearnedAlias.query == query
+        ).delete()
+        self.db.commit()
+        
+        learned_alias_cache.forget(store_id, query)
+        return deleted > 0
+
+
+# Instancia global
+learned_alias_cache = LearnedAliasCache(
+    max_per_store=settings.LEARNED_ALIAS_MAX_PER_STORE,
+    ttl_days=settings.LEARNED_ALIAS_TTL_DAYS,
+    min_hits=settings.LEARNED_ALIAS_MIN_HITS,
+    retry_seconds=settings.LEARNED_ALIAS_RETRY_SECONDS,
+    touch_hours=settings.LEARNED_ALIAS_TOUCH_HOURS
+)
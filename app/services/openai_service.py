@@ -1,37 +1,23 @@
-# app/services/openai_service.py - CREAR ESTE ARCHIVO
+"""
+Parser de respaldo con LLM para comandos de voz
 
-import os
-from openai import OpenAI
-from typing import Dict, Optional
+Solo se usa cuando el parser local no entiende el comando. La llamada es
+asíncrona de verdad (no bloquea el event loop de uvicorn), tiene un
+presupuesto de tiempo fijo, un tope de llamadas simultáneas y una caché
+de texto normalizado -> comando parseado.
+
+El backend es intercambiable: OpenAIBackend en producción y LocalBackend
+(una función local, con demora opcional) para probar sin red.
+"""
+import asyncio
 import json
-from fastapi  import HTTPException
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+from app.core.config import settings
+from app.core.text import normalize_text
+from app.services.voice_cache import VoiceCache
 
-class OpenAIService:
-    
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
-    @staticmethod
-    async def parse_command_with_context(text: str, cart_context: list = None) -> Optional[Dict]:
-        """
-        Parsear comando usando OpenAI GPT-4o-mini con contexto del carrito
-        
-        Args:
-            text: Texto del comando
-            cart_context: Lista de items en el carrito actual
-        
-        Returns:
-            Dict con el comando parseado en el mismo formato que VoiceService.parse_command()
-        """
-        
-        # Construir contexto del carrito
-        cart_str = ""
-        if cart_context:
-            cart_str = "Carrito actual:\n"
-            for item in cart_context:
-                cart_str += f"- {item['product_name']}: {item['quantity']} unidades\n"
-        
-        # Prompt para OpenAI
-        system_prompt = """Eres un asistente para bodegas en Perú que interpreta comandos de voz.
+SYSTEM_PROMPT = """Eres un asistente para bodegas en Perú que interpreta comandos de voz.
 
 Tu trabajo es convertir comandos naturales en JSON estructurado.
 
@@ -60,73 +46,250 @@ REGLAS:
 - Si dice "otro/otra" o "más", usa el último producto del carrito
 - Responde SOLO con JSON válido, sin explicaciones"""
 
-        user_prompt = f"""{cart_str}
+
+def build_user_prompt(text: str, cart_context: List[Dict]) -> str:
+    """Prompt con el carrito actual y el comando"""
+    cart_str = ""
+    if cart_context:
+        cart_str = "Carrito actual:\n"
+        for item in cart_context:
+            cart_str += f"- {item['product_name']}: {item['quantity']} unidades\n"
+    
+    return f"""{cart_str}
 
 Comando: "{text}"
 
 Interpreta este comando y responde en JSON:"""
 
-        try:
-            response = OpenAIService.client.chat.completions.create(
-                model="gpt-4o-mini",  # Modelo más barato y rápido
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,  # Baja temperatura para más consistencia
-                max_tokens=200
-            )
-            
-            result_text = response.choices[0].message.content.strip()
-            
-            # Limpiar markdown si viene con ```json
-            if result_text.startswith("```"):
-                result_text = result_text.split("```")[1]
-                if result_text.startswith("json"):
-                    result_text = result_text[4:]
-            
-            parsed = json.loads(result_text)
-            
-            print(f"[OpenAI] ✅ Comando parseado: {text} → {parsed['type']}")
-            
-            return parsed
-            
-        except Exception as e:
-            print(f"[OpenAI] ❌ Error: {e}")
-            return None
 
+# ========================================
+# BACKENDS
+# ========================================
+class LLMBackend(ABC):
+    """Interfaz de un backend: recibe el comando y devuelve texto JSON"""
+    
+    name = "base"
+    
+    @abstractmethod
+    async def complete(self, text: str, cart_context: List[Dict]) -> str:
+        """Respuesta del LLM (texto JSON) para el comando y el carrito"""
 
-# En app/api/v1/sales.py - MODIFICAR parse_voice_command
 
-from app.services.openai_service import OpenAIService
+class OpenAIBackend(LLMBackend):
+    """Backend con la API de OpenAI (cliente asíncrono)"""
+    
+    name = "openai"
+    
+    def __init__(self, api_key: str, model: str):
+        self.api_key = api_key
+        self.model = model
+        self._client = None
+    
+    def _get_client(self):
+        if self._client is None:
+            # Import perezoso: el paquete openai solo hace falta si se usa
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        return self._client
+    
+    async def complete(self, text: str, cart_context: List[Dict]) -> str:
+        response = await self._get_client().chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": build_user_prompt(text, cart_context)}
+            ],
+            temperature=0.1,  # Baja temperatura para más consistencia
+            max_tokens=200
+        )
+        return response.choices[0].message.content
+
+
+class LocalBackend(LLMBackend):
+    """
+    Backend local para pruebas sin red
+    
+    Args:
+        handler: Función (texto, carrito) -> dict con el comando o None
+        delay: Segundos de espera simulada por llamada
+    """
+    
+    name = "local"
+    
+    def __init__(self, handler: Callable[[str, List[Dict]], Optional[Dict]], delay: float = 0.0):
+        self.handler = handler
+        self.delay = delay
+    
+    async def complete(self, text: str, cart_context: List[Dict]) -> str:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return json.dumps(self.handler(text, cart_context))
+
 
-@router.post("/voice/parse")
-async def parse_voice_command(
-    command: VoiceCommandRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Parsear comando de voz con fallback a OpenAI"""
+# ========================================
+# SERVICIO
+# ========================================
+class OpenAIService:
+    """Fallback de parseo con LLM: presupuesto de tiempo, tope de concurrencia y caché"""
+    
+    def __init__(
+        self,
+        backend: Optional[LLMBackend] = None,
+        timeout: float = settings.OPENAI_TIMEOUT,
+        max_concurrency: int = settings.OPENAI_MAX_CONCURRENCY
+    ):
+        self.backend = backend
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.cache = VoiceCache(
+            "llm",
+            maxsize=settings.OPENAI_CACHE_SIZE,
+            ttl=settings.OPENAI_CACHE_TTL
+        )
+        self.timeouts = 0
+        self.errors = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
     
-    # 1. Intentar con parser local
-    parsed = VoiceService.parse_command(command.text)
+    def set_backend(self, backend: Optional[LLMBackend]) -> None:
+        """Cambiar el backend (p. ej. LocalBackend en pruebas) y vaciar la caché"""
+        self.backend = backend
+        self.cache.clear()
     
-    # 2. Si falla, intentar con OpenAI (si está habilitado)
-    if not parsed and os.getenv("OPENAI_API_KEY"):
-        print("[VoiceParser] Parser local falló, intentando con OpenAI...")
+    async def parse_command_with_context(
+        self,
+        text: str,
+        cart_context: Optional[List[Dict]] = None
+    ) -> Optional[Dict]:
+        """
+        Parsear comando con el LLM, con el carrito actual como contexto
         
-        # Obtener contexto del carrito (si existe en sesión)
-        cart_context = []  # Aquí deberías obtener el carrito del usuario
+        Args:
+            text: Texto del comando
+            cart_context: Items del carrito [{"product_name", "quantity"}]
+        
+        Returns:
+            Dict en el mismo formato que VoiceService.parse_command(), o None
+            si no hay backend, se pasó el presupuesto de tiempo o la
+            respuesta no es válida
+        """
+        if not self.enabled:
+            return None
         
-        parsed = await OpenAIService.parse_command_with_context(
-            command.text,
-            cart_context
+        cart_context = cart_context or []
+        key = (
+            normalize_text(text),
+            tuple((item['product_name'], item['quantity']) for item in cart_context)
         )
         
-        if parsed:
-            print("[VoiceParser] ✅ OpenAI entendió el comando")
+        cached = self.cache.get(key)
+        if cached is not None:
+            print(f"[OpenAI] Caché: '{key[0]}' → {cached['type']}")
+            return cached
+        
+        try:
+            # El tiempo de espera por un cupo también cuenta en el presupuesto
+            raw = await asyncio.wait_for(self._complete(text, cart_context), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print(f"[OpenAI] ⏱️ Sin respuesta en {self.timeout}s: '{text}'")
+            return None
+        except Exception as e:
+            self.errors += 1
+            print(f"[OpenAI] ❌ Error: {e}")
+            return None
+        
+        parsed = self._validate(raw)
+        if parsed is None:
+            self.errors += 1
+            print(f"[OpenAI] ❌ Respuesta inválida para '{text}': {raw!r}")
+            return None
+        
+        self.cache.set(key, parsed)
+        print(f"[OpenAI] ✅ Comando parseado: {text} → {parsed['type']}")
+        return parsed
     
-    if not parsed:
-        raise HTTPException(400, detail="No se pudo entender el comando")
+    async def _complete(self, text: str, cart_context: List[Dict]) -> str:
+        async with self._semaphore:
+            return await self.backend.complete(text, cart_context)
     
-    # ... resto del código igual
\ No newline at end of file
+    @staticmethod
+    def _validate(raw: Optional[str]) -> Optional[Dict]:
+        """Convertir la respuesta del LLM al formato de parse_command (None si no calza)"""
+        if not raw:
+            return None
+        
+        result_text = raw.strip()
+        
+        # Limpiar markdown si viene con ```json
+        if result_text.startswith("```"):
+            result_text = result_text.split("```")[1]
+            if result_text.startswith("json"):
+                result_text = result_text[4:]
+        
+        try:
+            data = json.loads(result_text)
+            command_type = data.get('type')
+            
+            if command_type in ('cancel', 'confirm'):
+                return {'type': command_type}
+            
+            if command_type in ('sale', 'add'):
+                items = [
+                    {
+                        'quantity': float(item.get('quantity') or 1),
+                        'product_query': normalize_text(item['product_query'])
+                    }
+                    for item in data['items']
+                ]
+                items = [item for item in items if item['product_query'] and item['quantity'] > 0]
+                return {'type': command_type, 'items': items} if items else None
+            
+            if command_type == 'remove':
+                query = normalize_text(data['product_query'])
+                return {'type': 'remove', 'product_query': query} if query else None
+            
+            if command_type == 'change_price':
+                query = normalize_text(data['product_query'])
+                new_price = float(data['new_price'])
+                if not query or new_price < 0:
+                    return None
+                return {'type': 'change_price', 'product_query': query, 'new_price': new_price}
+            
+            if command_type == 'change_product':
+                old_product = normalize_text(data['old_product'])
+                new_product = normalize_text(data['new_product'])
+                if not old_product or not new_product:
+                    return None
+                return {'type': 'change_product', 'old_product': old_product, 'new_product': new_product}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+        
+        return None
+    
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend.name if self.backend else None,
+            "timeout": self.timeout,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "cache": self.cache.stats()
+        }
+
+
+def default_backend() -> Optional[LLMBackend]:
+    """OpenAIBackend si hay OPENAI_API_KEY y el paquete openai está instalado"""
+    if not settings.OPENAI_API_KEY:
+        return None
+    try:
+        import openai  # noqa: F401
+    except ImportError:
+        print("[OpenAI] ⚠️ Hay OPENAI_API_KEY pero falta el paquete openai: fallback con LLM desactivado")
+        return None
+    return OpenAIBackend(settings.OPENAI_API_KEY, settings.OPENAI_MODEL)
+
+
+# Instancia global (sin OPENAI_API_KEY o sin el paquete el fallback queda apagado)
+openai_service = OpenAIService(backend=default_backend())
@@ -0,0 +1,101 @@
+"""
+Clave fonética para español peruano
+
+Variante de soundex/metaphone pensada para los errores típicos del
+reconocimiento de voz del navegador: escribe igual lo que suena igual.
+
+- b/v → b
+- c/k/q → k (c, z y s suenan igual: ce/ci → s)
+- ll/y → y
+- h muda (menos en ch)
+- g suave (ge/gi) → j; gue/gui → g
+- letras repetidas se colapsan ("rr", "cc", "ll")
+
+Las vocales se mantienen: en español casi nunca se confunden y sin ellas
+"pan" y "pino" darían la misma clave.
+"""
+from functools import lru_cache
+
+_ACCENTS = str.maketrans('áéíóúüàèìòù', 'aeiouuaeiou')
+_FRONT_VOWELS = ('e', 'i')
+
+
+def _word_key(word: str) -> str:
+    """Clave de una sola palabra (sin tildes y en minúsculas)"""
+    out = []
+    i = 0
+    n = len(word)
+
+    while i < n:
+        char = word[i]
+        following = word[i + 1] if i + 1 < n else ''
+        after = word[i + 2] if i + 2 < n else ''
+
+        if char == 'c':
+            if following == 'h':
+                code, step = 'x', 2
+            elif following in _FRONT_VOWELS:
+                code, step = 's', 1
+            else:
+                code, step = 'k', 1
+        elif char == 'q':
+            # "que", "qui": la u no suena
+            code, step = 'k', 2 if following == 'u' else 1
+        elif char == 'k':
+            code, step = 'k', 1
+        elif char in 'sz':
+            code, step = 's', 1
+            if char == 's' and following == 'h':
+                code, step = 'x', 2
+        elif char == 'x':
+            code, step = 'ks', 1
+        elif char in 'bv':
+            code, step = 'b', 1
+        elif char == 'w':
+            code, step = 'u', 1
+        elif char == 'h':
+            code, step = '', 1
+        elif char == 'p' and following == 'h':
+            code, step = 'f', 2
+        elif char == 'l' and following == 'l':
+            code, step = 'y', 2
+        elif char == 'y':
+            # "y" al final suena como "i" ("rey", "muy")
+            code, step = ('i', 1) if not following else ('y', 1)
+        elif char == 'g':
+            if following in _FRONT_VOWELS:
+                code, step = 'j', 1
+            elif following == 'u' and after in _FRONT_VOWELS:
+                code, step = 'g', 2
+            else:
+                code, step = 'g', 1
+        elif char == 'ñ':
+            code, step = 'ni', 1
+        else:
+            code, step = char, 1
+
+        for letter in code:
+            if not out or out[-1] != letter:
+                out.append(letter)
+        i += step
+
+    return ''.join(out)
+
+
+@lru_cache(maxsize=8192)
+def phonetic_key(text: str) -> str:
+    """
+    Clave fonética de un texto (palabra por palabra)
+
+    Args:
+        text: Nombre, alias o lo que se dictó ("Coca Kola", "gaseoza")
+
+    Returns:
+        Clave normalizada ("koka kola", "gaseosa"); "" si no hay letras
+    """
+    if not text:
+        return ""
+
+    words = text.lower().translate(_ACCENTS).split()
+    keys = [_word_key(word) for word in words]
+    return ' '.join(key for key in keys if key)
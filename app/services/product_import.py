@@ -0,0 +1,333 @@
+"""
+Importación masiva de productos (CSV, JSON o NDJSON)
+
+Las filas se leen en streaming del cuerpo del request y se validan una por
+una; las válidas se guardan por lotes de PRODUCT_IMPORT_BATCH_SIZE con un
+solo INSERT ... ON CONFLICT (store_id, name) por lote. Los nombres que la
+tienda ya tiene se leen en una sola consulta al empezar. Todo va en una
+transacción: las filas inválidas se reportan y se saltan, pero un error de
+BD no deja la importación a medias.
+"""
+import codecs
+import csv
+import json
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.text import alias_search_keys, search_key, strip_accents
+from app.models.product import Product
+from app.schemas.product import ProductImportRow
+from app.services.catalog_cache import catalog_cache
+from app.services.product_index import product_index_registry
+
+# Encabezados en español que se aceptan además de los nombres de campo
+HEADER_ALIASES = {
+    "nombre": "name",
+    "producto": "name",
+    "alias": "aliases",
+    "categoria": "category",
+    "unidad": "unit",
+    "costo": "cost_price",
+    "precio_costo": "cost_price",
+    "precio": "sale_price",
+    "precio_venta": "sale_price",
+    "stock_minimo": "min_stock_alert",
+    "activo": "is_active",
+}
+
+
+class ProductImportError(ValueError):
+    """El archivo no se puede importar (formato, tamaño o encabezados)"""
+
+
+def normalize_header(header: str) -> str:
+    """'Precio Venta' → 'sale_price'"""
+    key = strip_accents(header.strip().lower()).replace(" ", "_")
+    return HEADER_ALIASES.get(key, key)
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    """Formato a partir del Content-Type (None si no se reconoce)"""
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    if "json" in content_type:
+        return "json"
+    if "csv" in content_type or content_type.startswith("text/plain"):
+        return "csv"
+    return None
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Líneas completas (con su salto) de un cuerpo en UTF-8 que llega por partes"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.splitlines(keepends=True)
+        # La última línea puede estar cortada a la mitad
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Filas de un CSV con encabezado, como (número de fila, dict)
+
+    Un registro termina cuando sus comillas están cerradas, así que las
+    celdas entre comillas pueden tener saltos de línea. Las celdas vacías
+    se omiten para que tomen el valor por defecto.
+    """
+    headers: Optional[List[str]] = None
+    record = ""
+    line_number = 0
+    async for line in _iter_lines(chunks):
+        record += line
+        if record.count('"') % 2:
+            continue
+        line_number += 1
+        text, record = record, ""
+        if not text.strip():
+            continue
+
+        values = next(csv.reader([text]))
+        if headers is None:
+            headers = [normalize_header(h) for h in values]
+            if "name" not in headers:
+                raise ProductImportError("El CSV debe tener una columna 'name' (o 'nombre')")
+            continue
+
+        yield line_number, {
+            header: value.strip()
+            for header, value in zip(headers, values)
+            if header and value.strip()
+        }
+
+    if record.strip():
+        raise ProductImportError("El CSV termina con comillas sin cerrar")
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Filas de un JSON por línea (un objeto por línea)"""
+    line_number = 0
+    async for line in _iter_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, ProductImportError(f"JSON inválido: {e.msg}")
+
+
+async def iter_json_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Filas de un arreglo JSON (se lee entero, hasta PRODUCT_IMPORT_MAX_JSON_BYTES)"""
+    body = bytearray()
+    async for chunk in chunks:
+        body.extend(chunk)
+        if len(body) > settings.PRODUCT_IMPORT_MAX_JSON_BYTES:
+            raise ProductImportError(
+                "Arreglo JSON demasiado grande; usa CSV o NDJSON (un objeto por línea)"
+            )
+    try:
+        data = json.loads(body.decode("utf-8-sig") or "[]")
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ProductImportError(f"JSON inválido: {e}")
+    if isinstance(data, dict):
+        data = data.get("products", [])
+    if not isinstance(data, list):
+        raise ProductImportError("Se esperaba un arreglo de productos")
+    for index, item in enumerate(data, start=1):
+        yield index, item
+
+
+def iter_rows(chunks: AsyncIterator[bytes], file_format: str) -> AsyncIterator[Tuple[int, Any]]:
+    """Filas del cuerpo según su formato ('csv', 'json' o 'ndjson')"""
+    readers = {"csv": iter_csv_rows, "json": iter_json_rows, "ndjson": iter_ndjson_rows}
+    return readers[file_format](chunks)
+
+
+@dataclass
+class ImportReport:
+    """Resultado de una importación, con el estado de cada fila"""
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: int = 0
+
+    def add(self, row: int, status: str, name: Optional[str] = None, **extra) -> None:
+        """Registrar una fila: status = created | updated | skipped | error"""
+        counter = "errors" if status == "error" else status
+        setattr(self, counter, getattr(self, counter) + 1)
+        self.rows.append({"row": row, "name": name, "status": status, **extra})
+
+    def to_dict(self) -> Dict[str, Any]:
+        self.rows.sort(key=lambda r: r["row"])
+        return {
+            "total": len(self.rows),
+            "created": self.created,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "rows": self.rows
+        }
+
+
+class ProductImportService:
+    """
+    Importa productos a una tienda por lotes
+
+    Uso: add() por cada fila (en el orden del archivo) y finish() al final.
+
+    Args:
+        on_existing: "update" actualiza los productos que ya existen con
+            las columnas que trae el archivo; "skip" los deja como están
+    """
+
+    def __init__(self, db: Session, store_id: int, on_existing: str = "update"):
+        self.db = db
+        self.store_id = store_id
+        self.on_existing = on_existing
+        self.batch_size = settings.PRODUCT_IMPORT_BATCH_SIZE
+        self.report = ImportReport()
+        self._pending: List[Tuple[int, ProductImportRow]] = []
+        self._seen: Dict[str, int] = {}
+        self._count = 0
+
+        # Nombres que ya tiene la tienda: una sola consulta
+        self._existing: Dict[str, int] = {
+            name: product_id
+            for product_id, name in db.query(Product.id, Product.name).filter(
+                Product.store_id == store_id
+            )
+        }
+
+    def add(self, row: int, data: Any) -> None:
+        """Validar una fila y encolarla (guarda el lote cuando se llena)"""
+        self._count += 1
+        if self._count > settings.PRODUCT_IMPORT_MAX_ROWS:
+            raise ProductImportError(
+                f"Máximo {settings.PRODUCT_IMPORT_MAX_ROWS} productos por importación"
+            )
+
+        if isinstance(data, Exception):
+            self.report.add(row, "error", error=str(data))
+            return
+        if not isinstance(data, dict):
+            self.report.add(row, "error", error="Se esperaba un objeto")
+            return
+
+        try:
+            product = ProductImportRow.model_validate(data)
+        except ValidationError as e:
+            self.report.add(row, "error", name=data.get("name"), error=_format_errors(e))
+            return
+
+        # Un mismo nombre dos veces en el archivo: vale la primera
+        first = self._seen.get(product.name)
+        if first is not None:
+            self.report.add(row, "error", name=product.name, error=f"Nombre repetido (fila {first})")
+            return
+        self._seen[product.name] = row
+
+        if self.on_existing == "skip" and product.name in self._existing:
+            self.report.add(row, "skipped", name=product.name, id=self._existing[product.name])
+            return
+
+        self._pending.append((row, product))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def finish(self) -> ImportReport:
+        """Guardar lo pendiente, confirmar y refrescar las cachés de la tienda"""
+        self._flush()
+        self.db.commit()
+
+        if self.report.created or self.report.updated:
+            # Un lote grande se recarga de una vez en vez de parchear fila por fila
+            catalog_cache.invalidate(self.store_id)
+            product_index_registry.invalidate(self.store_id)
+
+        print(
+            f"[ProductImport] Tienda {self.store_id}: {self.report.created} creados, "
+            f"{self.report.updated} actualizados, {self.report.skipped} omitidos, "
+            f"{self.report.errors} con error"
+        )
+        return self.report
+
+    def _flush(self) -> None:
+        """Guardar el lote pendiente con un INSERT ... ON CONFLICT por grupo de columnas"""
+        if not self._pending:
+            return
+
+        # Solo se escriben las columnas que trae cada fila (un CSV sin
+        # columna stock no pisa el stock de los que ya existen)
+        groups: Dict[frozenset, List[Tuple[int, ProductImportRow]]] = {}
+        for row, product in self._pending:
+            groups.setdefault(frozenset(product.model_fields_set), []).append((row, product))
+        self._pending = []
+
+        for fields, rows in groups.items():
+            values = [self._values(product, fields) for _, product in rows]
+            stmt = insert(Product).values(values)
+            if self.on_existing == "update":
+                columns = {
+                    key: stmt.excluded[key]
+                    for key in values[0]
+                    if key not in ("store_id", "name")
+                }
+                columns["updated_at"] = func.now()
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Product.store_id, Product.name],
+                    set_=columns
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(
+                    index_elements=[Product.store_id, Product.name]
+                )
+
+            saved = {
+                name: product_id
+                for product_id, name in self.db.execute(
+                    stmt.returning(Product.id, Product.name)
+                )
+            }
+
+            for row, product in rows:
+                product_id = saved.get(product.name)
+                if product_id is None:
+                    # Otro proceso lo creó entre la consulta inicial y el INSERT
+                    self.report.add(row, "skipped", name=product.name)
+                    continue
+                status = "updated" if product.name in self._existing else "created"
+                self._existing[product.name] = product_id
+                self.report.add(row, status, name=product.name, id=product_id)
+
+    def _values(self, product: ProductImportRow, fields: frozenset) -> Dict[str, Any]:
+        """Columnas a insertar; sin la fila en la BD se usan los valores por defecto"""
+        data = product.model_dump()
+        if self.on_existing == "update":
+            data = {key: value for key, value in data.items() if key in fields}
+        values = {"store_id": self.store_id, **data}
+        # El INSERT no pasa por los @validates del modelo
+        values["search_name"] = search_key(product.name)
+        if "aliases" in values:
+            values["search_aliases"] = alias_search_keys(product.aliases)
+        return values
+
+
+def _format_errors(error: ValidationError) -> str:
+    """'sale_price: Field required; stock: ...'"""
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in e['loc']) or 'fila'}: {e['msg']}"
+        for e in error.errors()
+    )
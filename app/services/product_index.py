@@ -0,0 +1,561 @@
+"""
+Índice en memoria de productos por tienda para el matching de voz
+
+Se construye una sola vez por tienda y se parchea cuando se crean,
+actualizan o desactivan productos, para que resolver un producto por voz
+no tenga que recorrer todo el catálogo en cada comando.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set
+from rapidfuzz import fuzz, process
+from app.services.voice_cache import invalidate_store
+from app.services.phonetics import phonetic_key
+from app.core.text import search_key, alias_search_keys
+
+try:
+    # rapidfuzz.process.cdist devuelve una matriz numpy
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Puntajes del matcher de voz
+PHONETIC_SCORE = 90
+PREFIX_SCORE = 80
+SUBSTRING_SCORE = 60
+SIMILARITY_WEIGHT = 50
+MIN_MATCH_SCORE = 40
+
+
+def product_search_keys(product) -> List[str]:
+    """
+    Claves de búsqueda de un producto: nombre primero y luego aliases
+
+    Usa las columnas search_name / search_aliases guardadas al escribir;
+    solo las calcula si el producto no las tiene (filas sin backfill o
+    productos armados en memoria).
+    """
+    name = getattr(product, 'search_name', None) or search_key(product.name)
+    aliases = getattr(product, 'search_aliases', None)
+    if not aliases:
+        aliases = alias_search_keys(getattr(product, 'aliases', None))
+    return [name] + [alias for alias in aliases if alias != name]
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigramas con relleno en los bordes ("  pan " → "  p", " pa", ...)"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductMatchIndex:
+    """
+    Índice de matching de productos de una tienda
+
+    Guarda nombres y aliases ya normalizados, mapas de coincidencia exacta
+    y fonética, y un índice invertido de tokens y trigramas para generar
+    candidatos.
+    """
+
+    def __init__(self, store_id: int):
+        self.store_id = store_id
+        self.version = 0
+        self._lock = threading.RLock()
+
+        # product_id -> claves normalizadas (el nombre siempre va primero)
+        self._keys: Dict[int, List[str]] = {}
+
+        # product_id -> última fila vista por sync() (las del catálogo son
+        # inmutables: si es el mismo objeto, no cambió)
+        self._rows: Dict[int, Any] = {}
+
+        # Coincidencia exacta
+        self._exact_names: Dict[str, Set[int]] = {}
+        self._exact_aliases: Dict[str, Set[int]] = {}
+
+        # Clave fonética (nombre y aliases) -> productos, y por palabra
+        self._phonetic: Dict[str, Set[int]] = {}
+        self._phonetic_tokens: Dict[str, Set[int]] = {}
+
+        # product_id -> claves fonéticas (en el mismo orden que _keys)
+        self._sounds: Dict[int, List[str]] = {}
+
+        # Índices invertidos para candidatos
+        self._tokens: Dict[str, Set[int]] = {}
+        self._trigrams: Dict[str, Set[int]] = {}
+
+        # Matriz plana de claves para el scoring por lotes con rapidfuzz
+        self._choices: List[str] = []
+        self._owners: List[int] = []
+        self._matrix_version = -1
+
+    # ========================================
+    # CONSTRUCCIÓN Y PARCHES
+    # ========================================
+    def build(self, products: Iterable) -> None:
+        """Reconstruir el índice completo desde una lista de productos"""
+        with self._lock:
+            self._keys.clear()
+            self._rows.clear()
+            self._exact_names.clear()
+            self._exact_aliases.clear()
+            self._phonetic.clear()
+            self._phonetic_tokens.clear()
+            self._sounds.clear()
+            self._tokens.clear()
+            self._trigrams.clear()
+
+            for product in products:
+                self._add(product)
+
+            self.version += 1
+
+    def upsert(self, product) -> None:
+        """Agregar o actualizar un producto (lo quita si está inactivo)"""
+        with self._lock:
+            self._remove(product.id)
+            self._rows.pop(product.id, None)
+            if getattr(product, 'is_active', True):
+                self._add(product)
+            self.version += 1
+
+    def remove(self, product_id: int) -> None:
+        """Quitar un producto del índice"""
+        with self._lock:
+            self._rows.pop(product_id, None)
+            if self._remove(product_id):
+                self.version += 1
+
+    def sync(self, products: Iterable) -> int:
+        """
+        Dejar el índice igual a una lista de productos activos
+
+        Compara las claves de cada producto con las indexadas y solo
+        parchea los que cambiaron (nombre o aliases, p. ej. editados por
+        otro proceso), los nuevos y los que ya no están.
+
+        Returns:
+            Cuántos productos se parchearon
+        """
+        with self._lock:
+            seen = set()
+            changed = 0
+            for product in products:
+                seen.add(product.id)
+                if self._rows.get(product.id) is product:
+                    continue
+                self._rows[product.id] = product
+                if self._keys.get(product.id) != product_search_keys(product):
+                    self._remove(product.id)
+                    self._add(product)
+                    changed += 1
+            for product_id in [pid for pid in self._keys if pid not in seen]:
+                self._remove(product_id)
+                changed += 1
+            for product_id in [pid for pid in self._rows if pid not in seen]:
+                del self._rows[product_id]
+            if changed:
+                self.version += 1
+            return changed
+
+    def _add(self, product) -> None:
+        keys = product_search_keys(product)
+        name, aliases = keys[0], keys[1:]
+        sounds = [phonetic_key(key) for key in keys]
+        self._keys[product.id] = keys
+        self._sounds[product.id] = sounds
+
+        self._exact_names.setdefault(name, set()).add(product.id)
+        for alias in aliases:
+            self._exact_aliases.setdefault(alias, set()).add(product.id)
+
+        for key, sound in zip(keys, sounds):
+            if sound:
+                self._phonetic.setdefault(sound, set()).add(product.id)
+            for token in sound.split():
+                self._phonetic_tokens.setdefault(token, set()).add(product.id)
+            for token in key.split():
+                self._tokens.setdefault(token, set()).add(product.id)
+            for gram in trigrams(key):
+                self._trigrams.setdefault(gram, set()).add(product.id)
+
+    def _remove(self, product_id: int) -> bool:
+        keys = self._keys.pop(product_id, None)
+        if keys is None:
+            return False
+        sounds = self._sounds.pop(product_id)
+
+        self._discard(self._exact_names, keys[0], product_id)
+        for alias in keys[1:]:
+            self._discard(self._exact_aliases, alias, product_id)
+
+        for key, sound in zip(keys, sounds):
+            self._discard(self._phonetic, sound, product_id)
+            for token in sound.split():
+                self._discard(self._phonetic_tokens, token, product_id)
+            for token in key.split():
+                self._discard(self._tokens, token, product_id)
+            for gram in trigrams(key):
+                self._discard(self._trigrams, gram, product_id)
+        return True
+
+    @staticmethod
+    def _discard(mapping: Dict[str, Set[int]], key: str, product_id: int) -> None:
+        ids = mapping.get(key)
+        if ids is None:
+            return
+        ids.discard(product_id)
+        if not ids:
+            del mapping[key]
+
+    # ========================================
+    # CONSULTAS
+    # ========================================
+    @property
+    def product_ids(self) -> Set[int]:
+        with self._lock:
+            return set(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def keys_for(self, product_id: int) -> List[str]:
+        """Claves normalizadas (nombre + aliases) de un producto"""
+        return self._keys.get(product_id, [])
+
+    def exact_matches(self, query: str) -> Set[int]:
+        """
+        Productos cuyo nombre o alias coincide exactamente con el query
+        (ya como search_key, que también lo deja en singular)
+        """
+        with self._lock:
+            ids = set(self._exact_names.get(query, ()))
+            ids |= self._exact_aliases.get(query, set())
+            return ids
+
+    def sounds_for(self, product_id: int) -> List[str]:
+        """Claves fonéticas (nombre + aliases) de un producto"""
+        return self._sounds.get(product_id, [])
+
+    def phonetic_matches(self, query: str) -> Set[int]:
+        """
+        Productos cuyo nombre o alias suena igual que el query
+        
+        Cubre lo que el reconocimiento de voz escribe distinto pero suena
+        igual ("inka kola", "gaseoza", "bino") sin puntuar todo el catálogo.
+        Si el query tiene varias palabras y ninguna clave suena completa
+        igual, vale la clave que tiene todas sus palabras ("coca kola" →
+        "Coca Cola 1L"); entre varias gana la que tiene menos palabras de
+        más (la presentación base antes que "Coca Cola 1L Mini").
+        """
+        with self._lock:
+            ids = self._phonetic.get(phonetic_key(query))
+            if ids:
+                return set(ids)
+
+            tokens = phonetic_key(query).split()
+            if len(tokens) < 2:
+                return set()
+
+            best, extra = set(), None
+            for product_id in self._phonetic_candidates(tokens):
+                for sound in self._sounds[product_id]:
+                    words = sound.split()
+                    if not all(self._token_in(token, words) for token in tokens):
+                        continue
+                    left = len(words) - len(tokens)
+                    if extra is None or left < extra:
+                        best, extra = {product_id}, left
+                    elif left == extra:
+                        best.add(product_id)
+            return best
+
+    @staticmethod
+    def _token_in(token: str, words: List[str]) -> bool:
+        """La palabra (o su singular) está entre las de una clave fonética"""
+        return token in words or token.rstrip('s') in words
+
+    def _phonetic_candidates(self, tokens: List[str]) -> Set[int]:
+        """Productos con alguna clave que suena como cada una de las palabras"""
+        result = None
+        for token in tokens:
+            ids = self._phonetic_tokens.get(token, set())
+            singular = token.rstrip('s')
+            if singular and singular != token:
+                ids = ids | self._phonetic_tokens.get(singular, set())
+            if not ids:
+                return set()
+            result = set(ids) if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+    def substring_candidates(self, query: str) -> Set[int]:
+        """
+        Productos con alguna clave que puede contener el texto buscado
+
+        Toda clave que contiene al query comparte todos sus trigramas
+        interiores, así que basta con intersectar las listas.
+        """
+        if not query:
+            return set()
+
+        with self._lock:
+            grams = {query[i:i + 3] for i in range(len(query) - 2)}
+            if not grams:
+                # Query de 1-2 letras: filtrar por tokens que la contengan
+                return {
+                    pid
+                    for token, ids in self._tokens.items()
+                    if query in token
+                    for pid in ids
+                }
+
+            result = None
+            for gram in sorted(grams, key=lambda g: len(self._trigrams.get(g, ()))):
+                ids = self._trigrams.get(gram)
+                if not ids:
+                    return set()
+                result = set(ids) if result is None else result & ids
+                if not result:
+                    return set()
+            return result or set()
+
+    # ========================================
+    # SCORING POR LOTES
+    # ========================================
+    def _matrix(self):
+        """Claves y dueños en arreglos planos (se rearman si cambió el índice)"""
+        with self._lock:
+            if self._matrix_version != self.version:
+                choices, owners = [], []
+                for product_id, keys in self._keys.items():
+                    for key in keys:
+                        choices.append(key)
+                        owners.append(product_id)
+                self._choices, self._owners = choices, owners
+                self._matrix_version = self.version
+            return self._choices, self._owners
+
+    def score(
+        self,
+        queries: List[str],
+        use_singular: bool = True,
+        similarity: bool = True
+    ) -> List[Dict[int, float]]:
+        """
+        Puntuar varios queries contra todas las claves en una sola pasada
+        
+        Mantiene la escala del matcher original: 80 si alguna clave empieza
+        con el query, 60 si lo contiene y similitud * 50 en otro caso; por
+        producto se queda el mayor puntaje de sus claves.
+        
+        Args:
+            queries: Textos ya normalizados
+            use_singular: Probar también el query sin la "s" final
+            similarity: Incluir el puntaje por similitud
+        
+        Returns:
+            Por cada query, dict product_id -> puntaje (solo > 40)
+        """
+        choices, owners = self._matrix()
+        results: List[Dict[int, float]] = [{} for _ in queries]
+        if not choices or not queries:
+            return results
+
+        # Similitud: solo ratio > 80 supera el mínimo de 40 puntos
+        if similarity:
+            cutoff = MIN_MATCH_SCORE * 100 / SIMILARITY_WEIGHT
+            if HAS_NUMPY:
+                matrix = process.cdist(queries, choices, scorer=fuzz.ratio, score_cutoff=cutoff)
+                for qi, row in enumerate(matrix):
+                    scores = results[qi]
+                    for ci in numpy.nonzero(row)[0]:
+                        value = float(row[ci]) * SIMILARITY_WEIGHT / 100
+                        owner = owners[ci]
+                        if value > scores.get(owner, 0):
+                            scores[owner] = value
+            else:
+                for qi, query in enumerate(queries):
+                    scores = results[qi]
+                    for _, ratio, ci in process.extract(
+                        query, choices, scorer=fuzz.ratio, score_cutoff=cutoff, limit=None
+                    ):
+                        value = ratio * SIMILARITY_WEIGHT / 100
+                        owner = owners[ci]
+                        if value > scores.get(owner, 0):
+                            scores[owner] = value
+
+        # Prefijo / contenido: solo se revisan los candidatos por trigramas
+        # y, comparando claves fonéticas, los que suenan como cada palabra
+        for qi, query in enumerate(queries):
+            variants = [query]
+            if use_singular:
+                singular = query.rstrip('s')
+                if singular and singular != query:
+                    variants.append(singular)
+
+            candidates = set()
+            for variant in variants:
+                candidates |= self.substring_candidates(variant)
+
+            sound = phonetic_key(query)
+            with self._lock:
+                candidates |= self._phonetic_candidates(sound.split())
+
+            scores = results[qi]
+            for product_id in candidates:
+                best = self._prefix_score(product_id, variants, sound)
+                if best > scores.get(product_id, 0):
+                    scores[product_id] = best
+
+        for scores in results:
+            for product_id in [pid for pid, value in scores.items() if value <= MIN_MATCH_SCORE]:
+                del scores[product_id]
+
+        return results
+
+    def score_products(self, query: str, product_ids: Iterable[int]) -> Dict[int, float]:
+        """
+        Puntuar un query solo contra algunos productos (p. ej. los del carrito)
+
+        Misma escala que score(), sin recorrer el resto del catálogo.
+        """
+        variants = [query]
+        singular = query.rstrip('s')
+        if singular and singular != query:
+            variants.append(singular)
+
+        sound = phonetic_key(query)
+        scores: Dict[int, float] = {}
+        for product_id in product_ids:
+            best = float(self._prefix_score(product_id, variants, sound))
+            if best < SUBSTRING_SCORE:
+                for key in self.keys_for(product_id):
+                    best = max(best, fuzz.ratio(query, key) * SIMILARITY_WEIGHT / 100)
+            if best > MIN_MATCH_SCORE:
+                scores[product_id] = best
+        return scores
+
+    def _prefix_score(self, product_id: int, variants: List[str], sound: str) -> int:
+        """
+        80 si alguna clave empieza con el query, 60 si lo contiene y 0 si no
+
+        Se compara tal cual y también por clave fonética, así "serbesa
+        pilsen" puntúa contra "cerveza pilsen 650ml".
+        """
+        best = 0
+        pairs = zip(self.keys_for(product_id), self.sounds_for(product_id))
+        for key, key_sound in pairs:
+            if any(key.startswith(v) for v in variants) or (sound and key_sound.startswith(sound)):
+                return PREFIX_SCORE
+            if any(v in key for v in variants) or (sound and sound in key_sound):
+                best = SUBSTRING_SCORE
+        return best
+
+
+@dataclass(frozen=True)
+class CatalogMatchView:
+    """
+    Lo que el matcher necesita de una versión del catálogo de una tienda
+
+    Se arma una sola vez por versión (ProductIndexRegistry.for_catalog), así
+    que resolver un producto no recorre el catálogo en cada comando.
+    """
+    store_id: int
+    version: int                 # versión del CatalogSnapshot
+    index: ProductMatchIndex
+    by_id: Dict[int, Any]        # product_id -> fila del catálogo
+    position: Dict[int, int]     # product_id -> orden en el catálogo (por nombre)
+
+
+class ProductIndexRegistry:
+    """Registro de índices de matching por tienda (uno por proceso)"""
+
+    def __init__(self):
+        self._indexes: Dict[int, ProductMatchIndex] = {}
+        self._views: Dict[int, CatalogMatchView] = {}
+        self._lock = threading.Lock()
+        self._views_lock = threading.Lock()
+
+    def get(self, store_id: int, products: Optional[List] = None) -> ProductMatchIndex:
+        """
+        Obtener el índice de una tienda, construyéndolo si hace falta
+
+        Si se pasa la lista de productos activos, el índice se pone al día
+        con ella (ver ProductMatchIndex.sync): así se notan también los
+        cambios de nombre o aliases que llegan al recargar el catálogo.
+        """
+        with self._lock:
+            index = self._indexes.get(store_id)
+            if index is None:
+                index = ProductMatchIndex(store_id)
+                self._indexes[store_id] = index
+                if products is not None:
+                    index.build(p for p in products if getattr(p, 'is_active', True))
+                    print(f"[ProductIndex] Índice creado para tienda {store_id}: {len(index)} productos")
+                return index
+
+        if products is not None:
+            changed = index.sync(p for p in products if getattr(p, 'is_active', True))
+            if changed:
+                print(f"[ProductIndex] Índice de tienda {store_id}: {changed} productos actualizados")
+
+        return index
+
+    def for_catalog(self, catalog) -> CatalogMatchView:
+        """
+        Índice y mapas por ID de una versión del catálogo (CatalogSnapshot)
+
+        Si la versión es la misma que la última vista, se devuelve tal cual
+        sin tocar el catálogo; si cambió, se ponen al día las claves del
+        índice (nombres y aliases, no solo qué productos hay) y se arman los
+        mapas una sola vez para esa versión.
+        """
+        view = self._views.get(catalog.store_id)
+        if view is not None and view.version == catalog.version:
+            return view
+
+        with self._views_lock:
+            view = self._views.get(catalog.store_id)
+            if view is None or view.version != catalog.version:
+                view = CatalogMatchView(
+                    store_id=catalog.store_id,
+                    version=catalog.version,
+                    index=self.get(catalog.store_id, catalog.products),
+                    by_id={p.id: p for p in catalog.products},
+                    position={p.id: i for i, p in enumerate(catalog.products)}
+                )
+                self._views[catalog.store_id] = view
+        return view
+
+    def peek(self, store_id: int) -> Optional[ProductMatchIndex]:
+        """Obtener el índice de una tienda solo si ya existe"""
+        return self._indexes.get(store_id)
+
+    def upsert_product(self, product) -> None:
+        """Parchear el índice de la tienda del producto (si existe)"""
+        index = self._indexes.get(product.store_id)
+        if index is not None:
+            index.upsert(product)
+        invalidate_store(product.store_id)
+
+    def remove_product(self, store_id: int, product_id: int) -> None:
+        """Quitar un producto del índice de su tienda (si existe)"""
+        index = self._indexes.get(store_id)
+        if index is not None:
+            index.remove(product_id)
+        invalidate_store(store_id)
+
+    def invalidate(self, store_id: int) -> None:
+        """Descartar el índice de una tienda (se reconstruye al usarlo)"""
+        with self._lock:
+            self._indexes.pop(store_id, None)
+        with self._views_lock:
+            self._views.pop(store_id, None)
+        invalidate_store(store_id)
+
+
+# Instancia global
+product_index_registry = ProductIndexRegistry()
@@ -1,16 +1,53 @@
+from sqlalchemy import Float, Integer, Numeric, String, cast, column, func, literal, or_, text, update, values
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.models.product import Product
-from typing import List
-from difflib import SequenceMatcher
+from app.models.sale import Sale, SaleItem
+from app.schemas.product import PRODUCT_BULK_FIELDS, ProductBulkChange, ProductPriceRule
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from app.services.product_index import product_index_registry
+from app.services.catalog_cache import catalog_cache, CatalogProduct, CatalogSnapshot
+from app.services.learned_alias_service import learned_alias_cache
+from app.core.timing import stage
+from app.core.text import search_key, strip_accents
+from app.services.product_suggest import suggest_registry, sales_velocity, rank_suggestions
 
 class ProductService:
     def __init__(self, db: Session):
         self.db = db
     
-    def get_products_by_store(self, store_id: int, active_only: bool = True) -> List[Product]:
+    def get_products_by_store(self, store_id: int, active_only: bool = True) -> List[CatalogProduct]:
         """
-        Obtener productos de una tienda
+        Obtener productos de una tienda como filas CatalogProduct de solo
+        lectura (no son objetos de la sesión: para editar un producto usar
+        get_product_by_id)
+        
+        Los activos salen de la caché del catálogo; con active_only=False se
+        consulta la BD.
+        """
+        if active_only:
+            return list(self.get_catalog(store_id).products)
+        return [CatalogProduct.from_model(p) for p in self._query_products(store_id, active_only)]
+    
+    def get_catalog(self, store_id: int) -> CatalogSnapshot:
+        """Catálogo activo de la tienda con su versión"""
+        with stage('catalog'):
+            return catalog_cache.get(store_id, lambda: self._load_catalog(store_id))
+    
+    def _load_catalog(self, store_id: int) -> List[Product]:
+        """
+        Productos activos desde la BD para la caché del catálogo
+        
+        De paso carga los aliases aprendidos de la tienda, así el matcher
+        los encuentra en memoria sin consultar la BD en cada comando.
         """
+        products = self._query_products(store_id, True)
+        learned_alias_cache.sync(store_id)
+        return products
+    
+    def _query_products(self, store_id: int, active_only: bool) -> List[Product]:
+        """Leer los productos de una tienda desde la BD"""
         try:
             query = self.db.query(Product).filter(Product.store_id == store_id)
             
@@ -31,84 +68,148 @@ class ProductService:
                 Product.is_active
             ).filter(Product.store_id == store_id).all()
     
-    def search_products(self, store_id: int, query: str) -> List[Product]:
+    def search_products(
+        self,
+        store_id: int,
+        query: str,
+        mode: Optional[str] = None,
+        limit: int = 10
+    ) -> List[Product]:
         """
         Búsqueda inteligente de productos con similitud de texto
         
         Args:
             store_id: ID de la tienda
             query: Texto de búsqueda
+            mode: "index" (índice en memoria) o "trigram" (pg_trgm en
+                PostgreSQL); por defecto PRODUCT_SEARCH_MODE
+            limit: Máximo de resultados
         
         Returns:
             Lista de productos ordenados por relevancia
         """
-        query = query.lower().strip()
-        
-        # Obtener todos los productos activos de la tienda
-        all_products = self.db.query(Product).filter(
-            Product.store_id == store_id,
-            Product.is_active == True
-        ).all()
-        
-        if not all_products:
+        query = search_key(query)
+        if not query:
             return []
         
-        # Calcular similitud para cada producto
-        scored_products = []
-        for product in all_products:
-            product_name = product.name.lower()
-            
-            # Si el producto tiene aliases, buscar también ahí
-            product_aliases = []
-            if hasattr(product, 'aliases') and product.aliases:
-                # Puede ser una lista o un string separado por comas
-                if isinstance(product.aliases, list):
-                    product_aliases = [a.lower() for a in product.aliases]
-                elif isinstance(product.aliases, str):
-                    product_aliases = [a.strip().lower() for a in product.aliases.split(',')]
-            
-            max_score = 0
-            
-            # Buscar en el nombre del producto
-            if query == product_name:
-                max_score = 100
-            elif product_name.startswith(query):
-                max_score = 80
-            elif query in product_name:
-                max_score = 60
-            else:
-                similarity = SequenceMatcher(None, query, product_name).ratio()
-                max_score = similarity * 50
-            
-            # Buscar en los aliases (si existen)
-            for alias in product_aliases:
-                if query == alias:
-                    max_score = max(max_score, 100)
-                elif alias.startswith(query):
-                    max_score = max(max_score, 80)
-                elif query in alias:
-                    max_score = max(max_score, 60)
-                else:
-                    similarity = SequenceMatcher(None, query, alias).ratio()
-                    max_score = max(max_score, similarity * 50)
-            
-            # Solo incluir productos con score > 50% (más estricto)
-            if max_score > 50:
-                scored_products.append((product, max_score))
+        mode = mode or settings.PRODUCT_SEARCH_MODE
+        scored_products = None
         
-        # Ordenar por score descendente
-        scored_products.sort(key=lambda x: x[1], reverse=True)
+        if mode == 'trigram':
+            try:
+                scored_products = self._search_trigram(store_id, query, limit)
+            except Exception as e:
+                # Sin pg_trgm o sin la migración: seguir con el índice en memoria
+                self.db.rollback()
+                print(f"[ProductService] Búsqueda con pg_trgm falló, usando índice en memoria: {e}")
+        
+        if scored_products is None:
+            scored_products = self._search_index(store_id, query, limit)
         
         # Log para debug
         if scored_products:
-            print(f"[ProductService] Búsqueda '{query}':")
+            print(f"[ProductService] Búsqueda '{query}' ({mode}):")
             for product, score in scored_products[:5]:
                 print(f"  - {product.name}: {score:.1f} puntos")
         else:
             print(f"[ProductService] Búsqueda '{query}': Sin resultados (ningún producto > 50% similitud)")
         
-        # Retornar los top 10 productos
-        return [p[0] for p in scored_products[:10]]
+        return [p[0] for p in scored_products]
+    
+    def _search_index(self, store_id: int, query: str, limit: int) -> List[Tuple[Product, float]]:
+        """Buscar con el índice en memoria de la tienda"""
+        # Índice en memoria de la tienda (se arma una vez)
+        index = product_index_registry.peek(store_id)
+        if index is None:
+            index = product_index_registry.get(store_id, self.get_products_by_store(store_id))
+        
+        # Exacto = 100, empieza con = 80, contiene = 60 (nombre o aliases)
+        scores = index.score([query], use_singular=False, similarity=False)[0]
+        for product_id in index.exact_matches(query):
+            scores[product_id] = 100
+        
+        # Solo incluir productos con score > 50% (más estricto)
+        top_ids = [pid for pid, score in scores.items() if score > 50]
+        if not top_ids:
+            return []
+        
+        products = self.db.query(Product).filter(
+            Product.id.in_(top_ids),
+            Product.is_active == True
+        ).all()
+        scored_products = [(product, scores[product.id]) for product in products]
+        scored_products.sort(key=lambda x: x[0].name)
+        
+        # Ordenar por score descendente
+        scored_products.sort(key=lambda x: x[1], reverse=True)
+        return scored_products[:limit]
+    
+    def suggest_products(self, store_id: int, query: str, limit: int = 8) -> List:
+        """
+        Sugerencias mientras se escribe (prefijos de nombre y aliases)
+        
+        Se busca con la clave normalizada y también sin pasar la última
+        palabra a singular, porque puede estar a medio escribir ("pane").
+        """
+        keys = {search_key(query), " ".join(strip_accents(query.lower()).split())}
+        keys.discard("")
+        if not keys:
+            return []
+        
+        index = suggest_registry.get(self.get_catalog(store_id))
+        velocity = sales_velocity.get(store_id, lambda: self._units_sold(store_id))
+        return rank_suggestions(index, keys, velocity, limit)
+    
+    def _units_sold(self, store_id: int) -> List[Tuple[int, float]]:
+        """Unidades vendidas por producto en los últimos SUGGEST_VELOCITY_DAYS días"""
+        since = datetime.now(timezone.utc) - timedelta(days=settings.SUGGEST_VELOCITY_DAYS)
+        try:
+            return self.db.query(SaleItem.product_id, func.sum(SaleItem.quantity)).join(
+                Sale, Sale.id == SaleItem.sale_id
+            ).filter(
+                Sale.store_id == store_id,
+                Sale.sale_date >= since
+            ).group_by(SaleItem.product_id).all()
+        except Exception as e:
+            # Sin ventas no hay desempate por velocidad; se reintenta al vencer el TTL
+            self.db.rollback()
+            print(f"[ProductService] Error al leer ventas recientes: {e}")
+            return []
+    
+    def _search_trigram(self, store_id: int, query: str, limit: int) -> List[Tuple[Product, float]]:
+        """
+        Buscar con pg_trgm: PostgreSQL ordena por similitud y corta en LIMIT
+        
+        Compara contra las claves guardadas (search_name, search_aliases);
+        los operadores % y <% usan sus índices GIN, así que solo se leen
+        los candidatos.
+        Puntaje 0-100 = mayor similitud entre el texto y el nombre o aliases.
+        """
+        threshold = str(settings.PRODUCT_SEARCH_MIN_SIMILARITY)
+        self.db.execute(
+            text(
+                "SELECT set_config('pg_trgm.similarity_threshold', :t, true), "
+                "set_config('pg_trgm.word_similarity_threshold', :t, true)"
+            ),
+            {"t": threshold}
+        )
+        
+        q = literal(query, String)
+        name = Product.search_name
+        aliases = func.products_aliases_text(Product.search_aliases)
+        score = func.greatest(
+            func.similarity(name, q),
+            func.word_similarity(q, name),
+            func.word_similarity(q, aliases)
+        )
+        
+        rows = self.db.query(Product, score).filter(
+            Product.store_id == store_id,
+            Product.is_active == True,
+            or_(name.op('%')(q), q.op('<%')(name), q.op('<%')(aliases))
+        ).order_by(score.desc(), Product.name).limit(limit).all()
+        
+        return [(product, float(value) * 100) for product, value in rows]
     
     def get_product_by_id(self, product_id: int) -> Product:
         """Obtener un producto por ID"""
@@ -123,6 +224,8 @@ class ProductService:
         self.db.add(product)
         self.db.commit()
         self.db.refresh(product)
+        product_index_registry.upsert_product(product)
+        catalog_cache.upsert(product)
         return product
     
     def update_product(self, product_id: int, product_data: dict) -> Product:
@@ -137,6 +240,8 @@ class ProductService:
         
         self.db.commit()
         self.db.refresh(product)
+        product_index_registry.upsert_product(product)
+        catalog_cache.upsert(product)
         return product
     
     def delete_product(self, product_id: int) -> bool:
@@ -147,4 +252,127 @@ class ProductService:
         
         product.is_active = False
         self.db.commit()
-        return True
\ No newline at end of file
+        product_index_registry.remove_product(product.store_id, product_id)
+        catalog_cache.remove(product.store_id, product_id)
+        return True
+    
+    def bulk_update(
+        self,
+        store_id: int,
+        changes: List[ProductBulkChange],
+        rules: List[ProductPriceRule]
+    ) -> Dict:
+        """
+        Cambiar precios y stock de muchos productos en una sola transacción
+        
+        Cada regla es un UPDATE sobre su categoría y todos los cambios
+        explícitos van en un solo UPDATE ... FROM (VALUES ...); las reglas
+        se aplican primero, así que un cambio explícito manda sobre ellas.
+        La caché del catálogo se parchea una vez al final.
+        
+        Returns:
+            Productos cambiados (con sus valores finales) y los que no se
+            encontraron en la tienda
+        """
+        returning = (Product.id, Product.name) + tuple(getattr(Product, f) for f in PRODUCT_BULK_FIELDS)
+        rows, not_found = self._resolve_changes(store_id, changes)
+        updated: Dict[int, Dict] = {}
+        
+        try:
+            for rule in rules:
+                stmt = self._rule_update(store_id, rule).returning(*returning)
+                for row in self.db.execute(stmt, execution_options={"synchronize_session": False}):
+                    updated[row.id] = row._asdict()
+            
+            if rows:
+                stmt = self._changes_update(store_id, list(rows.values())).returning(*returning)
+                for row in self.db.execute(stmt, execution_options={"synchronize_session": False}):
+                    updated[row.id] = row._asdict()
+            
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        
+        # IDs explícitos que no son de la tienda
+        not_found.extend(pid for pid in rows if pid not in updated)
+        
+        catalog_cache.update_fields(store_id, {
+            product_id: {f: row[f] for f in PRODUCT_BULK_FIELDS}
+            for product_id, row in updated.items()
+        })
+        
+        print(f"[ProductService] Tienda {store_id}: {len(updated)} productos actualizados en bloque")
+        return {
+            "updated": len(updated),
+            "products": sorted(updated.values(), key=lambda r: r["name"]),
+            "not_found": not_found
+        }
+    
+    def _resolve_changes(
+        self,
+        store_id: int,
+        changes: List[ProductBulkChange]
+    ) -> Tuple[Dict[int, Dict], List]:
+        """Agrupar los cambios por ID (los nombres se buscan en una sola consulta)"""
+        names = [c.name for c in changes if c.id is None]
+        ids = {}
+        if names:
+            ids = dict(self.db.query(Product.name, Product.id).filter(
+                Product.store_id == store_id,
+                Product.name.in_(names)
+            ).all())
+        
+        rows: Dict[int, Dict] = {}
+        not_found = []
+        for change in changes:
+            product_id = change.id if change.id is not None else ids.get(change.name)
+            if product_id is None:
+                not_found.append(change.name)
+                continue
+            row = rows.setdefault(product_id, {"id": product_id, **{f: None for f in PRODUCT_BULK_FIELDS}})
+            row.update(change.model_dump(include=set(PRODUCT_BULK_FIELDS), exclude_none=True))
+        return rows, not_found
+    
+    def _changes_update(self, store_id: int, rows: List[Dict]):
+        """UPDATE ... FROM (VALUES ...): cada producto con sus propios valores"""
+        types = {"sale_price": Float, "cost_price": Float, "stock": Integer, "min_stock_alert": Integer}
+        changes = values(
+            column("id", Integer),
+            *(column(f, types[f]) for f in PRODUCT_BULK_FIELDS),
+            name="changes"
+        ).data([(row["id"],) + tuple(row[f] for f in PRODUCT_BULK_FIELDS) for row in rows])
+        
+        # Campo sin valor (NULL) = se queda como está
+        return update(Product).where(
+            Product.id == changes.c.id,
+            Product.store_id == store_id
+        ).values({
+            **{
+                f: func.coalesce(cast(changes.c[f], types[f]), getattr(Product, f))
+                for f in PRODUCT_BULK_FIELDS
+            },
+            "updated_at": func.now()
+        })
+    
+    def _rule_update(self, store_id: int, rule: ProductPriceRule):
+        """UPDATE de una regla sobre los productos activos de la categoría"""
+        price = getattr(Product, rule.field)
+        if rule.percent is not None:
+            value = price * (1 + rule.percent / 100)
+        else:
+            value = price + rule.amount
+        if rule.round_to:
+            value = func.round(value / rule.round_to) * rule.round_to
+        # Soles con 2 decimales y nunca negativo; el redondeo necesita
+        # NUMERIC, pero se vuelve a Float para que la columna y el RETURNING
+        # (que parchea catalog_cache) sigan siendo float y no Decimal
+        value = cast(func.greatest(func.round(cast(value, Numeric), 2), 0), Float)
+        
+        stmt = update(Product).where(
+            Product.store_id == store_id,
+            Product.is_active == True
+        )
+        if rule.category:
+            stmt = stmt.where(func.lower(Product.category) == rule.category.strip().lower())
+        return stmt.values({rule.field: value, "updated_at": func.now()})
@@ -0,0 +1,148 @@
+"""
+Autocompletado de productos mientras se escribe
+
+Cada tienda tiene un índice de prefijos: un arreglo ordenado con las claves
+de búsqueda (search_name y search_aliases) y cada una de sus colas por
+palabra ("inca kola 1l", "kola 1l", "1l"), de modo que un prefijo se
+resuelve con bisect en vez de recorrer el catálogo. El índice se arma desde
+el catálogo en caché y se rehace solo cuando cambia su versión.
+
+Los empates se ordenan por velocidad de venta: unidades vendidas en los
+últimos SUGGEST_VELOCITY_DAYS días, leídas con una consulta agregada y
+sumadas en memoria con cada venta.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+from app.core.config import settings
+from app.services.catalog_cache import CatalogProduct, CatalogSnapshot
+
+# Rango de cada coincidencia (menor = mejor)
+RANK_NAME = 0          # el nombre empieza con el texto
+RANK_ALIAS = 1         # un alias empieza con el texto
+RANK_NAME_WORD = 2     # una palabra del nombre empieza con el texto
+RANK_ALIAS_WORD = 3    # una palabra de un alias empieza con el texto
+
+
+class SuggestIndex:
+    """Índice de prefijos de un catálogo (versión fija, solo lectura)"""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.store_id = snapshot.store_id
+        self.version = snapshot.version
+        self.products: Dict[int, CatalogProduct] = {p.id: p for p in snapshot.products}
+
+        entries: List[Tuple[str, int, int]] = []
+        for product in snapshot.products:
+            keys = [(product.search_name, RANK_NAME)]
+            keys.extend((alias, RANK_ALIAS) for alias in product.search_aliases)
+            for key, rank in keys:
+                words = key.split()
+                for i in range(len(words)):
+                    entries.append((" ".join(words[i:]), rank if i == 0 else rank + 2, product.id))
+        entries.sort()
+
+        self._keys = [entry[0] for entry in entries]
+        self._entries = entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, prefix: str) -> Dict[int, int]:
+        """Productos con alguna clave que empieza con `prefix` → mejor rango"""
+        ranks: Dict[int, int] = {}
+        if not prefix:
+            return ranks
+        i = bisect_left(self._keys, prefix)
+        while i < len(self._keys) and self._keys[i].startswith(prefix):
+            _, rank, product_id = self._entries[i]
+            if rank < ranks.get(product_id, RANK_ALIAS_WORD + 1):
+                ranks[product_id] = rank
+            i += 1
+        return ranks
+
+
+class SuggestRegistry:
+    """Índices de prefijos por tienda, atados a la versión del catálogo"""
+
+    def __init__(self):
+        self._indexes: Dict[int, SuggestIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, snapshot: CatalogSnapshot) -> SuggestIndex:
+        index = self._indexes.get(snapshot.store_id)
+        if index is not None and index.version == snapshot.version:
+            return index
+
+        with self._lock:
+            index = self._indexes.get(snapshot.store_id)
+            if index is None or index.version != snapshot.version:
+                index = SuggestIndex(snapshot)
+                self._indexes[snapshot.store_id] = index
+        return index
+
+
+class SalesVelocity:
+    """
+    Unidades vendidas recientemente por producto, por tienda
+
+    Se carga con `load` la primera vez (o al vencer `ttl`, que además
+    descarta las ventas que ya salieron de la ventana) y cada venta suma
+    en memoria.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._stores: Dict[int, Tuple[float, Dict[int, float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, store_id: int, load: Callable[[], Iterable[Tuple[int, float]]]) -> Dict[int, float]:
+        entry = self._stores.get(store_id)
+        if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+            return entry[1]
+
+        units = {product_id: float(quantity or 0) for product_id, quantity in load()}
+        with self._lock:
+            self._stores[store_id] = (time.monotonic(), units)
+        return units
+
+    def record(self, store_id: int, quantities: Dict[int, float]) -> None:
+        """Sumar (o restar, si se anula una venta) unidades vendidas"""
+        with self._lock:
+            entry = self._stores.get(store_id)
+            if entry is None:
+                return
+            units = dict(entry[1])
+            for product_id, quantity in quantities.items():
+                units[product_id] = max(units.get(product_id, 0) + quantity, 0)
+            self._stores[store_id] = (entry[0], units)
+
+    def invalidate(self, store_id: int) -> None:
+        with self._lock:
+            self._stores.pop(store_id, None)
+
+
+def rank_suggestions(
+    index: SuggestIndex,
+    keys: Iterable[str],
+    velocity: Dict[int, float],
+    limit: int
+) -> List[CatalogProduct]:
+    """Top `limit` por rango de prefijo, luego ventas recientes, luego nombre"""
+    ranks: Dict[int, int] = {}
+    for key in keys:
+        for product_id, rank in index.lookup(key).items():
+            if rank < ranks.get(product_id, RANK_ALIAS_WORD + 1):
+                ranks[product_id] = rank
+
+    ordered = sorted(
+        ranks,
+        key=lambda pid: (ranks[pid], -velocity.get(pid, 0), index.products[pid].name)
+    )
+    return [index.products[pid] for pid in ordered[:limit]]
+
+
+# Instancias globales
+suggest_registry = SuggestRegistry()
+sales_velocity = SalesVelocity(ttl=settings.SUGGEST_VELOCITY_TTL)
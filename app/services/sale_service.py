@@ -1,21 +1,88 @@
+import base64
+import hashlib
+import json
 from datetime import datetime, timedelta
-from typing import List, Dict
-from sqlalchemy.orm import Session
-from app.models.sale import Sale, SaleItem
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import Float, Integer, column, func, insert, text, tuple_, update, values
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from app.core.config import settings
+from app.models.sale import Sale, SaleItem, SaleIdempotencyKey
 from app.models.product import Product
 from app.models.user import User
+from app.services.catalog_cache import catalog_cache
+from app.services.product_suggest import sales_velocity
 import pytz
 
 # Timezone de Perú
 PERU_TZ = pytz.timezone('America/Lima')
 
+
+class InsufficientStockError(ValueError):
+    """Algún producto de la venta no tiene stock suficiente"""
+
+
+class IdempotencyKeyConflictError(ValueError):
+    """La Idempotency-Key ya se usó con otra venta"""
+
+
+class InvalidCursorError(ValueError):
+    """El cursor de paginación no es válido"""
+
+
+def encode_sale_cursor(sale: Sale) -> str:
+    """Cursor opaco con la posición (sale_date, id) de una venta"""
+    payload = json.dumps([sale.sale_date.isoformat(), sale.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_sale_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    (sale_date, id) de un cursor de encode_sale_cursor
+    
+    Raises:
+        InvalidCursorError: Si el cursor no es válido
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sale_date, sale_id = json.loads(payload)
+        sale_date = datetime.fromisoformat(sale_date)
+        if sale_date.tzinfo is None:
+            raise ValueError("sin zona horaria")
+        return sale_date, int(sale_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Cursor inválido: {e}")
+
+
+def request_fingerprint(data) -> str:
+    """Huella (sha256) del cuerpo de un request, para comparar reintentos"""
+    if hasattr(data, 'model_dump'):
+        data = data.model_dump(mode='json')
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
 class SaleService:
     """Servicio para gestionar ventas"""
     
+    # Todo lo que lee to_response, en 3 consultas sin importar cuántas
+    # ventas sean: ventas + vendedor (JOIN), sus items y sus productos
+    RESPONSE_OPTIONS = (
+        joinedload(Sale.user),
+        selectinload(Sale.items).selectinload(SaleItem.product),
+    )
+    
     def __init__(self, db: Session):
         self.db = db
     
-    def create_sale(self, sale_data, user_id: int, store_id: int) -> Sale:
+    def create_sale(
+        self,
+        sale_data,
+        user_id: int,
+        store_id: int,
+        idempotency_key: Optional[str] = None,
+        request_hash: Optional[str] = None
+    ) -> Sale:
         """
         Crear una nueva venta con hora de Perú
         
@@ -23,11 +90,16 @@ class SaleService:
             sale_data: Objeto SaleCreate (Pydantic) o diccionario con items y payment_method
             user_id: ID del usuario
             store_id: ID de la tienda
+            idempotency_key: Clave del cliente; si ya se usó (dentro de
+                SALE_IDEMPOTENCY_TTL_HOURS) se devuelve esa venta sin crear otra
+            request_hash: Huella del request original (request_fingerprint)
         
         Returns:
-            Objeto Sale creado
+            Objeto Sale creado (o el de la clave, con replayed=True)
         
         Raises:
+            InsufficientStockError: Si no alcanza el stock (y no se permite negativo)
+            IdempotencyKeyConflictError: Si la clave ya se usó con otra venta
             ValueError: Si hay algún error en los datos
         """
         try:
@@ -42,6 +114,16 @@ class SaleService:
                 # Ya es un dict
                 data = sale_data
             
+            if idempotency_key:
+                request_hash = request_hash or request_fingerprint(data)
+                # Reintentos simultáneos con la misma clave esperan aquí a
+                # que el primero termine, y después lo encuentran guardado
+                self._lock_idempotency_keys(store_id, [idempotency_key])
+                existing = self.find_idempotent_sale(store_id, idempotency_key, request_hash)
+                if existing is not None:
+                    self.db.commit()  # libera el lock
+                    return existing
+            
             # Extraer datos
             items = data.get('items', [])
             payment_method = data.get('payment_method', 'efectivo')
@@ -49,6 +131,28 @@ class SaleService:
             # Calcular el total
             total = sum(item['subtotal'] for item in items)
             
+            # Stock: una consulta para bloquear los productos y un UPDATE
+            # para restarlo, en la misma transacción que la venta
+            quantities = {}
+            for item in items:
+                quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+            products = self._lock_products(store_id, quantities)
+            
+            missing = [pid for pid in quantities if pid not in products]
+            if missing:
+                raise ValueError(f"Productos no encontrados en la tienda: {missing}")
+            
+            if not settings.SALE_ALLOW_NEGATIVE_STOCK:
+                short = [
+                    f"{products[pid].name} (quedan {products[pid].stock or 0})"
+                    for pid, quantity in quantities.items()
+                    if (products[pid].stock or 0) < quantity
+                ]
+                if short:
+                    raise InsufficientStockError(f"Stock insuficiente: {', '.join(short)}")
+            
+            stock = self._update_stock({pid: -quantity for pid, quantity in quantities.items()})
+            
             # Crear la venta con hora de Perú (se convierte a UTC automáticamente)
             sale = Sale(
                 store_id=store_id,
@@ -58,48 +162,360 @@ class SaleService:
                 sale_date=datetime.now(PERU_TZ)  # Hora de Perú
             )
             
-            self.db.add(sale)
-            self.db.flush()  # Para obtener el ID de la venta
-            
             # Crear los items de la venta
-            for item in items:
-                sale_item = SaleItem(
-                    sale_id=sale.id,
+            sale.items = [
+                SaleItem(
                     product_id=item['product_id'],
                     quantity=item['quantity'],
                     unit_price=item['unit_price'],
                     subtotal=item['subtotal']
                 )
-                self.db.add(sale_item)
-                
-                # Actualizar el stock del producto
-                product = self.db.query(Product).filter(Product.id == item['product_id']).first()
-                if product:
-                    product.stock -= item['quantity']
+                for item in items
+            ]
+            self.db.add(sale)
+            
+            if idempotency_key:
+                self.db.flush()
+                self._purge_idempotency_keys(store_id)
+                self.db.add(SaleIdempotencyKey(
+                    store_id=store_id,
+                    key=idempotency_key,
+                    sale_id=sale.id,
+                    request_hash=request_hash
+                ))
+                try:
+                    self.db.flush()
+                except IntegrityError:
+                    # La clave ya está guardada: se deshace esta venta (stock
+                    # incluido) y se devuelve la original
+                    self.db.rollback()
+                    existing = self.find_idempotent_sale(store_id, idempotency_key, request_hash)
+                    if existing is None:
+                        raise
+                    return existing
             
             self.db.commit()
             self.db.refresh(sale)
+            catalog_cache.update_fields(store_id, {pid: {"stock": value} for pid, value in stock.items()})
+            sales_velocity.record(store_id, quantities)
             
             print(f"[SaleService] Venta creada: ID {sale.id}, Total S/ {total:.2f}, Hora Perú: {sale.sale_date}")
             
             return sale
             
+        except (InsufficientStockError, IdempotencyKeyConflictError) as e:
+            self.db.rollback()
+            print(f"[SaleService] Venta rechazada: {e}")
+            raise
         except Exception as e:
             self.db.rollback()
             print(f"[SaleService] Error al crear venta: {e}")
             raise ValueError(f"Error al crear venta: {str(e)}")
     
-    def get_sales_by_date(self, store_id: int, date: datetime = None) -> List[Sale]:
+    def find_idempotent_sale(
+        self,
+        store_id: int,
+        idempotency_key: str,
+        request_hash: Optional[str] = None
+    ) -> Optional[Sale]:
+        """
+        Venta ya creada con esta Idempotency-Key (dentro de la ventana de retención)
+        
+        Raises:
+            IdempotencyKeyConflictError: Si la clave se usó con otro request
+        """
+        cutoff = datetime.now(pytz.UTC) - timedelta(hours=settings.SALE_IDEMPOTENCY_TTL_HOURS)
+        entry = self.db.query(SaleIdempotencyKey).filter(
+            SaleIdempotencyKey.store_id == store_id,
+            SaleIdempotencyKey.key == idempotency_key,
+            SaleIdempotencyKey.created_at >= cutoff
+        ).first()
+        if entry is None:
+            return None
+        
+        if request_hash and entry.request_hash != request_hash:
+            raise IdempotencyKeyConflictError("La Idempotency-Key ya se usó con otra venta")
+        
+        sale = self.db.query(Sale).options(*self.RESPONSE_OPTIONS).filter(
+            Sale.id == entry.sale_id
+        ).first()
+        if sale is not None:
+            # Marca (no persistida) para que la API avise que es una repetición
+            sale.replayed = True
+            print(f"[SaleService] Idempotency-Key repetida: devolviendo venta {sale.id}")
+        return sale
+    
+    def _purge_idempotency_keys(self, store_id: int) -> None:
+        """Borrar las claves de la tienda que ya salieron de la ventana de retención"""
+        cutoff = datetime.now(pytz.UTC) - timedelta(hours=settings.SALE_IDEMPOTENCY_TTL_HOURS)
+        self.db.query(SaleIdempotencyKey).filter(
+            SaleIdempotencyKey.store_id == store_id,
+            SaleIdempotencyKey.created_at < cutoff
+        ).delete(synchronize_session=False)
+    
+    def sync_sales(self, sales: List, user_id: int, store_id: int) -> Dict:
+        """
+        Registrar en bloque las ventas hechas sin conexión
+        
+        Todo va en una transacción: un INSERT por tabla (ventas, items y
+        claves) y un solo UPDATE de stock con las cantidades sumadas por
+        producto. Cada venta usa su client_id como Idempotency-Key, así que
+        reenviar el mismo lote no duplica nada.
+        
+        Las ventas ya ocurrieron, así que se registran aunque el stock quede
+        negativo (se avisa en warnings). Solo se rechazan (conflict) las que
+        repiten un client_id con otro contenido o usan productos que no son
+        de la tienda.
+        
+        Args:
+            sales: Lista de OfflineSale
+        
+        Returns:
+            Resultado por venta (created, duplicate o conflict) y totales
+        """
+        try:
+            now = datetime.now(pytz.UTC)
+            keys = sorted({sale.client_id for sale in sales})
+            self._lock_idempotency_keys(store_id, keys)
+            self._purge_idempotency_keys(store_id)
+            existing = {
+                entry.key: entry
+                for entry in self.db.query(SaleIdempotencyKey).filter(
+                    SaleIdempotencyKey.store_id == store_id,
+                    SaleIdempotencyKey.key.in_(keys)
+                )
+            }
+            products = self._lock_products(
+                store_id, {item.product_id for sale in sales for item in sale.items}
+            )
+            remaining = {pid: row.stock or 0 for pid, row in products.items()}
+            
+            results = []
+            accepted = []  # (venta, huella, resultado)
+            pending = {}   # client_id → (huella, resultado) de este mismo lote
+            for sale in sales:
+                # Igual que POST /api/sales: si la venta sí llegó antes con
+                # esta clave (y se perdió la respuesta), aquí sale como repetida
+                request_hash = request_fingerprint(sale.to_sale_create())
+                result = {"client_id": sale.client_id, "status": "created", "sale_id": None}
+                results.append(result)
+                
+                entry = existing.get(sale.client_id)
+                first = pending.get(sale.client_id)
+                if entry is not None or first is not None:
+                    same = (entry.request_hash if entry is not None else first[0]) == request_hash
+                    if not same:
+                        result.update(status="conflict", detail="client_id ya usado con otra venta")
+                    elif entry is not None:
+                        result.update(status="duplicate", sale_id=entry.sale_id)
+                    else:
+                        result.update(status="duplicate", same_as=first[1])
+                    continue
+                
+                missing = sorted({item.product_id for item in sale.items} - set(products))
+                if missing:
+                    result.update(status="conflict", detail=f"Productos no encontrados en la tienda: {missing}")
+                    continue
+                
+                short = []
+                for item in sale.items:
+                    remaining[item.product_id] -= item.quantity
+                    if remaining[item.product_id] < 0:
+                        short.append(products[item.product_id].name)
+                if short:
+                    result["warnings"] = [f"Stock negativo: {', '.join(dict.fromkeys(short))}"]
+                
+                pending[sale.client_id] = (request_hash, result)
+                accepted.append((sale, request_hash, result))
+            
+            stock = {}
+            quantities = {}
+            if accepted:
+                sale_ids = self.db.execute(
+                    insert(Sale).returning(Sale.id, sort_by_parameter_order=True),
+                    [
+                        {
+                            "store_id": store_id,
+                            "user_id": user_id,
+                            "total": sum(item.subtotal for item in sale.items),
+                            "payment_method": sale.payment_method,
+                            "payment_reference": sale.payment_reference,
+                            "customer_name": sale.customer_name,
+                            "is_credit": sale.is_credit,
+                            "sale_date": self._offline_sale_date(sale.created_at, now)
+                        }
+                        for sale, _, _ in accepted
+                    ]
+                ).scalars().all()
+                
+                for sale_id, (_, _, result) in zip(sale_ids, accepted):
+                    result["sale_id"] = sale_id
+                
+                self.db.execute(insert(SaleItem), [
+                    {
+                        "sale_id": result["sale_id"],
+                        "product_id": item.product_id,
+                        "quantity": item.quantity,
+                        "unit_price": item.unit_price,
+                        "subtotal": item.subtotal
+                    }
+                    for sale, _, result in accepted
+                    for item in sale.items
+                ])
+                self.db.execute(insert(SaleIdempotencyKey), [
+                    {
+                        "store_id": store_id,
+                        "key": sale.client_id,
+                        "sale_id": result["sale_id"],
+                        "request_hash": request_hash
+                    }
+                    for sale, request_hash, result in accepted
+                ])
+                
+                for sale, _, _ in accepted:
+                    for item in sale.items:
+                        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+                stock = self._update_stock({pid: -quantity for pid, quantity in quantities.items()})
+            
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            print(f"[SaleService] Error al sincronizar ventas: {e}")
+            raise ValueError(f"Error al sincronizar ventas: {str(e)}")
+        
+        catalog_cache.update_fields(store_id, {pid: {"stock": value} for pid, value in stock.items()})
+        sales_velocity.record(store_id, quantities)
+        
+        # Repetidas dentro del mismo lote: el ID de la primera
+        for result in results:
+            first = result.pop("same_as", None)
+            if first is not None:
+                result["sale_id"] = first["sale_id"]
+        
+        counts = {status: 0 for status in ("created", "duplicate", "conflict")}
+        for result in results:
+            counts[result["status"]] += 1
+        
+        print(
+            f"[SaleService] Sincronización tienda {store_id}: {counts['created']} nuevas, "
+            f"{counts['duplicate']} repetidas, {counts['conflict']} con conflicto"
+        )
+        return {**counts, "results": results}
+    
+    @staticmethod
+    def _offline_sale_date(created_at: Optional[datetime], now: datetime) -> datetime:
+        """Hora de una venta offline (sin zona = hora de Perú; nunca en el futuro)"""
+        if created_at is None:
+            return now
+        if created_at.tzinfo is None:
+            created_at = PERU_TZ.localize(created_at)
+        return min(created_at, now)
+    
+    def _lock_idempotency_keys(self, store_id: int, keys: List[str]) -> None:
+        """
+        Bloqueo por clave hasta el fin de la transacción (pg_advisory_xact_lock)
+        
+        Los reintentos con la misma clave esperan a que el primero termine.
+        Las claves se bloquean ordenadas, igual en cualquier request, para
+        que dos lotes con claves en común no se traben en cruz.
+        """
+        if not keys:
+            return
+        self.db.execute(
+            text(
+                "SELECT pg_advisory_xact_lock(:store_id, hashtext(t.key)) "
+                "FROM unnest(CAST(:keys AS text[])) WITH ORDINALITY AS t(key, n) ORDER BY t.n"
+            ),
+            {"store_id": store_id, "keys": sorted(keys)}
+        )
+    
+    def get_sales_by_date(
+        self,
+        store_id: int,
+        date: datetime = None,
+        with_details: bool = False
+    ) -> List[Sale]:
         """
         Obtener ventas de un día específico en hora de Perú
         
         Args:
             store_id: ID de la tienda
             date: Fecha (por defecto hoy en hora de Perú)
+            with_details: Cargar de una vez vendedor, items y productos
+                (para to_response o listados); sin esto cada venta los
+                consulta por separado al leerlos
         
         Returns:
             Lista de ventas
         """
+        start_utc, end_utc = self._day_range(date)
+        
+        # Buscar ventas usando el rango UTC
+        query = self.db.query(Sale).filter(
+            Sale.store_id == store_id,
+            Sale.sale_date >= start_utc,
+            Sale.sale_date < end_utc
+        )
+        if with_details:
+            query = query.options(*self.RESPONSE_OPTIONS)
+        sales = query.order_by(Sale.sale_date.desc()).all()
+        
+        print(f"[SaleService] Ventas encontradas: {len(sales)}")
+        
+        return sales
+    
+    def get_sales_page(
+        self,
+        store_id: int,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        date: Optional[datetime] = None,
+        with_details: bool = True
+    ) -> Tuple[List[Sale], Optional[str]]:
+        """
+        Una página del historial de ventas, de la más reciente a la más antigua
+        
+        Pagina por cursor sobre (sale_date, id) con el índice
+        ix_sales_store_date_id: cada página cuesta lo mismo por atrás que
+        esté (OFFSET tendría que recorrer todas las anteriores) y las ventas
+        nuevas no corren las páginas que el cliente ya tiene.
+        
+        Args:
+            store_id: ID de la tienda
+            limit: Ventas por página (por defecto SALES_PAGE_SIZE, hasta SALES_PAGE_MAX)
+            cursor: next_cursor de la página anterior (None = la primera)
+            date: Solo ventas de ese día en hora de Perú (None = todo el historial)
+            with_details: Cargar vendedor, items y productos (ver RESPONSE_OPTIONS)
+        
+        Returns:
+            (ventas, next_cursor); next_cursor es None en la última página
+        
+        Raises:
+            InvalidCursorError: Si el cursor no es válido
+        """
+        limit = max(1, min(limit or settings.SALES_PAGE_SIZE, settings.SALES_PAGE_MAX))
+        
+        query = self.db.query(Sale).filter(Sale.store_id == store_id)
+        if date is not None:
+            start_utc, end_utc = self._day_range(date)
+            query = query.filter(Sale.sale_date >= start_utc, Sale.sale_date < end_utc)
+        if cursor:
+            sale_date, sale_id = decode_sale_cursor(cursor)
+            query = query.filter(tuple_(Sale.sale_date, Sale.id) < tuple_(sale_date, sale_id))
+        if with_details:
+            query = query.options(*self.RESPONSE_OPTIONS)
+        
+        # Una de más para saber si hay otra página
+        sales = query.order_by(Sale.sale_date.desc(), Sale.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(sales) > limit:
+            sales = sales[:limit]
+            next_cursor = encode_sale_cursor(sales[-1])
+        return sales, next_cursor
+    
+    @staticmethod
+    def _day_range(date: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+        """Inicio y fin (en UTC) del día de `date` en hora de Perú (por defecto hoy)"""
         # Obtener fecha actual en hora de Perú
         if date is None:
             date = datetime.now(PERU_TZ)
@@ -119,16 +535,7 @@ class SaleService:
         print(f"[SaleService]   Desde: {start_of_day} → UTC: {start_utc}")
         print(f"[SaleService]   Hasta: {end_of_day} → UTC: {end_utc}")
         
-        # Buscar ventas usando el rango UTC
-        sales = self.db.query(Sale).filter(
-            Sale.store_id == store_id,
-            Sale.sale_date >= start_utc,
-            Sale.sale_date < end_utc
-        ).order_by(Sale.sale_date.desc()).all()
-        
-        print(f"[SaleService] Ventas encontradas: {len(sales)}")
-        
-        return sales
+        return start_utc, end_utc
     
     def get_daily_total(self, store_id: int, date: datetime = None) -> float:
         """
@@ -175,11 +582,9 @@ class SaleService:
             limit: Límite de resultados
         
         Returns:
-            Lista de ventas
+            Lista de ventas (para las siguientes, ver get_sales_page)
         """
-        return self.db.query(Sale).filter(
-            Sale.store_id == store_id
-        ).order_by(Sale.sale_date.desc()).limit(limit).all()
+        return self.get_sales_page(store_id, limit, with_details=False)[0]
     
     def delete_sale(self, sale_id: int) -> bool:
         """
@@ -197,18 +602,19 @@ class SaleService:
         try:
             sale = self.get_sale_by_id(sale_id)
             
-            # Restaurar el stock de los productos
+            # Restaurar el stock de los productos (un solo UPDATE)
+            store_id = sale.store_id
+            quantities = {}
             for item in sale.items:
-                product = self.db.query(Product).filter(Product.id == item.product_id).first()
-                if product:
-                    product.stock += item.quantity
+                quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+            products = self._lock_products(store_id, quantities)
+            stock = self._update_stock({pid: quantities[pid] for pid in products})
             
-            # Eliminar los items primero (por la foreign key)
-            self.db.query(SaleItem).filter(SaleItem.sale_id == sale_id).delete()
-            
-            # Eliminar la venta
+            # Los items se borran con la venta (cascade)
             self.db.delete(sale)
             self.db.commit()
+            catalog_cache.update_fields(store_id, {pid: {"stock": value} for pid, value in stock.items()})
+            sales_velocity.record(store_id, {pid: -quantity for pid, quantity in quantities.items()})
             
             return True
             
@@ -216,10 +622,50 @@ class SaleService:
             self.db.rollback()
             raise ValueError(f"Error al eliminar venta: {str(e)}")
     
+    def _lock_products(self, store_id: int, product_ids) -> Dict[int, Product]:
+        """
+        Bloquear los productos de una venta con SELECT ... FOR UPDATE
+        
+        Se bloquean en orden de ID: dos ventas con los mismos productos
+        esperan una a la otra en vez de trabarse en cruz, y el stock que se
+        lee ya no puede cambiar hasta el commit.
+        """
+        rows = self.db.query(Product.id, Product.name, Product.stock).filter(
+            Product.id.in_(sorted(product_ids)),
+            Product.store_id == store_id
+        ).order_by(Product.id).with_for_update().all()
+        return {row.id: row for row in rows}
+    
+    def _update_stock(self, deltas: Dict[int, float]) -> Dict[int, int]:
+        """
+        Sumar `deltas` al stock con un solo UPDATE ... FROM (VALUES ...)
+        
+        La resta se hace sobre el valor de la fila en la BD, no sobre uno
+        leído antes. stock es entero: las cantidades por peso se redondean.
+        
+        Returns:
+            Stock final de cada producto
+        """
+        if not deltas:
+            return {}
+        changes = values(
+            column("id", Integer),
+            column("delta", Float),
+            name="changes"
+        ).data(list(deltas.items()))
+        stmt = update(Product).where(Product.id == changes.c.id).values(
+            stock=func.round(func.coalesce(Product.stock, 0) + changes.c.delta)
+        ).returning(Product.id, Product.stock)
+        return dict(self.db.execute(stmt, execution_options={"synchronize_session": False}).all())
+    
     def to_response(self, sale: Sale) -> Dict:
         """
         Convertir una venta a formato de respuesta
         
+        Lee el vendedor, los items y sus productos: para varias ventas,
+        cargarlas con RESPONSE_OPTIONS (p. ej. get_sales_by_date con
+        with_details=True) para no hacer consultas por cada una.
+        
         Args:
             sale: Objeto Sale
         
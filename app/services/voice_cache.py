@@ -0,0 +1,89 @@
+"""
+Cachés en memoria para el pipeline de voz
+
+- parse_cache: resultado de VoiceService.parse_command por texto normalizado
+- resolution_cache: resultado de find_product_fuzzy por
+  (tienda, versión del catálogo, search_key del query); se consulta antes
+  de tocar el catálogo
+"""
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+from cachetools import TTLCache
+from app.core.config import settings
+
+
+class VoiceCache:
+    """LRU con expiración por tiempo, segura entre hilos y con contadores"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Obtener una copia del valor guardado (None si no está)"""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def contains(self, key: Hashable) -> bool:
+        """Saber si hay un valor vigente (no cuenta como acierto ni fallo)"""
+        with self._lock:
+            return key in self._cache
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Guardar una copia del valor"""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._cache[key] = value
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Borrar las entradas cuya llave cumple el predicado"""
+        with self._lock:
+            keys = [key for key in list(self._cache.keys()) if predicate(key)]
+            for key in keys:
+                self._cache.pop(key, None)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict:
+        """Contadores de aciertos y fallos"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Instancias globales
+parse_cache = VoiceCache(
+    "parse",
+    maxsize=settings.VOICE_PARSE_CACHE_SIZE,
+    ttl=settings.VOICE_PARSE_CACHE_TTL
+)
+resolution_cache = VoiceCache(
+    "resolution",
+    maxsize=settings.VOICE_RESOLUTION_CACHE_SIZE,
+    ttl=settings.VOICE_RESOLUTION_CACHE_TTL
+)
+
+
+def invalidate_store(store_id: int) -> None:
+    """Descartar las resoluciones de producto de una tienda"""
+    resolution_cache.invalidate(lambda key: key[0] == store_id)
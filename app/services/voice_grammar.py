@@ -0,0 +1,340 @@
+"""
+Gramática compilada para los comandos de voz
+
+Tokeniza el texto una sola vez y clasifica cada token contra tablas de
+palabras clave precalculadas, para detectar el tipo de comando y separar
+cantidades y productos sin reemplazos de substrings (que cortaban palabras,
+p. ej. "uno" dentro de nombres de productos).
+"""
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# ========================================
+# VOCABULARIO
+# ========================================
+FRACTIONS = {
+    'medio': 0.5, 'media': 0.5, 'un medio': 0.5, 'una media': 0.5,
+    'cuarto': 0.25, 'un cuarto': 0.25, 'cuartito': 0.25,
+    'tres cuartos': 0.75, 'tres cuartitos': 0.75,
+    'tercio': 1/3, 'un tercio': 1/3, 'una tercera parte': 1/3,
+    'dos tercios': 2/3, 'dos tercio': 2/3,
+}
+
+NUMBERS = {
+    'un': 1, 'uno': 1, 'una': 1,
+    'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5,
+    'seis': 6, 'siete': 7, 'ocho': 8, 'nueve': 9, 'diez': 10,
+    'once': 11, 'doce': 12, 'quince': 15, 'veinte': 20,
+    'treinta': 30, 'cuarenta': 40, 'cincuenta': 50,
+}
+
+# Comandos especiales
+CANCEL_WORDS = ['cancelar', 'anular', 'borra', 'borrar', 'elimina', 'eliminar']
+CONFIRM_WORDS = ['listo', 'total', 'confirmar', 'suma', 'sumar', 'cierra', 'cerrar', 'terminar', 'termina', 'dale', 'ok', 'vale']
+ADD_WORDS = ['adicionar', 'adiciona', 'sumale', 'agregar', 'agrega', 'añadir', 'añade', 'aumentar', 'aumenta', 'pon', 'poner', 'meter', 'mete']
+CHANGE_WORDS = ['cambiar', 'cambia', 'modificar', 'modifica', 'corregir', 'corrige', 'actualizar', 'actualiza', 'ajustar', 'ajusta', 'cambio', 'cambios', 'modificacion', 'modificaciones']
+REMOVE_WORDS = ['quitar', 'quita', 'eliminar', 'elimina', 'sacar', 'saca', 'borrar', 'borra', 'sustraccion', 'sustraer', 'restar', 'resta', 'borrale']
+SALE_WORDS = ['vender', 'vende', 'registrar', 'registra']
+
+# "otro", "otra coca": se refiere a algo que ya está en el carrito
+REPEAT_WORDS = frozenset(['otro', 'otra', 'otros', 'otras'])
+REPEAT_FILLERS = frozenset(['mas', 'más', 'igual', 'igualito', 'de', 'del', 'el', 'la'])
+
+# Fracción por token (las formas plurales multiplican: "tres cuartos")
+FRACTION_WORDS = {
+    'medio': 0.5, 'media': 0.5, 'medios': 0.5, 'medias': 0.5,
+    'cuarto': 0.25, 'cuartos': 0.25, 'cuartito': 0.25, 'cuartitos': 0.25,
+    'tercio': 1/3, 'tercios': 1/3, 'tercera': 1/3,
+}
+
+UNIT_WORDS = frozenset(['kilo', 'kilos', 'kg', 'litro', 'litros', 'unidad', 'unidades', 'parte'])
+ITEM_FILLERS = frozenset(['de', 'del', 'la', 'el', 'los', 'las'])
+REMOVE_FILLERS = frozenset(['el', 'la', 'los', 'las', 'un', 'una', 'de', 'del'])
+
+# Pronombres pegados al verbo: "quítale", "agrégale", "ponle"
+ENCLITICS = ('les', 'le', 'lo', 'la', 'me')
+
+# ========================================
+# PATRONES COMPILADOS
+# ========================================
+TOKEN_RE = re.compile(r"\d+/\d+|\d+(?:[.,]\d+)?(?![^\W_])|[^\W_]+")
+DECIMAL_RE = re.compile(r"^\d+(?:[.,]\d+)?$")
+RATIO_RE = re.compile(r"^(\d+)/(\d+)$")
+
+PRICE_OF_RE = re.compile(r'precio\s+(?:de\s+)?(.+?)\s+a\s+(\d+(?:\.\d+)?)\s*soles?')
+PRICE_TO_RE = re.compile(r'(?:cambiar\s+precio\s+(?:de\s+)?)?(.+?)\s+a\s+(\d+(?:\.\d+)?)\s*soles?')
+PRICE_BARE_RE = re.compile(r'precio\s+(.+?)\s+(\d+(?:\.\d+)?)\s*(?:soles?)?')
+PRICE_NOISE_RE = re.compile(r'\b(cambiar|precio|modificar|cambia|modifica|de|del|la|el)\b')
+PRODUCT_CHANGE_RE = re.compile(r'(?:cambiar|cambia|cambio)\s+(.+?)\s+por\s+(.+)')
+CHANGE_NOISE_RE = re.compile(r'\b(el|la|los|las|un|una)\b')
+
+_ACCENTS = str.maketrans('áéíóúü', 'aeiouu')
+
+
+def _build_keywords() -> Dict[str, FrozenSet[str]]:
+    table: Dict[str, set] = {}
+    for kind, words in (
+        ('cancel', CANCEL_WORDS),
+        ('confirm', CONFIRM_WORDS),
+        ('add', ADD_WORDS),
+        ('change', CHANGE_WORDS),
+        ('remove', REMOVE_WORDS),
+        ('sale', SALE_WORDS),
+    ):
+        for word in words:
+            table.setdefault(word.translate(_ACCENTS), set()).add(kind)
+    return {word: frozenset(kinds) for word, kinds in table.items()}
+
+
+KEYWORDS = _build_keywords()
+_NO_KINDS: FrozenSet[str] = frozenset()
+
+
+# ========================================
+# TOKENS
+# ========================================
+def tokenize(text: str) -> List[str]:
+    """Separar el texto en tokens (palabras, números y fracciones 1/2)"""
+    return TOKEN_RE.findall(text.lower())
+
+
+@lru_cache(maxsize=4096)
+def keyword_kinds(token: str) -> FrozenSet[str]:
+    """Tipos de comando que activa un token (con o sin pronombre pegado)"""
+    folded = token.translate(_ACCENTS)
+    kinds = KEYWORDS.get(folded)
+    if kinds is not None:
+        return kinds
+
+    for suffix in ENCLITICS:
+        if folded.endswith(suffix) and len(folded) > len(suffix) + 2:
+            kinds = KEYWORDS.get(folded[:-len(suffix)])
+            if kinds is not None:
+                return kinds
+    return _NO_KINDS
+
+
+@lru_cache(maxsize=4096)
+def number_value(token: str) -> Optional[float]:
+    """Valor numérico de un token ("dos", "3", "2.5", "1/2")"""
+    if token in NUMBERS:
+        return float(NUMBERS[token])
+    if DECIMAL_RE.match(token):
+        return float(token.replace(',', '.'))
+    match = RATIO_RE.match(token)
+    if match and int(match.group(2)):
+        return int(match.group(1)) / int(match.group(2))
+    return None
+
+
+def _is_quantity_token(token: str) -> bool:
+    return token in FRACTION_WORDS or token in UNIT_WORDS or number_value(token) is not None
+
+
+# ========================================
+# CLASIFICACIÓN
+# ========================================
+def detect_command_type(tokens: List[str]) -> str:
+    """Clasificar el comando con una sola pasada sobre los tokens"""
+    kinds = set()
+    has_por = has_a = has_precio = price_to = False
+
+    for i, token in enumerate(tokens):
+        kinds |= keyword_kinds(token)
+        if token == 'por':
+            has_por = True
+        elif token == 'precio':
+            has_precio = True
+        elif token == 'a':
+            has_a = True
+            # "a 5 soles"
+            if (
+                i + 2 < len(tokens)
+                and DECIMAL_RE.match(tokens[i + 1])
+                and tokens[i + 2] in ('sol', 'soles')
+            ):
+                price_to = True
+
+    if 'cancel' in kinds and 'remove' not in kinds:
+        return 'cancel'
+    if 'confirm' in kinds:
+        return 'confirm'
+    if 'add' in kinds:
+        return 'add'
+    if has_por and 'change' in kinds:
+        return 'change_product'
+    if price_to:
+        return 'change_price'
+    if has_precio and has_a:
+        return 'change_price'
+    if 'change' in kinds:
+        return 'change'
+    if 'remove' in kinds:
+        return 'remove'
+    return 'sale'
+
+
+# ========================================
+# CANTIDADES E ITEMS
+# ========================================
+def quantity_value(tokens: List[str]) -> Optional[float]:
+    """
+    Cantidad expresada por una secuencia de tokens
+
+    El primer número manda; una fracción lo multiplica ("tres cuartos",
+    "un medio") o vale por sí sola ("medio kilo").
+    """
+    value = None
+    number = None
+    for token in tokens:
+        fraction = FRACTION_WORDS.get(token)
+        if fraction is not None:
+            value = number * fraction if number is not None else fraction
+            number = None
+            continue
+
+        n = number_value(token)
+        if n is not None and value is None:
+            value = number = n
+    return value
+
+
+def parse_segment(tokens: List[str]) -> Tuple[Optional[float], List[str], bool]:
+    """
+    Separar cantidad y producto de un segmento
+
+    Los tokens de cantidad se toman antes y después del nombre del
+    producto; dentro del nombre solo se quitan artículos y unidades.
+
+    Returns:
+        (cantidad o None, tokens del producto, empieza con fracción)
+    """
+    product_positions = [
+        i for i, token in enumerate(tokens)
+        if token not in ITEM_FILLERS and not _is_quantity_token(token)
+    ]
+    starts_with_fraction = bool(tokens) and tokens[0] in FRACTION_WORDS
+
+    if not product_positions:
+        return quantity_value(tokens), [], starts_with_fraction
+
+    first, last = product_positions[0], product_positions[-1]
+    quantity = quantity_value(tokens[:first] + tokens[last + 1:])
+    product = [
+        token for token in tokens[first:last + 1]
+        if token not in ITEM_FILLERS and token not in UNIT_WORDS
+    ]
+    return quantity, product, starts_with_fraction
+
+
+def parse_items(tokens: List[str]) -> List[Dict]:
+    """
+    Extraer items de venta ("dos panes y un kilo y medio de arroz")
+
+    Un segmento que empieza con fracción y no trae producto completa al
+    item anterior ("dos panes y medio"); si el anterior solo tenía cantidad
+    ("un kilo y medio de arroz") se suman.
+    """
+    tokens = [t for t in tokens if not keyword_kinds(t) & {'add', 'sale'}]
+
+    segments: List[List[str]] = [[]]
+    for token in tokens:
+        if token == 'y':
+            segments.append([])
+        else:
+            segments[-1].append(token)
+
+    items: List[Dict] = []
+    pending = None  # cantidad sin producto ("un kilo" en "un kilo y medio de arroz")
+    previous_open = False  # el item anterior aún acepta "y medio"
+
+    for segment in segments:
+        if not segment:
+            continue
+
+        quantity, product, starts_with_fraction = parse_segment(segment)
+
+        if pending is not None and starts_with_fraction and quantity is not None:
+            quantity += pending
+            pending = None
+
+        if product:
+            items.append({
+                'quantity': quantity if quantity is not None else 1.0,
+                'product_query': ' '.join(product)
+            })
+            pending = None
+            previous_open = True
+        elif quantity is not None:
+            if starts_with_fraction and items and previous_open:
+                items[-1]['quantity'] += quantity
+                previous_open = False
+            else:
+                pending = quantity
+
+    return items
+
+
+def parse_remove(tokens: List[str]) -> Optional[str]:
+    """Producto a quitar: todo lo que no es verbo de quitar ni artículo"""
+    words = [
+        t for t in tokens
+        if 'remove' not in keyword_kinds(t) and t not in REMOVE_FILLERS
+    ]
+    return ' '.join(words) if words else None
+
+
+def parse_repeat(query: str) -> Tuple[bool, Optional[str]]:
+    """
+    Separar "otro" del producto ("otro" → (True, None), "otra coca" → (True, "coca"))
+    """
+    tokens = tokenize(query)
+    if not tokens or tokens[0] not in REPEAT_WORDS:
+        return False, None
+    words = [t for t in tokens[1:] if t not in REPEAT_FILLERS]
+    return True, (' '.join(words) if words else None)
+
+
+def parse_price_change(text: str) -> Optional[Dict]:
+    """Parsear cambio de precio ("precio del pan a 2 soles")"""
+    match = PRICE_OF_RE.search(text)
+    if match:
+        return {
+            'product_query': match.group(1).strip(),
+            'new_price': float(match.group(2))
+        }
+
+    if ' y ' not in text:
+        match = PRICE_TO_RE.search(text)
+        if match:
+            product_text = PRICE_NOISE_RE.sub('', match.group(1)).strip()
+            product_text = ' '.join(product_text.split())
+            if product_text:
+                return {
+                    'product_query': product_text,
+                    'new_price': float(match.group(2))
+                }
+
+    match = PRICE_BARE_RE.search(text)
+    if match:
+        return {
+            'product_query': match.group(1).strip(),
+            'new_price': float(match.group(2))
+        }
+
+    return None
+
+
+def parse_product_change(text: str) -> Optional[Dict]:
+    """Parsear cambio de producto ("cambia la coca por inca kola")"""
+    match = PRODUCT_CHANGE_RE.search(text)
+    if not match:
+        return None
+
+    old_product = ' '.join(CHANGE_NOISE_RE.sub('', match.group(1)).split())
+    new_product = ' '.join(CHANGE_NOISE_RE.sub('', match.group(2)).split())
+    return {
+        'old_product': old_product,
+        'new_product': new_product
+    }
@@ -1,177 +1,130 @@
-import re
-from typing import Dict, List, Optional
-from difflib import SequenceMatcher
-from app.models.product import Product
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from app.services.product_index import product_index_registry, PHONETIC_SCORE
+from app.services.catalog_cache import CatalogProduct, CatalogSnapshot
+from app.services.cart_service import Cart
+from app.services import voice_grammar as grammar
+from app.services.voice_cache import parse_cache, resolution_cache
+from app.services.learned_alias_service import learned_alias_cache
+from app.core.timing import stage
+from app.core.text import normalize_text, search_key
 
-class VoiceService:
+# Máximo de opciones que se ofrecen cuando un producto es ambiguo
+MAX_AMBIGUOUS_OPTIONS = 4
+
+
+class VoiceCommandError(ValueError):
+    """
+    Un comando de voz no se puede resolver (producto no encontrado, sin
+    stock...). status_code es el código HTTP que deben devolver los routers.
+    """
     
-    # Variable de clase para opciones ambiguas
-    _last_ambiguous_options = []
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class ProductMatch:
+    """
+    Resultado de buscar un producto por voz
     
-    FRACTIONS = {
-        'medio': 0.5, 'media': 0.5, 'un medio': 0.5, 'una media': 0.5,
-        'cuarto': 0.25, 'un cuarto': 0.25, 'cuartito': 0.25,
-        'tres cuartos': 0.75, 'tres cuartitos': 0.75,
-        'tercio': 1/3, 'un tercio': 1/3, 'una tercera parte': 1/3,
-        'dos tercios': 2/3, 'dos tercio': 2/3,
-    }
+    Es un valor por request: no comparte estado entre búsquedas, así que
+    el matcher puede usarse en paralelo sin que se mezclen las opciones.
+    """
+    query: str
+    product: Optional[CatalogProduct] = None
+    candidates: List[Tuple[CatalogProduct, float]] = field(default_factory=list)
+    ambiguous: bool = False
     
-    NUMBERS = {
-        'un': 1, 'uno': 1, 'una': 1,
-        'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5,
-        'seis': 6, 'siete': 7, 'ocho': 8, 'nueve': 9, 'diez': 10,
-        'once': 11, 'doce': 12, 'quince': 15, 'veinte': 20,
-        'treinta': 30, 'cuarenta': 40, 'cincuenta': 50,
-    }
+    @property
+    def options(self) -> List[CatalogProduct]:
+        """Productos a ofrecer al usuario cuando el match es ambiguo"""
+        if not self.ambiguous:
+            return []
+        return [product for product, _ in self.candidates[:MAX_AMBIGUOUS_OPTIONS]]
+
+
+class VoiceService:
+    
+    FRACTIONS = grammar.FRACTIONS
+    NUMBERS = grammar.NUMBERS
     
     # Comandos especiales
-    CANCEL_WORDS = ['cancelar', 'anular', 'borra', 'borrar', 'elimina', 'eliminar']
-    CONFIRM_WORDS = ['listo', 'total', 'confirmar', 'suma', 'sumar', 'cierra', 'cerrar', 'terminar', 'termina', 'dale', 'ok', 'vale']
-    ADD_WORDS = ['adicionar', 'adiciona', 'sumale', 'agregar', 'agrega', 'añadir', 'añade', 'aumentar', 'aumenta', 'pon', 'poner', 'meter', 'mete']
-    CHANGE_WORDS = ['cambiar', 'cambia', 'modificar', 'modifica', 'corregir', 'corrige', 'actualizar', 'actualiza', 'ajustar', 'ajusta', 'cambio', 'cambios', 'modificacion', 'modificaciones']
-    REMOVE_WORDS = ['quitar', 'quita', 'eliminar', 'elimina', 'sacar', 'saca', 'borrar', 'borra', 'sustraccion', 'sustraer', 'restar', 'resta', 'borrale']
+    CANCEL_WORDS = grammar.CANCEL_WORDS
+    CONFIRM_WORDS = grammar.CONFIRM_WORDS
+    ADD_WORDS = grammar.ADD_WORDS
+    CHANGE_WORDS = grammar.CHANGE_WORDS
+    REMOVE_WORDS = grammar.REMOVE_WORDS
     
     @staticmethod
     def detect_command_type(text: str) -> str:
         """Detectar tipo de comando"""
-        text_lower = text.lower()
-        
-        if any(word in text_lower for word in VoiceService.CANCEL_WORDS):
-            if not any(word in text_lower for word in VoiceService.REMOVE_WORDS):
-                return 'cancel'
-        
-        if any(word in text_lower for word in VoiceService.CONFIRM_WORDS):
-            return 'confirm'
-        
-        if any(word in text_lower for word in VoiceService.ADD_WORDS):
-            return 'add'
-        
-        if ' por ' in text_lower and any(word in text_lower for word in VoiceService.CHANGE_WORDS):
-            return 'change_product'
-        
-        if re.search(r'\ba\s+\d+\s*soles?\b', text_lower):
-            return 'change_price'
-        
-        if 'precio' in text_lower and ' a ' in text_lower:
-            return 'change_price'
-        
-        if any(word in text_lower for word in VoiceService.CHANGE_WORDS):
-            return 'change'
-        
-        if any(word in text_lower for word in VoiceService.REMOVE_WORDS):
-            return 'remove'
-        
-        return 'sale'
+        return grammar.detect_command_type(grammar.tokenize(text))
     
     @staticmethod
     def parse_price_change(text: str) -> Optional[Dict]:
         """Parsear cambio de precio"""
-        text_lower = text.lower()
-        
-        match = re.search(r'precio\s+(?:de\s+)?(.+?)\s+a\s+(\d+(?:\.\d+)?)\s*soles?', text_lower)
-        if match:
-            return {
-                'product_query': match.group(1).strip(),
-                'new_price': float(match.group(2))
-            }
-        
-        if ' y ' not in text_lower:
-            match = re.search(r'(?:cambiar\s+precio\s+(?:de\s+)?)?(.+?)\s+a\s+(\d+(?:\.\d+)?)\s*soles?', text_lower)
-            if match:
-                product_text = match.group(1).strip()
-                product_text = re.sub(r'\b(cambiar|precio|modificar|cambia|modifica|de|del|la|el)\b', '', product_text).strip()
-                if product_text:
-                    return {
-                        'product_query': product_text,
-                        'new_price': float(match.group(2))
-                    }
-        
-        match = re.search(r'precio\s+(.+?)\s+(\d+(?:\.\d+)?)\s*(?:soles?)?', text_lower)
-        if match:
-            return {
-                'product_query': match.group(1).strip(),
-                'new_price': float(match.group(2))
-            }
-        
-        return None
+        return grammar.parse_price_change(text.lower())
     
     @staticmethod
     def parse_product_change(text: str) -> Optional[Dict]:
         """Parsear cambio de producto"""
-        text_lower = text.lower()
-        
-        match = re.search(r'(?:cambiar|cambia|cambio)\s+(.+?)\s+por\s+(.+)', text_lower)
-        if match:
-            old_prod = match.group(1).strip()
-            new_prod = match.group(2).strip()
-            
-            old_prod = re.sub(r'\b(el|la|los|las|un|una)\b', '', old_prod).strip()
-            new_prod = re.sub(r'\b(el|la|los|las|un|una)\b', '', new_prod).strip()
-            
-            return {
-                'old_product': old_prod,
-                'new_product': new_prod
-            }
-        
-        return None
+        return grammar.parse_product_change(text.lower())
     
     @staticmethod
     def parse_remove(text: str) -> Optional[str]:
         """Parsear eliminación de producto"""
-        text_lower = text.lower()
-        
-        for word in VoiceService.REMOVE_WORDS:
-            text_lower = text_lower.replace(word, '').strip()
-        
-        text_lower = re.sub(r'\b(el|la|los|las|un|una|de|del)\b', '', text_lower).strip()
-        
-        return text_lower if text_lower else None
+        return grammar.parse_remove(grammar.tokenize(text))
     
     @staticmethod
     def parse_quantity(text: str) -> Optional[float]:
-        """Parsear cantidad con fracciones"""
-        text = text.lower().strip()
-        text = re.sub(r'\b(kilo|kilos|kg|litro|litros|unidad|unidades)\b', '', text).strip()
-        
-        match = re.search(r'(\w+)\s+y\s+(\w+)', text)
-        if match:
-            base_text = match.group(1)
-            fraction_text = match.group(2)
-            
-            if base_text.isdigit():
-                base = float(base_text)
-            elif base_text in VoiceService.NUMBERS:
-                base = float(VoiceService.NUMBERS[base_text])
-            elif base_text in ['kilo', 'litro', 'unidad']:
-                base = 1.0
-            else:
-                base = 0
-            
-            fraction = VoiceService.FRACTIONS.get(fraction_text, 0)
-            return base + fraction
+        """Parsear cantidad con fracciones ("dos", "medio", "uno y medio")"""
+        tokens = grammar.tokenize(text)
+        
+        if 'y' in tokens:
+            i = tokens.index('y')
+            left, right = tokens[:i], tokens[i + 1:]
+            if right and right[0] in grammar.FRACTION_WORDS:
+                base = grammar.quantity_value(left)
+                if base is None:
+                    base = 1.0 if any(t in grammar.UNIT_WORDS for t in left) else 0.0
+                return base + grammar.quantity_value(right)
+        
+        return grammar.quantity_value(tokens)
+    
+    @staticmethod
+    @stage('parse')
+    def parse_command(text: str, use_cache: bool = True) -> Optional[Dict]:
+        """
+        Parsear comando completo
         
-        for phrase, value in VoiceService.FRACTIONS.items():
-            if phrase in text:
-                return value
+        Args:
+            text: Texto reconocido por el micrófono
+            use_cache: Reusar el resultado si el mismo texto ya se parseó
+        """
+        key = normalize_text(text)
         
-        for word, value in VoiceService.NUMBERS.items():
-            if word in text:
-                return float(value)
+        if use_cache:
+            cached = parse_cache.get(key)
+            if cached is not None:
+                print(f"[VoiceService] Caché: '{key}' → {cached['type']}")
+                return cached
         
-        match = re.search(r'\b(\d+(?:\.\d+)?)\b', text)
-        if match:
-            return float(match.group(1))
+        parsed = VoiceService._parse_command(key)
         
-        return None
+        if use_cache and parsed is not None:
+            parse_cache.set(key, parsed)
+        return parsed
     
     @staticmethod
-    def parse_command(text: str) -> Optional[Dict]:
-        """Parsear comando completo"""
-        text = text.lower().strip()
-        
+    def _parse_command(text: str) -> Optional[Dict]:
+        """Parsear comando sin caché (texto ya normalizado)"""
         print(f"[VoiceService] Parseando: '{text}'")
         
-        command_type = VoiceService.detect_command_type(text)
+        tokens = grammar.tokenize(text)
+        command_type = grammar.detect_command_type(tokens)
         print(f"[VoiceService] Tipo detectado: {command_type}")
         
         if command_type == 'cancel':
@@ -181,7 +134,7 @@ class VoiceService:
             return {'type': 'confirm'}
         
         if command_type == 'change_product':
-            product_change = VoiceService.parse_product_change(text)
+            product_change = grammar.parse_product_change(text)
             if product_change:
                 print(f"[VoiceService] Cambio de producto: {product_change}")
                 return {
@@ -190,7 +143,7 @@ class VoiceService:
                 }
         
         if command_type == 'change_price':
-            price_change = VoiceService.parse_price_change(text)
+            price_change = grammar.parse_price_change(text)
             if price_change:
                 print(f"[VoiceService] Cambio de precio: {price_change}")
                 return {
@@ -199,7 +152,7 @@ class VoiceService:
                 }
         
         if command_type == 'change':
-            price_change = VoiceService.parse_price_change(text)
+            price_change = grammar.parse_price_change(text)
             if price_change:
                 print(f"[VoiceService] Cambio de precio: {price_change}")
                 return {
@@ -207,7 +160,7 @@ class VoiceService:
                     **price_change
                 }
             
-            product_change = VoiceService.parse_product_change(text)
+            product_change = grammar.parse_product_change(text)
             if product_change:
                 print(f"[VoiceService] Cambio de producto: {product_change}")
                 return {
@@ -216,7 +169,7 @@ class VoiceService:
                 }
         
         if command_type == 'remove':
-            product_query = VoiceService.parse_remove(text)
+            product_query = grammar.parse_remove(tokens)
             if product_query:
                 print(f"[VoiceService] Eliminar: {product_query}")
                 return {
@@ -225,28 +178,15 @@ class VoiceService:
                 }
         
         action = 'add' if command_type == 'add' else 'sale'
-        cleaned_text = text
-        for word in VoiceService.ADD_WORDS + ['vender', 'vende', 'registrar', 'registra']:
-            cleaned_text = cleaned_text.replace(word, '').strip()
-        
-        items = []
-        if ' y ' in cleaned_text:
-            parts = cleaned_text.split(' y ')
-            print(f"[VoiceService] Detectados {len(parts)} productos separados por 'y'")
-            for part in parts:
-                parsed = VoiceService._parse_single_item(part.strip())
-                if parsed:
-                    items.append(parsed)
-        else:
-            parsed = VoiceService._parse_single_item(cleaned_text)
-            if parsed:
-                items.append(parsed)
+        items = grammar.parse_items(tokens)
         
         if not items:
             print(f"[VoiceService] No se pudieron parsear items")
             return None
         
         print(f"[VoiceService] Items parseados: {len(items)}")
+        for item in items:
+            print(f"[VoiceService]   - cantidad={item['quantity']}, producto='{item['product_query']}'")
         return {
             'type': action,
             'items': items
@@ -255,101 +195,493 @@ class VoiceService:
     @staticmethod
     def _parse_single_item(text: str) -> Optional[Dict]:
         """Parsear un solo item"""
-        quantity = VoiceService.parse_quantity(text)
-        if quantity is None:
-            quantity = 1.0
-        
-        product_query = text
-        product_query = re.sub(r'\b\d+(?:\.\d+)?\b', '', product_query)
-        
-        for phrase in VoiceService.FRACTIONS.keys():
-            product_query = product_query.replace(phrase, '')
-        
-        for word in VoiceService.NUMBERS.keys():
-            product_query = product_query.replace(word, '')
+        quantity, product, _ = grammar.parse_segment(grammar.tokenize(text))
+        if not product:
+            return None
         
-        product_query = re.sub(r'\b(de|del|la|el|los|las)\b', '', product_query)
-        product_query = re.sub(r'\b(kilo|kilos|kg|litro|litros|unidad|unidades)\b', '', product_query)
+        return {
+            'quantity': quantity if quantity is not None else 1.0,
+            'product_query': ' '.join(product)
+        }
+    
+    @staticmethod
+    @stage('match')
+    def score_queries(queries: List[str], catalog: Optional[CatalogSnapshot]) -> List[Optional[Dict[int, float]]]:
+        """
+        Puntuar todos los queries de un comando contra el catálogo en un lote
         
-        product_query = ' '.join(product_query.split()).strip()
+        Args:
+            queries: Textos de producto tal como salen de parse_command
+            catalog: Catálogo activo de la tienda (ProductService.get_catalog)
         
-        if not product_query:
-            return None
+        Returns:
+            Por cada query, dict product_id -> puntaje (None si el query
+            ya está en la caché de resoluciones, fue aprendido o tiene
+            coincidencia exacta o fonética, que no necesitan puntaje)
+        """
+        if not catalog or not catalog.products or not queries:
+            return [{} for _ in queries]
         
-        print(f"[VoiceService]   - cantidad={quantity}, producto='{product_query}'")
+        keys = [search_key(q) for q in queries]
         
-        return {
-            'quantity': quantity,
-            'product_query': product_query
+        # Los queries ya resueltos (aprendidos o en caché) no se puntúan
+        pending = {
+            key for key in keys
+            if learned_alias_cache.lookup(catalog.store_id, key) is None
+            and not resolution_cache.contains((catalog.store_id, catalog.version, key))
         }
+        if not pending:
+            return [None for _ in queries]
+        
+        # Tampoco los que tienen coincidencia exacta o fonética
+        index = product_index_registry.for_catalog(catalog).index
+        pending = sorted(
+            key for key in pending
+            if not index.exact_matches(key) and not index.phonetic_matches(key)
+        )
+        scored = dict(zip(pending, index.score(pending))) if pending else {}
+        return [scored.get(key) for key in keys]
     
     @staticmethod
-    def find_product_fuzzy(query: str, products: List[Product]) -> Optional[Product]:
+    @stage('match')
+    def find_product_fuzzy(
+        query: str,
+        catalog: Optional[CatalogSnapshot],
+        scores: Optional[Dict[int, float]] = None
+    ) -> ProductMatch:
         """
         Buscar producto con fuzzy matching.
-        Si hay múltiples matches similares, devuelve None y guarda opciones.
+        
+        Args:
+            query: Texto del producto
+            catalog: Catálogo activo de la tienda (ProductService.get_catalog)
+            scores: Puntajes ya calculados con score_queries (opcional)
+        
+        Returns:
+            ProductMatch con el mejor producto, los candidatos ordenados por
+            puntaje y si el resultado es ambiguo (top 2 a menos de 10 puntos)
         """
-        if not products:
+        match = ProductMatch(query=query)
+        if not catalog or not catalog.products:
+            return match
+        
+        key = search_key(query)
+        
+        # Lo que el cajero ya eligió antes para este mismo texto
+        learned_id = learned_alias_cache.lookup(catalog.store_id, key)
+        
+        # La caché va antes de tocar el catálogo: solo hace falta su versión
+        cache_key = (catalog.store_id, catalog.version, key)
+        cached = resolution_cache.get(cache_key) if learned_id is None else None
+        
+        view = product_index_registry.for_catalog(catalog)
+        by_id = view.by_id
+        
+        if cached is not None:
+            print(f"[VoiceService] '{query}' → caché")
+            match.product = by_id.get(cached['product_id'])
+            match.candidates = [(by_id[pid], score) for pid, score in cached['candidates']]
+            match.ambiguous = cached['ambiguous']
+            return match
+        
+        if learned_id in by_id:
+            match.product = by_id[learned_id]
+            match.candidates = [(match.product, 100.0)]
+            print(f"[VoiceService] '{query}' → '{match.product.name}' (aprendido)")
+            return match
+        
+        VoiceService._resolve(match, key, view.index, by_id, view.position, scores)
+        resolution_cache.set(cache_key, {
+            'product_id': match.product.id if match.product else None,
+            'candidates': [(p.id, score) for p, score in match.candidates],
+            'ambiguous': match.ambiguous
+        })
+        return match
+    
+    @staticmethod
+    @stage('match')
+    def find_product_in(
+        query: str,
+        catalog: Optional[CatalogSnapshot],
+        product_ids: List[int]
+    ) -> ProductMatch:
+        """
+        Buscar un producto solo entre algunos del catálogo (los del carrito)
+
+        Usa el mismo índice y la misma escala que find_product_fuzzy pero
+        solo puntúa los productos dados. No pasa por la caché de
+        resoluciones porque el resultado depende del carrito.
+
+        Args:
+            query: Texto del producto
+            catalog: Catálogo activo de la tienda
+            product_ids: IDs entre los que buscar, en orden de preferencia
+        """
+        match = ProductMatch(query=query)
+        if not catalog or not catalog.products or not product_ids:
+            return match
+
+        key = search_key(query)
+        view = product_index_registry.for_catalog(catalog)
+        by_id = {pid: view.by_id[pid] for pid in product_ids if pid in view.by_id}
+        if not by_id:
+            return match
+        position = {pid: i for i, pid in enumerate(product_ids)}
+
+        learned_id = learned_alias_cache.lookup(view.store_id, key)
+        if learned_id in by_id:
+            match.product = by_id[learned_id]
+            match.candidates = [(match.product, 100.0)]
+            return match
+
+        scores = view.index.score_products(key, by_id)
+        return VoiceService._resolve(match, key, view.index, by_id, position, scores)
+
+    @staticmethod
+    def get_product(catalog: Optional[CatalogSnapshot], product_id: int):
+        """Producto activo del catálogo por ID (None si no está)"""
+        if not catalog:
             return None
+        return product_index_registry.for_catalog(catalog).by_id.get(product_id)
+
+    @staticmethod
+    def _resolve(
+        match: ProductMatch,
+        query: str,
+        index,
+        by_id: Dict[int, CatalogProduct],
+        position: Dict[int, int],
+        scores: Optional[Dict[int, float]]
+    ) -> ProductMatch:
+        """Resolver un query (ya como clave de búsqueda) contra el índice (sin caché)"""
+        # Coincidencia exacta de nombre o alias (gana el primero del catálogo)
+        exact_ids = [pid for pid in index.exact_matches(query) if pid in by_id]
+        if exact_ids:
+            match.product = by_id[min(exact_ids, key=position.get)]
+            match.candidates = [(match.product, 100.0)]
+            return match
+        
+        # Suena igual que un nombre o alias ("inka kola", "gaseoza", "coca kola")
+        phonetic_ids = sorted(
+            (pid for pid in index.phonetic_matches(query) if pid in by_id),
+            key=position.get
+        )
+        if phonetic_ids:
+            match.candidates = [(by_id[pid], float(PHONETIC_SCORE)) for pid in phonetic_ids]
+            if len(phonetic_ids) > 1:
+                print(f"[VoiceService] '{query}' → AMBIGUO (fonético): {len(phonetic_ids)} opciones")
+                match.ambiguous = True
+                return match
+            match.product = match.candidates[0][0]
+            print(f"[VoiceService] '{query}' → '{match.product.name}' (fonético)")
+            return match
+        
+        if scores is None:
+            scores = index.score([query])[0]
+        
+        candidates = [
+            (by_id[pid], score)
+            for pid, score in sorted(scores.items(), key=lambda x: position.get(x[0], 0))
+            if pid in by_id
+        ]
+        candidates.sort(key=lambda x: x[1], reverse=True)
+        match.candidates = candidates
+        
+        if not candidates:
+            print(f"[VoiceService] '{query}' → NO ENCONTRADO")
+            return match
         
-        query = query.lower().strip()
-        query_singular = query.rstrip('s')
+        # Si hay múltiples matches con score similar, es ambiguo
+        if len(candidates) > 1 and candidates[0][1] - candidates[1][1] < 10:
+            print(f"[VoiceService] '{query}' → AMBIGUO: {len(candidates)} opciones similares")
+            match.ambiguous = True
+            return match
+        
+        match.product = candidates[0][0]
+        print(f"[VoiceService] '{query}' → '{match.product.name}' (score: {candidates[0][1]:.1f})")
+        return match
+
+
+def find_product(
+    query: str,
+    catalog: Optional[CatalogSnapshot],
+    cart: Optional[Cart] = None,
+    scores: Optional[Dict[int, float]] = None
+) -> ProductMatch:
+    """Buscar primero entre los productos del carrito y luego en todo el catálogo"""
+    if cart is not None and cart.items:
+        match = VoiceService.find_product_in(query, catalog, cart.product_ids)
+        if match.product or match.ambiguous:
+            return match
+    return VoiceService.find_product_fuzzy(query, catalog, scores)
+
+
+def resolve_voice_command(
+    parsed: Dict,
+    catalog: Optional[CatalogSnapshot],
+    item_scores: Optional[List] = None,
+    cart: Optional[Cart] = None
+) -> Dict:
+    """
+    Resolver un comando ya parseado contra el catálogo de la tienda
+    
+    Args:
+        parsed: Resultado de VoiceService.parse_command
+        catalog: Catálogo activo de la tienda (None para cancelar/confirmar)
+        item_scores: Puntajes ya calculados para los items (opcional)
+        cart: Carrito del servidor; quitar, cambiar y "otro" buscan
+            primero entre sus productos (opcional)
+    
+    Returns:
+        Respuesta del endpoint /voice/parse
+    
+    Raises:
+        VoiceCommandError: Si no se encuentra un producto o no hay stock
+    """
+    # Comandos simples
+    if parsed['type'] in ['cancel', 'confirm']:
+        return {
+            "type": parsed['type'],
+            "message": "Comando recibido"
+        }
+    
+    # ========================================
+    # COMANDO: REMOVE (quitar producto)
+    # ========================================
+    if parsed['type'] == 'remove':
+        match = find_product(parsed['product_query'], catalog, cart)
+        product = match.product
+        
+        # Verificar ambigüedad
+        if match.ambiguous:
+            return {
+                "type": "ambiguous_remove",
+                "product_query": parsed['product_query'],
+                "options": [
+                    {
+                        "id": p.id,
+                        "name": p.name,
+                        "price": p.sale_price
+                    }
+                    for p in match.options
+                ],
+                "message": f"¿Cuál {parsed['product_query']} quieres eliminar?"
+            }
         
-        matches = []
+        if not product:
+            raise VoiceCommandError(404, f"No se encontró: {parsed['product_query']}")
         
-        for product in products:
-            if not product.is_active:
-                continue
-            
-            product_name = product.name.lower()
-            scores = []
-            
-            if query == product_name:
-                return product
-            
-            if product_name.startswith(query) or product_name.startswith(query_singular):
-                scores.append(80)
-            
-            if query in product_name or query_singular in product_name:
-                scores.append(60)
-            
-            similarity = SequenceMatcher(None, query, product_name).ratio()
-            scores.append(similarity * 50)
-            
-            if hasattr(product, 'aliases') and product.aliases:
-                aliases = []
-                if isinstance(product.aliases, list):
-                    aliases = [a.lower() for a in product.aliases]
-                elif isinstance(product.aliases, str):
-                    aliases = [a.strip().lower() for a in product.aliases.split(',')]
-                
-                for alias in aliases:
-                    if query == alias or query_singular == alias:
-                        return product
-                    if alias.startswith(query) or alias.startswith(query_singular):
-                        scores.append(80)
-                    if query in alias or query_singular in alias:
-                        scores.append(60)
-                    similarity = SequenceMatcher(None, query, alias).ratio()
-                    scores.append(similarity * 50)
-            
-            max_score = max(scores) if scores else 0
-            
-            if max_score > 40:
-                matches.append((product, max_score))
+        return {
+            "type": "remove",
+            "product": {
+                "id": product.id,
+                "name": product.name
+            },
+            "message": f"Eliminar {product.name} del carrito"
+        }
+    
+    # ========================================
+    # COMANDO: CHANGE_PRICE (cambiar precio)
+    # ========================================
+    if parsed['type'] == 'change_price':
+        # Buscar el producto para verificar que existe
+        match = find_product(parsed['product_query'], catalog, cart)
+        product = match.product
+        
+        # Verificar ambigüedad
+        if match.ambiguous:
+            return {
+                "type": "ambiguous_price",
+                "product_query": parsed['product_query'],
+                "new_price": parsed['new_price'],
+                "options": [
+                    {
+                        "id": p.id,
+                        "name": p.name,
+                        "price": p.sale_price
+                    }
+                    for p in match.options
+                ],
+                "message": f"¿A cuál {parsed['product_query']} cambiar el precio?"
+            }
         
-        matches.sort(key=lambda x: x[1], reverse=True)
+        if not product:
+            raise VoiceCommandError(404, f"No se encontró: {parsed['product_query']}")
         
-        if not matches:
-            print(f"[VoiceService] '{query}' → NO ENCONTRADO")
-            return None
+        cart_item = cart.items.get(product.id) if cart is not None else None
         
-        # Si hay múltiples matches con score similar, es ambiguo
-        if len(matches) > 1 and matches[0][1] - matches[1][1] < 10:
-            print(f"[VoiceService] '{query}' → AMBIGUO: {len(matches)} opciones similares")
-            VoiceService._last_ambiguous_options = [m[0] for m in matches[:4]]
-            return None
+        return {
+            "type": "change_price",
+            "product": {
+                "id": product.id,
+                "name": product.name,
+                "current_price": cart_item.unit_price if cart_item else product.sale_price
+            },
+            "new_price": parsed['new_price']
+        }
+    
+    # ========================================
+    # COMANDO: CHANGE_PRODUCT (cambiar X por Y)
+    # ========================================
+    if parsed['type'] == 'change_product':
+        # Buscar producto viejo
+        old_match = find_product(parsed['old_product'], catalog, cart)
+        old_product = old_match.product
+        
+        if old_match.ambiguous:
+            return {
+                "type": "ambiguous_change_old",
+                "old_product_query": parsed['old_product'],
+                "new_product_query": parsed['new_product'],
+                "options": [
+                    {
+                        "id": p.id,
+                        "name": p.name,
+                        "price": p.sale_price
+                    }
+                    for p in old_match.options
+                ],
+                "message": f"¿Cuál {parsed['old_product']} quieres cambiar?"
+            }
+        
+        if not old_product:
+            raise VoiceCommandError(404, f"No se encontró: {parsed['old_product']}")
+        
+        # Buscar producto nuevo
+        new_match = VoiceService.find_product_fuzzy(parsed['new_product'], catalog)
+        new_product = new_match.product
+        
+        if new_match.ambiguous:
+            return {
+                "type": "ambiguous_change_new",
+                "old_product": {
+                    "id": old_product.id,
+                    "name": old_product.name
+                },
+                "new_product_query": parsed['new_product'],
+                "options": [
+                    {
+                        "id": p.id,
+                        "name": p.name,
+                        "price": p.sale_price
+                    }
+                    for p in new_match.options
+                ],
+                "message": f"¿Por cuál {parsed['new_product']} cambiar?"
+            }
+        
+        if not new_product:
+            raise VoiceCommandError(404, f"No se encontró: {parsed['new_product']}")
         
-        best_match = matches[0][0]
-        print(f"[VoiceService] '{query}' → '{best_match.name}' (score: {matches[0][1]:.1f})")
-        return best_match
\ No newline at end of file
+        return {
+            "type": "change_product",
+            "old_product": {
+                "id": old_product.id,
+                "name": old_product.name
+            },
+            "new_product": {
+                "id": new_product.id,
+                "name": new_product.name,
+                "price": new_product.sale_price
+            }
+        }
+    
+    # ========================================
+    # COMANDO: SALE / ADD (venta o agregar)
+    # ========================================
+    cart_items = []
+    not_found = []
+    ambiguous_items = []  # ✅ NUEVO: Lista de items ambiguos
+    repeats_cart = False  # "otro ..." resuelto contra el carrito: se suma, no reemplaza
+    
+    # Puntuar todos los items del comando en una sola pasada
+    if item_scores is None:
+        item_scores = VoiceService.score_queries(
+            [item['product_query'] for item in parsed['items']],
+            catalog
+        )
+    
+    for item, scores in zip(parsed['items'], item_scores):
+        repeat, repeat_query = grammar.parse_repeat(item['product_query'])
+        
+        if repeat and cart is not None and cart.items:
+            repeats_cart = True
+            if repeat_query is None:
+                # "otro": lo último que se agregó
+                last_id = cart.last_item.product_id
+                match = ProductMatch(query=item['product_query'])
+                match.product = VoiceService.get_product(catalog, last_id)
+            else:
+                match = find_product(repeat_query, catalog, cart)
+        else:
+            match = VoiceService.find_product_fuzzy(item['product_query'], catalog, scores)
+        product = match.product
+        
+        # ✅ NUEVO: Verificar si hay ambigüedad
+        if match.ambiguous:
+            ambiguous_items.append({
+                'query': item['product_query'],
+                'quantity': item['quantity'],
+                'options': [
+                    {
+                        'id': p.id,
+                        'name': p.name,
+                        'price': p.sale_price,
+                        'stock': p.stock
+                    }
+                    for p in match.options
+                ]
+            })
+            continue
+        
+        if not product:
+            not_found.append(item['product_query'])
+            continue
+        
+        # Verificar stock
+        if product.stock < item['quantity']:
+            raise VoiceCommandError(
+                400,
+                f"{product.name}: Stock insuficiente. Solo hay {product.stock}"
+            )
+        
+        subtotal = product.sale_price * item['quantity']
+        unit = getattr(product, 'unit', 'unidad')
+        
+        cart_items.append({
+            "product": {
+                "id": product.id,
+                "name": product.name,
+                "price": product.sale_price,
+                "stock": product.stock,
+                "category": product.category,
+                "unit": unit
+            },
+            "quantity": item['quantity'],
+            "subtotal": subtotal
+        })
+    
+    # ✅ NUEVO: Si hay items ambiguos, devolver para que el usuario elija
+    if ambiguous_items:
+        return {
+            "type": "ambiguous",
+            "ambiguous_items": ambiguous_items,
+            "found_items": cart_items,  # Items que sí se encontraron
+            "message": "Hay varios productos que coinciden. ¿Cuál quieres?"
+        }
+    
+    # Si no se encontró nada
+    if not cart_items:
+        raise VoiceCommandError(404, f"No se encontraron: {', '.join(not_found)}")
+    
+    # Respuesta exitosa
+    response = {
+        "type": 'add' if repeats_cart else parsed['type'],
+        "items": cart_items,
+        "total": sum(item['subtotal'] for item in cart_items)
+    }
+    
+    if not_found:
+        response["warning"] = f"No se encontraron: {', '.join(not_found)}"
+    
+    return response
@@ -0,0 +1,169 @@
+"""
+Verificar que leer las ventas del día no hace consultas por cada venta
+Ejecutar: python scripts/check_sale_queries.py [ventas]
+
+Necesita la BD (DATABASE_URL) con al menos una tienda y un usuario. Crea
+productos y ventas de prueba con fecha de hoy, arma la respuesta de todo
+el día (get_sales_by_date con with_details=True + to_response) y de una
+página del historial (get_sales_page) con pocas y con muchas ventas, cuenta
+las consultas SQL y comprueba que:
+  - son siempre las mismas (3), sin importar cuántas ventas haya
+  - sin with_details crecen con las ventas (el N+1 que se evita)
+Al final borra las ventas y los productos de prueba.
+"""
+
+import sys
+import os
+import io
+import time
+import uuid
+import contextlib
+
+# Agregar la raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from sqlalchemy import event
+    from app.core.database import SessionLocal, engine
+    from app.models.product import Product
+    from app.models.sale import Sale, SaleItem, SaleIdempotencyKey
+    from app.models.store import Store
+    from app.models.user import User
+    from app.schemas.sale import OfflineSale
+    from app.services.sale_service import SaleService
+
+TOTAL_SALES = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+FEW_SALES = 5
+ITEMS_PER_SALE = 3
+EXPECTED_QUERIES = 3
+
+
+def check(name: str, ok: bool) -> bool:
+    print(f"  {'✅' if ok else '❌'} {name}")
+    return ok
+
+
+class QueryCounter:
+    """Cuenta las consultas SQL que se ejecutan dentro del with"""
+
+    def __init__(self):
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine, "before_cursor_execute", self._on_execute)
+
+
+def add_sales(store_id: int, user_id: int, products, count: int) -> list:
+    """Crear `count` ventas de hoy con ITEMS_PER_SALE productos cada una"""
+    db = SessionLocal()
+    try:
+        sales = [
+            OfflineSale(
+                client_id=f"check-queries-{uuid.uuid4().hex}",
+                items=[
+                    {"product_id": p.id, "quantity": 1, "unit_price": 1.0, "subtotal": 1.0}
+                    for p in products
+                ],
+                payment_method="efectivo"
+            )
+            for _ in range(count)
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = SaleService(db).sync_sales(sales, user_id, store_id)
+        return [r["sale_id"] for r in result["results"]]
+    finally:
+        db.close()
+
+
+def count_queries(store_id: int, with_details: bool):
+    """Consultas para armar la respuesta de las ventas de hoy (sesión nueva)"""
+    db = SessionLocal()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), QueryCounter() as counter:
+            service = SaleService(db)
+            sales = service.get_sales_by_date(store_id, with_details=with_details)
+            response = [service.to_response(sale) for sale in sales]
+        return counter.count, len(response)
+    finally:
+        db.close()
+
+
+def count_page_queries(store_id: int):
+    """Consultas para armar una página del historial (sesión nueva)"""
+    db = SessionLocal()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), QueryCounter() as counter:
+            service = SaleService(db)
+            sales, _ = service.get_sales_page(store_id)
+            [service.to_response(sale) for sale in sales]
+        return counter.count
+    finally:
+        db.close()
+
+
+def main() -> bool:
+    db = SessionLocal()
+    store = db.query(Store).first()
+    user = db.query(User).filter(User.store_id == store.id).first() if store else None
+    if not store or not user:
+        print("❌ Se necesita una tienda con al menos un usuario (scripts/create_first_user.py)")
+        return False
+
+    stamp = int(time.time())
+    products = [
+        Product(store_id=store.id, name=f"Prueba consultas {stamp} #{i}", sale_price=1.0, stock=0)
+        for i in range(ITEMS_PER_SALE)
+    ]
+    db.add_all(products)
+    db.commit()
+
+    sale_ids = []
+    try:
+        sale_ids += add_sales(store.id, user.id, products, FEW_SALES)
+        few_queries, few_count = count_queries(store.id, with_details=True)
+        few_lazy, _ = count_queries(store.id, with_details=False)
+
+        sale_ids += add_sales(store.id, user.id, products, TOTAL_SALES - FEW_SALES)
+        many_queries, many_count = count_queries(store.id, with_details=True)
+        many_lazy, _ = count_queries(store.id, with_details=False)
+        page_queries = count_page_queries(store.id)
+
+        print(f"📊 {few_count} ventas: {few_queries} consultas (sin with_details: {few_lazy})")
+        print(f"📊 {many_count} ventas: {many_queries} consultas (sin with_details: {many_lazy})")
+        print(f"📊 Página del historial: {page_queries} consultas")
+
+        checks = [
+            check(f"Con with_details son {EXPECTED_QUERIES} consultas",
+                  few_queries == EXPECTED_QUERIES and many_queries == EXPECTED_QUERIES),
+            check("No crecen con el número de ventas", few_queries == many_queries),
+            check("Sin with_details sí crecen (N+1)", many_lazy > few_lazy),
+            check(f"Una página del historial también son {EXPECTED_QUERIES}", page_queries == EXPECTED_QUERIES),
+        ]
+    finally:
+        # Limpiar
+        if sale_ids:
+            db.query(SaleIdempotencyKey).filter(SaleIdempotencyKey.sale_id.in_(sale_ids)).delete(synchronize_session=False)
+            db.query(SaleItem).filter(SaleItem.sale_id.in_(sale_ids)).delete(synchronize_session=False)
+            db.query(Sale).filter(Sale.id.in_(sale_ids)).delete(synchronize_session=False)
+        for product in products:
+            db.delete(product)
+        db.commit()
+        db.close()
+
+    return all(checks)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("CONSULTAS AL LEER VENTAS - QueVendí PRO")
+    print("=" * 60)
+    ok = main()
+    print("=" * 60)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,138 @@
+"""
+Verificar que ventas simultáneas no pierden descuentos de stock
+Ejecutar: python scripts/check_stock_concurrency.py [hilos] [ventas_por_hilo]
+
+Necesita la BD (DATABASE_URL) con al menos una tienda y un usuario. Crea
+un producto temporal con stock justo para la mitad de las ventas, lanza
+todas las ventas a la vez desde varios hilos (cada uno con su sesión) y
+comprueba que:
+  - el stock final = stock inicial - unidades vendidas (ningún descuento perdido)
+  - el stock nunca queda negativo y las ventas de más se rechazan
+Al final borra las ventas y el producto de prueba.
+"""
+
+import sys
+import os
+import io
+import time
+import threading
+import contextlib
+
+# Agregar la raíz del proyecto al path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from app.core.database import SessionLocal
+    from app.models.product import Product
+    from app.models.sale import Sale, SaleItem
+    from app.models.store import Store
+    from app.models.user import User
+    from app.services.sale_service import SaleService, InsufficientStockError
+
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+SALES_PER_THREAD = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+TOTAL_SALES = THREADS * SALES_PER_THREAD
+INITIAL_STOCK = TOTAL_SALES // 2
+
+
+def check(name: str, ok: bool) -> bool:
+    print(f"  {'✅' if ok else '❌'} {name}")
+    return ok
+
+
+def worker(store_id: int, user_id: int, product_id: int, start: threading.Event, results: dict, lock):
+    db = SessionLocal()
+    service = SaleService(db)
+    sale_data = {
+        "items": [{"product_id": product_id, "quantity": 1, "unit_price": 1.0, "subtotal": 1.0}],
+        "payment_method": "efectivo"
+    }
+    start.wait()
+    try:
+        for _ in range(SALES_PER_THREAD):
+            try:
+                sale = service.create_sale(sale_data, user_id, store_id)
+                outcome = "ok"
+                with lock:
+                    results["sale_ids"].append(sale.id)
+            except InsufficientStockError:
+                outcome = "rejected"
+            except Exception as e:
+                outcome = "error"
+                with lock:
+                    results["errors"].append(str(e))
+            with lock:
+                results[outcome] += 1
+    finally:
+        db.close()
+
+
+def main() -> bool:
+    db = SessionLocal()
+    store = db.query(Store).first()
+    user = db.query(User).filter(User.store_id == store.id).first() if store else None
+    if not store or not user:
+        print("❌ Se necesita una tienda con al menos un usuario (scripts/create_first_user.py)")
+        return False
+
+    product = Product(
+        store_id=store.id,
+        name=f"Prueba concurrencia {int(time.time())}",
+        sale_price=1.0,
+        stock=INITIAL_STOCK
+    )
+    db.add(product)
+    db.commit()
+    print(f"📦 {product.name}: stock {INITIAL_STOCK}, {THREADS} hilos x {SALES_PER_THREAD} ventas")
+
+    results = {"ok": 0, "rejected": 0, "error": 0, "sale_ids": [], "errors": []}
+    lock = threading.Lock()
+    start = threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(store.id, user.id, product.id, start, results, lock))
+        for _ in range(THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # La salida de cada venta no interesa aquí
+    with contextlib.redirect_stdout(io.StringIO()):
+        began = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+    db.refresh(product)
+    print(f"⏱️  {TOTAL_SALES} ventas en {elapsed:.2f}s ({TOTAL_SALES / elapsed:.0f} ventas/s)")
+    print(f"   Vendidas: {results['ok']}, rechazadas: {results['rejected']}, errores: {results['error']}")
+    for error in results["errors"][:5]:
+        print(f"   - {error}")
+
+    checks = [
+        check("Ningún descuento perdido (stock final = inicial - vendidas)",
+              product.stock == INITIAL_STOCK - results["ok"]),
+        check("El stock no quedó negativo", product.stock >= 0),
+        check("Se vendió todo el stock y se rechazó el resto",
+              results["ok"] == INITIAL_STOCK and results["rejected"] == TOTAL_SALES - INITIAL_STOCK),
+        check("Sin errores inesperados", results["error"] == 0),
+    ]
+
+    # Limpiar
+    if results["sale_ids"]:
+        db.query(SaleItem).filter(SaleItem.sale_id.in_(results["sale_ids"])).delete(synchronize_session=False)
+        db.query(Sale).filter(Sale.id.in_(results["sale_ids"])).delete(synchronize_session=False)
+    db.delete(product)
+    db.commit()
+    db.close()
+
+    return all(checks)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("CONCURRENCIA DE STOCK EN VENTAS - QueVendí PRO")
+    print("=" * 60)
+    ok = main()
+    print("=" * 60)
+    sys.exit(0 if ok else 1)
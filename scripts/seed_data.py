@@ -0,0 +1,129 @@
+"""
+Productos típicos de bodega peruana
+
+Lo usan scripts/seed_products.py (para cargarlos a una tienda) y los
+benchmarks de voz (para armar catálogos sin base de datos).
+"""
+
+PRODUCTOS_BODEGA = [
+    {
+        "name": "Inca Kola 1L",
+        "aliases": ["inka", "kola amarilla", "inca cola", "gaseosa amarilla"],
+        "category": "Bebidas",
+        "cost_price": 2.80,
+        "sale_price": 3.50,
+        "stock": 24
+    },
+    {
+        "name": "Inca Kola 500ml",
+        "aliases": ["inka mediana", "kola chica", "inca cola chica"],
+        "category": "Bebidas",
+        "cost_price": 1.50,
+        "sale_price": 2.00,
+        "stock": 36
+    },
+    {
+        "name": "Coca Cola 1L",
+        "aliases": ["coca", "cola"],
+        "category": "Bebidas",
+        "cost_price": 3.00,
+        "sale_price": 3.80,
+        "stock": 20
+    },
+    {
+        "name": "Leche Gloria Entera 1L",
+        "aliases": ["gloria", "leche gloria", "leche entera", "leche"],
+        "category": "Lácteos",
+        "cost_price": 3.50,
+        "sale_price": 4.20,
+        "stock": 18
+    },
+    {
+        "name": "Pan Francés",
+        "aliases": ["pan"],
+        "category": "Panadería",
+        "cost_price": 0.20,
+        "sale_price": 0.30,
+        "stock": 100
+    },
+    {
+        "name": "Azúcar Cartavio 1kg",
+        "aliases": ["azucar", "azúcar blanca", "cartavio"],
+        "category": "Abarrotes",
+        "cost_price": 4.50,
+        "sale_price": 5.80,
+        "stock": 12
+    },
+    {
+        "name": "Aceite Primor 1L",
+        "aliases": ["aceite", "primor"],
+        "category": "Abarrotes",
+        "cost_price": 8.00,
+        "sale_price": 9.50,
+        "stock": 15
+    },
+    {
+        "name": "Arroz Costeño 1kg",
+        "aliases": ["arroz", "costeño"],
+        "category": "Abarrotes",
+        "cost_price": 3.20,
+        "sale_price": 4.00,
+        "stock": 30
+    },
+    {
+        "name": "Sal de Mesa 1kg",
+        "aliases": ["sal"],
+        "category": "Abarrotes",
+        "cost_price": 1.00,
+        "sale_price": 1.50,
+        "stock": 25
+    },
+    {
+        "name": "Fideo Don Vittorio 1kg",
+        "aliases": ["fideo", "fideos", "don vittorio"],
+        "category": "Abarrotes",
+        "cost_price": 2.50,
+        "sale_price": 3.20,
+        "stock": 40
+    },
+    {
+        "name": "Galletas Soda Field 6pack",
+        "aliases": ["galletas", "soda", "field", "galletas soda"],
+        "category": "Snacks",
+        "cost_price": 3.50,
+        "sale_price": 4.50,
+        "stock": 22
+    },
+    {
+        "name": "Atún Florida Entero",
+        "aliases": ["atun", "florida"],
+        "category": "Conservas",
+        "cost_price": 3.00,
+        "sale_price": 4.00,
+        "stock": 28
+    },
+    {
+        "name": "Papel Higiénico Suave 4un",
+        "aliases": ["papel", "papel higienico", "suave"],
+        "category": "Limpieza",
+        "cost_price": 4.00,
+        "sale_price": 5.50,
+        "stock": 16
+    },
+    {
+        "name": "Detergente Ariel 1kg",
+        "aliases": ["detergente", "ariel", "jabón"],
+        "category": "Limpieza",
+        "cost_price": 8.50,
+        "sale_price": 10.50,
+        "stock": 12
+    },
+    {
+        "name": "Cerveza Pilsen 650ml",
+        "aliases": ["cerveza", "pilsen", "chela"],
+        "category": "Bebidas",
+        "cost_price": 3.50,
+        "sale_price": 5.00,
+        "stock": 24
+    }
+]
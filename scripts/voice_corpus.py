@@ -0,0 +1,108 @@
+"""
+Corpus etiquetado de comandos de voz de bodega
+
+Cada frase trae lo que el cajero quiso decir (no lo que el sistema
+responde hoy), con nombres de productos de scripts/seed_data.py:
+
+- sale / add: items como (cantidad, producto)
+- remove: producto a quitar
+- change_price: producto y nuevo precio
+- change_product: producto viejo y nuevo
+- cancel / confirm: solo el tipo
+"""
+
+CORPUS = [
+    # Ventas simples
+    {"text": "una inca kola", "type": "sale", "items": [(1, "Inca Kola 1L")]},
+    {"text": "dos panes", "type": "sale", "items": [(2, "Pan Francés")]},
+    {"text": "diez panes", "type": "sale", "items": [(10, "Pan Francés")]},
+    {"text": "vender tres panes", "type": "sale", "items": [(3, "Pan Francés")]},
+    {"text": "vende dos leches", "type": "sale", "items": [(2, "Leche Gloria Entera 1L")]},
+    {"text": "un aceite primor", "type": "sale", "items": [(1, "Aceite Primor 1L")]},
+    {"text": "dos atunes", "type": "sale", "items": [(2, "Atún Florida Entero")]},
+    {"text": "una leche gloria", "type": "sale", "items": [(1, "Leche Gloria Entera 1L")]},
+    {"text": "un papel higienico", "type": "sale", "items": [(1, "Papel Higiénico Suave 4un")]},
+    {"text": "dos papeles", "type": "sale", "items": [(2, "Papel Higiénico Suave 4un")]},
+    {"text": "un detergente ariel", "type": "sale", "items": [(1, "Detergente Ariel 1kg")]},
+    {"text": "dos fideos don vittorio", "type": "sale", "items": [(2, "Fideo Don Vittorio 1kg")]},
+    {"text": "una galleta soda", "type": "sale", "items": [(1, "Galletas Soda Field 6pack")]},
+    {"text": "dos sodas field", "type": "sale", "items": [(2, "Galletas Soda Field 6pack")]},
+    {"text": "tres gaseosas amarillas", "type": "sale", "items": [(3, "Inca Kola 1L")]},
+    {"text": "una inka cola chica", "type": "sale", "items": [(1, "Inca Kola 500ml")]},
+    {"text": "dos kola chica", "type": "sale", "items": [(2, "Inca Kola 500ml")]},
+    {"text": "una pilsen", "type": "sale", "items": [(1, "Cerveza Pilsen 650ml")]},
+    {"text": "un cartavio", "type": "sale", "items": [(1, "Azúcar Cartavio 1kg")]},
+
+    # Fracciones y unidades
+    {"text": "medio kilo de arroz", "type": "sale", "items": [(0.5, "Arroz Costeño 1kg")]},
+    {"text": "un kilo y medio de azucar", "type": "sale", "items": [(1.5, "Azúcar Cartavio 1kg")]},
+    {"text": "tres cuartos de arroz", "type": "sale", "items": [(0.75, "Arroz Costeño 1kg")]},
+    {"text": "un cuarto de azúcar", "type": "sale", "items": [(0.25, "Azúcar Cartavio 1kg")]},
+    {"text": "1/2 kilo de azucar", "type": "sale", "items": [(0.5, "Azúcar Cartavio 1kg")]},
+    {"text": "un kilo de sal", "type": "sale", "items": [(1, "Sal de Mesa 1kg")]},
+    {"text": "cinco panes y medio", "type": "sale", "items": [(5.5, "Pan Francés")]},
+
+    # Varios items con "y"
+    {
+        "text": "dos inca kola y un pan y medio kilo de arroz",
+        "type": "sale",
+        "items": [(2, "Inca Kola 1L"), (1, "Pan Francés"), (0.5, "Arroz Costeño 1kg")]
+    },
+    {
+        "text": "una coca cola y dos chelas",
+        "type": "sale",
+        "items": [(1, "Coca Cola 1L"), (2, "Cerveza Pilsen 650ml")]
+    },
+    {
+        "text": "un pan y una leche y dos atunes",
+        "type": "sale",
+        "items": [(1, "Pan Francés"), (1, "Leche Gloria Entera 1L"), (2, "Atún Florida Entero")]
+    },
+    {
+        "text": "un arroz costeño y una azucar cartavio",
+        "type": "sale",
+        "items": [(1, "Arroz Costeño 1kg"), (1, "Azúcar Cartavio 1kg")]
+    },
+
+    # Errores típicos del reconocimiento de voz
+    {"text": "un aseite", "type": "sale", "items": [(1, "Aceite Primor 1L")]},
+    {"text": "una serbesa pilsen", "type": "sale", "items": [(1, "Cerveza Pilsen 650ml")]},
+    {"text": "dos coca kola", "type": "sale", "items": [(2, "Coca Cola 1L")]},
+
+    # Agregar al carrito
+    {"text": "agrega una coca cola", "type": "add", "items": [(1, "Coca Cola 1L")]},
+    {"text": "añade dos panes", "type": "add", "items": [(2, "Pan Francés")]},
+    {"text": "sumale un atun", "type": "add", "items": [(1, "Atún Florida Entero")]},
+    {"text": "ponle una chela", "type": "add", "items": [(1, "Cerveza Pilsen 650ml")]},
+
+    # Quitar
+    {"text": "quita el pan", "type": "remove", "product": "Pan Francés"},
+    {"text": "quítale la coca cola", "type": "remove", "product": "Coca Cola 1L"},
+    {"text": "saca el atun", "type": "remove", "product": "Atún Florida Entero"},
+    {"text": "borra el detergente", "type": "remove", "product": "Detergente Ariel 1kg"},
+
+    # Cambiar precio
+    {"text": "precio del pan a 2 soles", "type": "change_price", "product": "Pan Francés", "new_price": 2.0},
+    {
+        "text": "cambia el precio de la leche a 4.50 soles",
+        "type": "change_price",
+        "product": "Leche Gloria Entera 1L",
+        "new_price": 4.5
+    },
+    {"text": "arroz a 4 soles", "type": "change_price", "product": "Arroz Costeño 1kg", "new_price": 4.0},
+
+    # Cambiar producto
+    {"text": "cambia la coca por inca kola", "type": "change_product", "old": "Coca Cola 1L", "new": "Inca Kola 1L"},
+    {
+        "text": "cambia el pan por una galleta",
+        "type": "change_product",
+        "old": "Pan Francés",
+        "new": "Galletas Soda Field 6pack"
+    },
+
+    # Comandos especiales
+    {"text": "cancelar", "type": "cancel"},
+    {"text": "listo", "type": "confirm"},
+    {"text": "dale", "type": "confirm"},
+    {"text": "total", "type": "confirm"},
+]
@@ -16,6 +16,9 @@ const ALERT_CONFIG = {
 let alertTimer = null;
 let lastSaleTime = Date.now();
 
+// Última lista de poco stock y su huella (el servidor no la reenvía si sigue igual)
+let lowStockCache = { tag: null, items: [] };
+
 async function fetchWithAuth(url, options = {}) {
     const token = localStorage.getItem('access_token');
     if (!token) {
@@ -57,9 +60,16 @@ async function checkAllAlerts() {
     console.log('[Alerts] 🔍 Verificando alertas...');
     
     try {
-        const response = await fetchWithAuth('/api/sales/stats/today');
+        const tag = lowStockCache.tag !== null ? `?low_stock_tag=${encodeURIComponent(lowStockCache.tag)}` : '';
+        const response = await fetchWithAuth(`/api/sales/stats/today${tag}`);
         const stats = await response.json();
         
+        if (stats.low_stock_unchanged) {
+            stats.low_stock = lowStockCache.items;
+        } else {
+            lowStockCache = { tag: stats.low_stock_tag, items: stats.low_stock || [] };
+        }
+        
         // 1. Pedido sin terminar
         if (window.cart && window.cart.length > 0) {
             const timeSinceLastInteraction = Date.now() - lastSaleTime;
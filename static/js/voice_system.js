@@ -18,6 +18,9 @@ const VoiceState = {
     isListening: false,
     cart: [],
     paymentMethod: 'efectivo',
+    pendingSale: null,                  // { key, body } de la venta por confirmar
+    ambiguousQuery: null,               // texto dictado de las opciones en pantalla
+    ambiguousAction: null,              // qué hacer con la opción elegida
     idleTimer: null,                    // ⬅️ AGREGAR
     lastActivityTime: Date.now(),       // ⬅️ AGREGAR
     voiceSettings: {
@@ -35,6 +38,8 @@ const IDLE_TIMEOUT = 180000; // 3 minutos
 // Configuración de rutas API (SIN duplicar /sales)
 const API_ROUTES = {
     parseCommand: '/api/sales/voice/parse',
+    voiceStream: '/api/voice/stream',     // WebSocket (con fallback a parseCommand)
+    learnedAlias: '/api/voice/aliases/learned',
     createSale: '/api/sales/',           // ✅ Ruta correcta
     voiceSettings: '/api/sales/voice/settings',
     todaySales: '/api/sales/today',
@@ -44,6 +49,120 @@ const API_ROUTES = {
 console.log('[VoiceSystem] Rutas configuradas:', API_ROUTES);
 
 
+// ========================================
+// SESIÓN DE VOZ POR WEBSOCKET
+// Autentica una vez y mantiene catálogo y carrito en el servidor;
+// si no hay conexión se usa el POST de siempre
+// ========================================
+const VoiceStream = {
+    socket: null,
+    ready: false,
+    seq: 0,
+    pending: new Map(),
+    retryDelay: 1000,
+    timeout: 5000,
+
+    connect() {
+        const token = localStorage.getItem('access_token');
+        if (!token || !('WebSocket' in window)) {
+            console.warn('[VoiceStream] Sin token o sin WebSocket, usando HTTP');
+            return;
+        }
+
+        // El token va en el primer mensaje, nunca en la URL
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${location.host}${API_ROUTES.voiceStream}`);
+
+        socket.onopen = () => {
+            socket.send(JSON.stringify({ type: 'auth', token: token }));
+        };
+
+        socket.onmessage = (event) => this.onMessage(JSON.parse(event.data));
+
+        socket.onclose = (event) => {
+            this.socket = null;
+            this.ready = false;
+            this.pending.forEach(request => request.reject(new Error('Conexión perdida')));
+            this.pending.clear();
+            if (event.code === 4401) {
+                // Token vencido o inválido: seguir por HTTP hasta volver a iniciar sesión
+                console.warn('[VoiceStream] ❌ No autenticado, usando HTTP');
+                return;
+            }
+            console.warn('[VoiceStream] Conexión cerrada, reintentando en', this.retryDelay, 'ms');
+            setTimeout(() => this.connect(), this.retryDelay);
+            this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+        };
+
+        this.socket = socket;
+    },
+
+    isOpen() {
+        return this.ready && this.socket !== null && this.socket.readyState === WebSocket.OPEN;
+    },
+
+    send(message) {
+        if (!this.isOpen()) return false;
+        this.socket.send(JSON.stringify(message));
+        return true;
+    },
+
+    sendPartial(text) {
+        this.send({ type: 'partial', seq: this.seq + 1, text: text });
+    },
+
+    // Transcripción final: resuelve con la misma respuesta que /voice/parse
+    request(text) {
+        return new Promise((resolve, reject) => {
+            const seq = ++this.seq;
+            this.pending.set(seq, { resolve, reject });
+
+            if (!this.send({ type: 'final', seq: seq, text: text })) {
+                this.pending.delete(seq);
+                reject(new Error('Sin conexión'));
+                return;
+            }
+
+            setTimeout(() => {
+                if (this.pending.has(seq)) {
+                    this.pending.delete(seq);
+                    reject(new Error('Tiempo de espera agotado'));
+                }
+            }, this.timeout);
+        });
+    },
+
+    syncCart() {
+        this.send({
+            type: 'cart',
+            items: VoiceState.cart.map(item => ({
+                product_id: item.product.id,
+                quantity: item.quantity
+            }))
+        });
+    },
+
+    onMessage(message) {
+        if (message.event === 'ready') {
+            console.log('[VoiceStream] ✅ Conectado');
+            this.ready = true;
+            this.retryDelay = 1000;
+            this.syncCart();
+        } else if (message.event === 'result') {
+            const request = this.pending.get(message.seq);
+            if (request) {
+                this.pending.delete(message.seq);
+                request.resolve(message.data);
+            }
+        } else if (message.event === 'partial') {
+            console.log('[VoiceStream] Parcial:', message.text, '→', message.data.type);
+        } else if (message.event === 'error') {
+            console.warn('[VoiceStream] Error:', message.detail);
+        }
+    }
+};
+
+
 // ========================================
 // INICIALIZACIÓN COMPLETA
 // ========================================
@@ -74,6 +193,8 @@ document.addEventListener('DOMContentLoaded', async function() {
     initSpeechRecognition();
     
     // 4. Inicializar otros componentes
+    VoiceStream.connect();
+    SaleOutbox.start();
     initPaymentButtons();
     await loadVoiceSettings();
     startIdleMonitor();
@@ -147,7 +268,7 @@ function initSpeechRecognition() {
     // Crear instancia como en Pedidos
     VoiceState.recognition = new SpeechRecognition();
     VoiceState.recognition.continuous = false;  // Como en Pedidos
-    VoiceState.recognition.interimResults = false;
+    VoiceState.recognition.interimResults = true;  // Parciales por WebSocket
     VoiceState.recognition.lang = 'es-PE';
     
     console.log('[Voice] Configuración:', {
@@ -158,7 +279,15 @@ function initSpeechRecognition() {
     
     // Event handlers - COPIADOS DE PEDIDOS
     VoiceState.recognition.onresult = function(event) {
-        const texto = event.results[0][0].transcript.trim();
+        const result = event.results[0];
+        const texto = result[0].transcript.trim();
+        
+        // Parcial: adelantar el parseo en el servidor, sin tocar el carrito
+        if (!result.isFinal) {
+            VoiceStream.sendPartial(texto);
+            return;
+        }
+        
         console.log('[Voice] 📝 Transcripción:', texto);
         showTranscript(texto);
         processCommand(texto);
@@ -276,16 +405,23 @@ async function processCommand(text) {
     console.log('[Voice] 🔄 Procesando:', text);
     
     try {
-        const response = await fetchWithAuth(API_ROUTES.parseCommand, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text: text })
-        });
+        let data = null;
+        
+        if (VoiceStream.isOpen()) {
+            try {
+                data = await VoiceStream.request(text);
+            } catch (error) {
+                console.warn('[VoiceStream] ⚠️ Reintentando por HTTP:', error.message);
+            }
+        }
+        
+        if (!data) {
+            data = await parseCommandHttp(text);
+        }
         
-        const data = await response.json();
         console.log('[Voice] 📦 Respuesta:', data);
         
-        if (!response.ok) {
+        if (data.type === 'error') {
             throw new Error(data.detail || 'Error al procesar comando');
         }
         
@@ -298,6 +434,22 @@ async function processCommand(text) {
     }
 }
 
+async function parseCommandHttp(text) {
+    const response = await fetchWithAuth(API_ROUTES.parseCommand, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ text: text })
+    });
+    
+    const data = await response.json();
+    
+    if (!response.ok) {
+        throw new Error(data.detail || 'Error al procesar comando');
+    }
+    
+    return data;
+}
+
 async function handleCommand(data) {
     const type = data.type;
     
@@ -336,15 +488,23 @@ async function handleCommand(data) {
             await handleAmbiguous(data);
             break;
         
+        case 'ambiguous_remove':
+        case 'ambiguous_price':
+        case 'ambiguous_change_old':
+        case 'ambiguous_change_new':
+            await handleAmbiguousCommand(data);
+            break;
+        
         default:
             console.warn('[Voice] Tipo de comando desconocido:', type);
     }
 }
 
 async function handleAmbiguous(data) {
-    console.log('[Voice] Productos ambiguos:', data.ambiguous_products);
+    const items = data.ambiguous_items || data.ambiguous_products;
+    console.log('[Voice] Productos ambiguos:', items);
     
-    const ambiguous = data.ambiguous_products[0];  // Por ahora solo el primero
+    const ambiguous = items[0];  // Por ahora solo el primero
     const query = ambiguous.query;
     const options = ambiguous.options;
     
@@ -362,7 +522,56 @@ async function handleAmbiguous(data) {
     // El usuario puede decir el número o el nombre completo
 }
 
-function showAmbiguousOptions(query, options) {
+// Quitar, cambiar precio o cambiar producto con varios candidatos: al
+// elegir se aplica el mismo comando con el producto elegido
+async function handleAmbiguousCommand(data) {
+    const actions = {
+        ambiguous_remove: {
+            query: data.product_query,
+            run: option => handleRemove({ product: option })
+        },
+        ambiguous_price: {
+            query: data.product_query,
+            run: option => changeCartPrice(option, data.new_price)
+        },
+        ambiguous_change_old: {
+            query: data.old_product_query,
+            run: option => processCommand(`cambia ${option.name} por ${data.new_product_query}`)
+        },
+        ambiguous_change_new: {
+            query: data.new_product_query,
+            run: option => handleProductChange({ old_product: data.old_product, new_product: option })
+        }
+    };
+    const action = actions[data.type];
+    
+    await speak(data.message);
+    showAmbiguousOptions(action.query, data.options, action.run);
+}
+
+async function changeCartPrice(product, newPrice) {
+    const item = VoiceState.cart.find(i => i.product.id === product.id);
+    
+    if (!item) {
+        await speak(`No encontré ${product.name} en el carrito`);
+        return;
+    }
+    
+    const oldPrice = item.product.price;
+    item.product.price = newPrice;
+    item.subtotal = item.quantity * newPrice;
+    
+    updateCartDisplay();
+    
+    const total = VoiceState.cart.reduce((sum, i) => sum + i.subtotal, 0);
+    await speak(`Precio de ${item.product.name} cambiado de ${formatPrice(oldPrice)} a ${formatPrice(newPrice)}. Nuevo total: ${formatPrice(total)}`);
+}
+
+// onSelect: qué hacer con la opción elegida (por defecto, agregarla al carrito)
+function showAmbiguousOptions(query, options, onSelect = null) {
+    VoiceState.ambiguousQuery = query;
+    VoiceState.ambiguousAction = onSelect;
+    
     // Crear modal con opciones
     const modal = document.createElement('div');
     modal.className = 'modal show';
@@ -410,6 +619,16 @@ window.selectAmbiguousOption = async function(index, productId, productName, pri
     // Cerrar modal
     closeAmbiguousModal();
     
+    // Recordar la elección para no volver a preguntar
+    learnAmbiguousChoice(VoiceState.ambiguousQuery, productId);
+    
+    const action = VoiceState.ambiguousAction;
+    VoiceState.ambiguousAction = null;
+    if (action) {
+        await action({ id: productId, name: productName, price: price });
+        return;
+    }
+    
     // Agregar al carrito
     const product = {
         id: productId,
@@ -430,6 +649,15 @@ window.selectAmbiguousOption = async function(index, productId, productName, pri
     playSound('success');
 };
 
+function learnAmbiguousChoice(query, productId) {
+    if (!query) return;
+    
+    fetchWithAuth(API_ROUTES.learnedAlias, {
+        method: 'POST',
+        body: JSON.stringify({ query: query, product_id: productId })
+    }).catch(error => console.warn('[Voice] No se pudo guardar la elección:', error));
+}
+
 
 // Agregar estilos CSS para las opciones ambiguas
 const ambiguousStyles = `
@@ -556,14 +784,7 @@ async function handlePriceChange(data) {
         return;
     }
     
-    const oldPrice = item.product.price;
-    item.product.price = newPrice;
-    item.subtotal = item.quantity * newPrice;
-    
-    updateCartDisplay();
-    
-    const total = VoiceState.cart.reduce((sum, i) => sum + i.subtotal, 0);
-    await speak(`Precio de ${item.product.name} cambiado de ${formatPrice(oldPrice)} a ${formatPrice(newPrice)}. Nuevo total: ${formatPrice(total)}`);
+    await changeCartPrice(item.product, newPrice);
 }
 
 async function handleProductChange(data) {
@@ -665,11 +886,24 @@ async function confirmSale() {
     
     try {
         // ✅ Ruta hardcoded para evitar duplicación
-        const response = await fetchWithAuth('/api/sales/', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(saleData)
-        });
+        const body = JSON.stringify(saleData);
+        const idempotencyKey = saleIdempotencyKey(body);
+        const total = VoiceState.cart.reduce((sum, i) => sum + i.subtotal, 0);
+        
+        let response;
+        try {
+            response = await postSaleWithRetry('/api/sales/', body, idempotencyKey);
+        } catch (networkError) {
+            // Sin conexión: la venta queda en el dispositivo y se sube al volver la red
+            console.warn('[Voice] 📴 Sin conexión, venta guardada offline:', networkError);
+            SaleOutbox.add(idempotencyKey, saleData);
+            VoiceState.pendingSale = null;
+            VoiceState.cart = [];
+            updateCartDisplay();
+            await speak(`Sin conexión. Venta por ${formatPrice(total)} guardada, se enviará al volver la red`);
+            playSound('confirm');
+            return;
+        }
         
         if (!response.ok) {
             const error = await response.json();
@@ -677,20 +911,14 @@ async function confirmSale() {
         }
         
         const result = await response.json();
+        VoiceState.pendingSale = null;
         console.log('[Voice] ✅ Venta guardada:', result);
         
-        const total = VoiceState.cart.reduce((sum, i) => sum + i.subtotal, 0);
-        
         // Limpiar carrito
         VoiceState.cart = [];
         updateCartDisplay();
         
-        // Actualizar UI
-        htmx.ajax('GET', '/api/sales/today/total/html', {target: '#daily-summary', swap: 'innerHTML'});
-        htmx.ajax('GET', '/api/sales/today/html', {target: '#sales-list', swap: 'innerHTML'});
-        
-        // Evento personalizado para actualizar otras partes
-        document.body.dispatchEvent(new CustomEvent('salesUpdated'));
+        refreshSalesViews();
         
         // Respuesta de voz
         await speak(`Venta confirmada por ${formatPrice(total)}. Siguiente cliente`);
@@ -703,6 +931,132 @@ async function confirmSale() {
     }
 }
 
+/**
+ * Idempotency-Key de la venta por confirmar: se reusa mientras el carrito
+ * no cambie, así un reintento (automático o del cajero) no la registra dos veces
+ */
+function saleIdempotencyKey(body) {
+    if (!VoiceState.pendingSale || VoiceState.pendingSale.body !== body) {
+        const key = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+        VoiceState.pendingSale = { key, body };
+    }
+    return VoiceState.pendingSale.key;
+}
+
+async function postSaleWithRetry(url, body, idempotencyKey, attempts = 3) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            return await fetchWithAuth(url, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Idempotency-Key': idempotencyKey
+                },
+                body
+            });
+        } catch (error) {
+            // Solo fallas de red: con la misma clave el servidor no duplica la venta
+            if (attempt >= attempts) throw error;
+            console.warn(`[Voice] Reintentando venta (${attempt}/${attempts - 1})...`);
+            await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+        }
+    }
+}
+
+function refreshSalesViews() {
+    htmx.ajax('GET', '/api/sales/today/total/html', {target: '#daily-summary', swap: 'innerHTML'});
+    htmx.ajax('GET', '/api/sales/today/html', {target: '#sales-list', swap: 'innerHTML'});
+    
+    // Evento personalizado para actualizar otras partes
+    document.body.dispatchEvent(new CustomEvent('salesUpdated'));
+}
+
+/**
+ * VENTAS OFFLINE
+ * Las ventas que no llegaron al servidor se guardan en localStorage y se
+ * suben por lotes a /api/sales/sync al volver la red (evento online, al
+ * abrir la página y cada minuto). Cada una lleva su Idempotency-Key como
+ * client_id, así que reenviarla nunca la duplica.
+ */
+const SaleOutbox = {
+    storageKey: 'quevendi_sales_outbox',
+    batchSize: 200,
+    interval: 60000,
+    syncing: false,
+
+    load() {
+        try {
+            return JSON.parse(localStorage.getItem(this.storageKey)) || [];
+        } catch (error) {
+            return [];
+        }
+    },
+
+    save(sales) {
+        localStorage.setItem(this.storageKey, JSON.stringify(sales));
+    },
+
+    add(clientId, saleData) {
+        const sales = this.load();
+        if (!sales.some(sale => sale.client_id === clientId)) {
+            sales.push({ client_id: clientId, created_at: new Date().toISOString(), ...saleData });
+            this.save(sales);
+        }
+        console.log(`[Outbox] 📥 ${sales.length} venta(s) por sincronizar`);
+    },
+
+    start() {
+        window.addEventListener('online', () => this.flush());
+        setInterval(() => this.flush(), this.interval);
+        this.flush();
+    },
+
+    async flush() {
+        if (this.syncing || !navigator.onLine || this.load().length === 0) return;
+        this.syncing = true;
+        let created = 0;
+        let rejected = 0;
+        try {
+            let batch;
+            while ((batch = this.load().slice(0, this.batchSize)).length > 0) {
+                const response = await fetchWithAuth('/api/sales/sync', {
+                    method: 'POST',
+                    body: JSON.stringify({ sales: batch })
+                });
+                if (!response || !response.ok) {
+                    console.warn('[Outbox] ⚠️ Sincronización rechazada:', response && response.status);
+                    break;
+                }
+                
+                const result = await response.json();
+                result.results
+                    .filter(r => r.status === 'conflict')
+                    .forEach(r => console.error(`[Outbox] ❌ Venta ${r.client_id}: ${r.detail}`));
+                created += result.created;
+                rejected += result.conflict;
+                
+                // Todas las reportadas salen de la cola (las de conflicto no se arreglan reintentando)
+                const done = new Set(result.results.map(r => r.client_id));
+                this.save(this.load().filter(sale => !done.has(sale.client_id)));
+            }
+        } catch (error) {
+            console.warn('[Outbox] 📴 Sin conexión, se reintentará:', error);
+        } finally {
+            this.syncing = false;
+        }
+        
+        if (created > 0) {
+            console.log(`[Outbox] ✅ ${created} venta(s) offline sincronizadas`);
+            refreshSalesViews();
+        }
+        if (rejected > 0) {
+            showError(`${rejected} venta(s) offline no se pudieron registrar`);
+        }
+    }
+};
+
 /**
  * TEXT-TO-SPEECH (VOZ DEL SISTEMA)
  */
@@ -790,6 +1144,8 @@ function playAudioBase64(base64Audio) {
  * INTERFAZ DE USUARIO
  */
 function updateCartDisplay() {
+    VoiceStream.syncCart();
+    
     const cartContainer = document.getElementById('cart-display');
     if (!cartContainer) return;
     